@@ -14,34 +14,48 @@ Main module to initialize the Tornado Server and endpoints
 
 import ConfigParser
 import sys, traceback, re
+import signal
+import time
 import tornado.web
 #import logging
 
+from tornado import gen
 from tornado.options import parse_command_line, options, define
 from tornado.log import LogFormatter, logging
 from tornado.httpserver import HTTPServer
-from tornado.ioloop import IOLoop
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.netutil import bind_sockets
 
+from dbod.api import cache, client, metadata, metrics, rundeck
 from dbod.api.base import DocHandler
-from dbod.api.rundeck import RundeckResources, RundeckJobs
-from dbod.api.metadata import Metadata
-from dbod.api.functionalalias import FunctionalAlias
-from dbod.api.hostaliases import HostAliases
+from dbod.api.rundeck import RundeckResources, RundeckJobs, resources
+from dbod.api.metadata import Metadata, snapshot, views
+from dbod.api.functionalalias import FunctionalAlias, FunctionalAliasPool, pool
+from dbod.api.hostaliases import HostAliases, host_aliases
 from dbod.api.host import Host
 from dbod.api.instance import Instance
 from dbod.api.attribute import Attribute
 from dbod.api.fim import Fim
-from dbod.config import config, optionalConfig
+from dbod.api.metrics import Metrics, log_request
+from dbod.api.tracing import Tracer
+from dbod.api.process import fork_processes
+from dbod.config import config, optionalConfig, get_option
+import dbod.config
 
 # This list is a global object because in needs to be accessed
 # from the test suites
 handlers = [
     (r"/", DocHandler),
+    (r"/api/v1/instance/attribute/?", Attribute),
+    (r"/api/v1/instance/alias/?", FunctionalAlias),
     (r"/api/v1/instance/(?P<instance>[^\/]+)/attribute/?(?P<attribute>[^\/]+)?", Attribute),
+    (r"/api/v1/instance/?", Instance),
     (r"/api/v1/instance/([^/]+)", Instance),
+    (r"/api/v1/host/aliases/?", HostAliases),
     (r"/api/v1/host/aliases/([^/]+)", HostAliases),
     (r"/api/v1/host/names/([^/]+)", Host),
     (r"/api/v1/instance/alias/?(?P<db_name>[^\/]+)?", FunctionalAlias),
+    (r"/api/v1/alias/pool/?", FunctionalAliasPool),
     (r"/api/v1/(?P<class>[^\/]+)/(?P<name>[^\/]+)/metadata", Metadata),
     (r"/api/v1/host/aliases/([^/]+)", HostAliases),
     (r"/api/v1/rundeck/resources.xml", RundeckResources),
@@ -49,8 +63,13 @@ handlers = [
     # Deprecated, will be deleted in following versions
     (r"/api/v1/metadata/(?P<class>[^\/]+)/?(?P<name>[^\/]+)?", Metadata),  
     (r"/api/v1/fim/([^/]+)", Fim),
+    (r"/metrics", Metrics),
     ]
 
+# Seconds after a stop signal during which a repeated one is ignored instead
+# of stopping the server without waiting for the requests in progress
+STOP_GRACE = 1
+
 class Application():
     """
     This is the main entrypoint of the dbod-api where the main parameters are
@@ -104,28 +123,181 @@ class Application():
                 logging.info('Overriding log format for %s' % (logger))
                 logger.setFormatter(formatter)
 
+        if not client.CURL:
+            logging.warning("pycurl is not installed, the connections to the upstreams are not reused")
+
+        # Binding the listening sockets and forking the worker processes,
+        # which share them. No IOLoop can be created before this point
+        sockets = bind_sockets(int(options.port))
+        processes = get_option('server', 'processes', 1)
+        task_id = None
+        if processes != 1:
+            task_id = fork_processes(processes)
+            logging.info("Started worker process %s" % task_id)
+
+        # The workers read the configuration file again, as a restarted one
+        # may be started after the file has been reloaded
+        if task_id is not None and dbod.config.reload():
+            self.__configure()
+
+        # Stopping the server gracefully and reloading the configuration
+        self.stopping = None
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self.__stop)
+        signal.signal(signal.SIGHUP, self.__hup)
+
+        # Loading the metadata snapshot. With several processes only the
+        # first one writes the snapshot file
+        if snapshot.path:
+            snapshot.load()
+            snapshot.readonly = task_id not in (None, 0)
+
+        # Scheduling the refresh of the cached data
+        self.callbacks = []
+        self.__schedule()
+
         # Defining handlers
         # Removing optional handlers from handler list 
         filtered_handlers = self.__handler_filter(handlers, config, optionalConfig)
         logging.info("Defining application (url, handler) pairs")
         application = tornado.web.Application(filtered_handlers, 
-                            debug = config.getboolean('tornado', 'debug'))
+                            debug = config.getboolean('tornado', 'debug'),
+                            autoreload = config.getboolean('tornado', 'debug') and processes == 1,
+                            log_function = log_request)
         
         # Configuring server and SSL
         logging.info("Configuring HTTP server")
+        self.tracer = Tracer(application)
+        ssl_options = None
         if (config.has_section('ssl')):
-            http_server = HTTPServer(application,
-                    ssl_options = {
-                        "certfile" : config.get('ssl', 'hostcert') ,
-                        "keyfile" : config.get('ssl', 'hostkey'),
-                        })
+            ssl_options = {
+                "certfile" : config.get('ssl', 'hostcert') ,
+                "keyfile" : config.get('ssl', 'hostkey'),
+                }
         else:
-            http_server = HTTPServer(application)
             logging.info("Host certificate undefined, SSL is DISABLED")
+        self.http_server = HTTPServer(self.tracer, ssl_options = ssl_options)
             
         # Listening port
-        http_server.listen(options.port)
+        self.http_server.add_sockets(sockets)
+
+        # With several processes any of them serves the /metrics requests of
+        # the server port, so every process also serves its own metrics in a
+        # port of its own
+        metrics_port = get_option('server', 'metrics_port', 0)
+        if metrics_port:
+            metrics_port += task_id or 0
+            logging.info("Serving the metrics of the process on port: " + str(metrics_port))
+            metrics_server = HTTPServer(tornado.web.Application([(r"/metrics", Metrics)],
+                                log_function = log_request),
+                            ssl_options = ssl_options)
+            metrics_server.add_sockets(bind_sockets(metrics_port))
         
         # Starting
         logging.info("Starting application on port: " + str(port))
         tornado.ioloop.IOLoop.instance().start()
+
+    def __schedule(self):
+        """
+        Schedules the periodic refresh of the metadata snapshot, the cached
+        Rundeck resources.xml, the status of the functional aliases pool, the
+        aliases of the hosts and the materialized metadata views, with the
+        intervals of the *[cache]* section. The previous schedule, if any, is
+        cancelled.
+        """
+        for callback in self.callbacks:
+            callback.stop()
+        self.callbacks = []
+
+        interval = get_option('cache', 'snapshot_interval', 300)
+        if snapshot.path and interval > 0:
+            logging.info("Refreshing metadata snapshot every %s seconds" % interval)
+            self.__periodic(snapshot.refresh, interval)
+
+        if resources.interval > 0:
+            logging.info("Regenerating resources.xml every %s seconds" % resources.interval)
+            self.__periodic(resources.refresh, resources.interval)
+
+        if get_option('postgrest', 'alias_pool_url') and pool.interval > 0:
+            logging.info("Refreshing functional aliases pool every %s seconds" % pool.interval)
+            self.__periodic(pool.refresh, pool.interval)
+
+        if host_aliases.interval > 0:
+            logging.info("Refreshing host aliases every %s seconds" % host_aliases.interval)
+            self.__periodic(host_aliases.refresh, host_aliases.interval)
+
+        interval = get_option('cache', 'views_interval', 15)
+        if views.url and interval > 0:
+            logging.info("Refreshing materialized views every %s seconds" % interval)
+            self.__periodic(views.refresh, interval)
+
+    def __periodic(self, function, interval):
+        """Calls *function* now and then every *interval* seconds"""
+        IOLoop.current().add_callback(function)
+        callback = PeriodicCallback(function, interval * 1000)
+        callback.start()
+        self.callbacks.append(callback)
+
+    def __configure(self):
+        """
+        Applies the configuration to the modules which keep settings read
+        from it (caches, upstream clients, etc.) and to the logging level
+        """
+        for module in (cache, client, metadata, metrics, rundeck):
+            module.configure()
+        logging.getLogger().setLevel(getattr(logging, config.get('logging', 'level').upper()))
+
+    def __hup(self, signum, frame):
+        """
+        Reloads the configuration file when a *SIGHUP* signal is received.
+        With several processes, the parent process forwards the signal to
+        the workers
+        """
+        logging.info("Received signal %s, reloading configuration" % signum)
+        IOLoop.current().add_callback_from_signal(self.__reload)
+
+    def __reload(self):
+        """
+        Reads the configuration file again and applies it without stopping
+        the server. The URLs of the upstreams, the credentials, the cache and
+        logging settings and the refresh intervals are updated. The port, the
+        number of processes, the SSL settings and the active endpoints
+        require a restart.
+        """
+        if dbod.config.reload():
+            self.__configure()
+            self.__schedule()
+
+    def __stop(self, signum, frame):
+        """
+        Stops the server when a *SIGTERM* or *SIGINT* signal is received. With
+        several processes, the parent process forwards the signal to the
+        workers. A second signal stops it without waiting for the requests in
+        progress, unless it arrives less than *STOP_GRACE* seconds after the
+        first one: the workers receive the same signal twice when it is sent
+        to the whole process group (Ctrl-C, systemd) and forwarded by the
+        parent
+        """
+        logging.info("Received signal %s, stopping" % signum)
+        if self.stopping is None:
+            self.stopping = time.time()
+            IOLoop.current().add_callback_from_signal(self.__shutdown)
+        elif time.time() - self.stopping >= STOP_GRACE:
+            IOLoop.current().add_callback_from_signal(IOLoop.current().stop)
+
+    @gen.coroutine
+    def __shutdown(self):
+        """
+        Stops listening and waits for the requests in progress to finish, up
+        to the *shutdown_timeout* option of the *[server]* section (in
+        seconds), before stopping the IOLoop
+        """
+        self.http_server.stop()
+        for callback in self.callbacks:
+            callback.stop()
+        deadline = time.time() + get_option('server', 'shutdown_timeout', 60)
+        while self.tracer.active and time.time() < deadline:
+            yield gen.sleep(0.1)
+        if self.tracer.active:
+            logging.warning("Stopping with %s requests in progress" % self.tracer.active)
+        IOLoop.current().stop()
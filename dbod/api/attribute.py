@@ -14,17 +14,23 @@ REST API Server for the DB On Demand System
 
 import tornado.web
 import logging
-import requests
 import json
 import urllib
 
+from tornado import gen
+
+from dbod.api import client
 from dbod.api.base import *
+from dbod.api.cache import metadata_cache
+from dbod.api.metadata import views
+from dbod.api.rundeck import resources
 from dbod.config import config
 
 class Attribute(tornado.web.RequestHandler):
 
     """
-    This is the handler of **/instance/<database name>/attribute/<attribute name>** endpoint.
+    This is the handler of **/instance/<database name>/attribute/<attribute name>**
+    and **/instance/attribute** endpoints.
 
     Things that are given for the development of this endpoint:
 
@@ -51,7 +57,7 @@ class Attribute(tornado.web.RequestHandler):
 
     * :func:`get`
     * :func:`post` - (creation/addition of attributes)
-    * :func:`put` - (update of existing attributes)
+    * :func:`put` - (update of existing attributes or, in **/instance/attribute**, bulk update of attributes of many instances)
     * :func:`delete` - (deletion of attributes)
     
     .. note::
@@ -63,7 +69,12 @@ class Attribute(tornado.web.RequestHandler):
 
     """
 
+    def prepare(self):
+        """Only the *PUT* method is allowed without a database name"""
+        if not self.path_kwargs.get('instance') and self.request.method != 'PUT':
+            raise tornado.web.HTTPError(405)
 
+    @gen.coroutine
     def get(self, **args):
         """
         The *GET* method returns an attribute value from a certain *instance*.
@@ -83,34 +94,52 @@ class Attribute(tornado.web.RequestHandler):
         """
         instance_n = args.get('instance')
         attribute_n = args.get('attribute')
-        entid = get_instance_id_by_name(instance_n)
-        if entid:
+        entid = yield get_instance_id_by_name(instance_n)
+        if not entid:
+            logging.error("Instance not found: " + instance_n)
+            raise tornado.web.HTTPError(NOT_FOUND)
+        data = yield self.__get_attributes__(entid, attribute_n)
+        if data is None:
+            # The cached id is outdated if the instance has been renamed or
+            # deleted by another process, so it is looked up again
+            newid = yield get_instance_id_by_name(instance_n, cached=False)
+            if newid and newid != entid:
+                data = yield self.__get_attributes__(newid, attribute_n)
+            elif not newid:
+                logging.error("Instance not found: " + instance_n)
+                raise tornado.web.HTTPError(NOT_FOUND)
+        if data is None:
             if attribute_n:
-                response = requests.get(config.get('postgrest', 'attribute_url') + "?select=value&instance_id=eq." + str(entid) + "&name=eq." + attribute_n)
-                if response.ok:
-                    data = response.json()
-                    if data:
-                        self.write(data[0]["value"])
-                        self.set_status(OK)
-                    else:
-                        logging.error("Attribute '" + attribute_n + "' not found for instance: " + instance_n)
-                        raise tornado.web.HTTPError(NOT_FOUND)
+                logging.error("Attribute '" + attribute_n + "' not found for instance: " + instance_n)
             else:
-                filter = json.loads('{"inst_id": ' + str(entid) + '}')
-                response = requests.post(config.get('postgrest', 'get_attributes_url'), json=filter)
-                if response.ok:
-                    data = response.json()
-                    if data:
-                        self.write(data[0]["get_attributes"])
-                        self.set_status(OK)
-                    else:
-                        logging.error("Attributes not found for instance: " + instance_n)
-                        raise tornado.web.HTTPError(NOT_FOUND)
-        else:
-            logging.error("Instance not found: " + instance_n)
+                logging.error("Attributes not found for instance: " + instance_n)
             raise tornado.web.HTTPError(NOT_FOUND)
+        self.write(data)
+        self.set_status(OK)
+
+    @gen.coroutine
+    def __get_attributes__(self, entid, attribute_n):
+        """
+        This is a private function which is used by :func:`get` to read the
+        value of the attribute *attribute_n* of the instance with id *entid*,
+        or all its attributes if it is not given. It returns *None* if they
+        are not found.
+        """
+        if attribute_n:
+            response = yield client.get(config.get('postgrest', 'attribute_url') + "?select=value&instance_id=eq." + str(entid) + "&name=eq." + attribute_n)
+            field = "value"
+        else:
+            filter = json.loads('{"inst_id": ' + str(entid) + '}')
+            response = yield client.post(config.get('postgrest', 'get_attributes_url'), json=filter)
+            field = "get_attributes"
+        if not response.ok:
+            logging.error("Error fetching attributes: " + response.text)
+            raise tornado.web.HTTPError(response.status_code)
+        data = response.json()
+        raise gen.Return(data[0][field] if data else None)
 
     @http_basic_auth
+    @gen.coroutine
     def post(self, **args):
         """
         The *POST* method inserts a new attribute into the database for the specified instance.
@@ -141,7 +170,7 @@ class Attribute(tornado.web.RequestHandler):
             
         attributes = json.loads(self.request.body)
         instance_n = args.get('instance')
-        entid = get_instance_id_by_name(instance_n)
+        entid = yield get_instance_id_by_name(instance_n, cached=False)
         if attributes:
             if entid:
                 insert_attributes = []
@@ -150,8 +179,9 @@ class Attribute(tornado.web.RequestHandler):
                     logging.debug("Inserting attribute: " + json.dumps(insert_attr))
                     insert_attributes.append(insert_attr)
                 
-                response = requests.post(config.get('postgrest', 'attribute_url'), json=insert_attributes)
+                response = yield client.post(config.get('postgrest', 'attribute_url'), json=insert_attributes)
                 if response.ok:
+                    views.invalidate()
                     self.set_status(CREATED)
                 else:
                     logging.error("Error inserting attributes: " + response.text)
@@ -164,11 +194,15 @@ class Attribute(tornado.web.RequestHandler):
             raise tornado.web.HTTPError(BAD_REQUEST)
             
     @http_basic_auth
+    @gen.coroutine
     def put(self, **args):
         """
         The *PUT* method updates an attribute into the database wih all the information that is needed.
         The name of the instance and the attribute are set in the URL. The new value of the attribute must be sent in the *request body*.
 
+        Without a database name, it sets in a single transaction a list of
+        attributes of any number of instances (see :func:`__put_attributes__`).
+
         :param instance: the database name which is given in the url
         :type instance: str
         :param attribute: the attribute name which is given in the url
@@ -180,24 +214,29 @@ class Attribute(tornado.web.RequestHandler):
         if not self.request.body:
             logging.error("The request contains no valid data")
             raise tornado.web.HTTPError(BAD_REQUEST)
+        if not args.get('instance'):
+            yield self.__put_attributes__()
+            return
             
         new_value = self.request.body
         instance_n = args.get('instance')
         attribute_n = args.get('attribute')
-        entid = get_instance_id_by_name(instance_n)
+        entid = yield get_instance_id_by_name(instance_n, cached=False)
         if not entid:
             logging.error("Instance '" + instance_n + "' doest not exist.")
             raise tornado.web.HTTPError(NOT_FOUND)
             
         body = json.loads('{"value":"' + new_value + '"}')
-        response = requests.patch(config.get('postgrest', 'attribute_url') + "?instance_id=eq." + str(entid) + "&name=eq." + attribute_n, json=body)
+        response = yield client.patch(config.get('postgrest', 'attribute_url') + "?instance_id=eq." + str(entid) + "&name=eq." + attribute_n, json=body)
         if response.ok:
+            views.invalidate()
             self.set_status(NO_CONTENT)
         else:
             logging.error("Error editing the attribute: " + response.text)
             raise tornado.web.HTTPError(response.status_code)
 
     @http_basic_auth
+    @gen.coroutine
     def delete(self, **args):
         """
         The *DELETE* method deletes an attribute by *instance name* and *attribute name*.
@@ -219,11 +258,50 @@ class Attribute(tornado.web.RequestHandler):
             logging.error("No attribute specified")
             raise tornado.web.HTTPError(BAD_REQUEST)
         
-        entid = get_instance_id_by_name(instance_n)
+        entid = yield get_instance_id_by_name(instance_n, cached=False)
         if entid:
-            response = requests.delete(config.get('postgrest', 'attribute_url') + "?instance_id=eq." + str(entid) + "&name=eq." + attribute_n)
+            response = yield client.delete(config.get('postgrest', 'attribute_url') + "?instance_id=eq." + str(entid) + "&name=eq." + attribute_n)
+            views.invalidate()
             self.set_status(response.status_code)
         else:
             logging.error("Instance not found: " + instance_n)
             raise tornado.web.HTTPError(NOT_FOUND)
             
+
+    @gen.coroutine
+    def __put_attributes__(self):
+        """
+        This is a private function which is used by :func:`put` to set the
+        attributes of many instances. The *request body* is a list of objects
+        with the *instance*, *name* and *value* of every attribute.
+
+        The attributes are created if they do not exist and updated otherwise,
+        by the *set_attributes* function of the database. The response
+        includes the list of attributes with the status of each one: *201* if
+        it has been created, *200* if it has been updated, *400* if the name
+        or the value are missing or too long and *404* if the instance does
+        not exist.
+        """
+        try:
+            attributes = json.loads(self.request.body)
+        except ValueError:
+            attributes = None
+        if not isinstance(attributes, list) or not attributes:
+            logging.error("The request contains no valid data")
+            raise tornado.web.HTTPError(BAD_REQUEST)
+        response = yield client.post(config.get('postgrest', 'set_attributes_url'), json={'attributes': attributes})
+        if response.ok:
+            views.invalidate()
+            self.write({'response' : response.json()[0]["set_attributes"]})
+        else:
+            logging.error("Error setting the attributes: " + response.text)
+            raise tornado.web.HTTPError(response.status_code)
+
+    def on_finish(self):
+        """
+        Invalidates the cached metadata and resources.xml after any request
+        which may have modified an instance.
+        """
+        if self.request.method != 'GET':
+            metadata_cache.invalidate()
+            resources.invalidate()
@@ -16,19 +16,24 @@ import tornado.web
 import base64
 import functools
 import logging
-import requests
 import json
 import urllib
 
+from tornado import gen
+
+from dbod.api import client
+from dbod.api.cache import instance_id_cache
 from dbod.config import config
 
 # HTTP API status codes
 OK = 200
 CREATED = 201 # Request fulfilled resulting in creation of new resource
 NO_CONTENT = 204 # Succesfull delete
+NOT_MODIFIED = 304
 NOT_FOUND = 404
 UNAUTHORIZED = 401
 BAD_REQUEST = 400
+CONFLICT = 409 # Resource already exists
 BAD_GATEWAY = 502
 SERVICE_UNAVAILABLE = 503
 
@@ -75,14 +80,30 @@ def http_basic_auth(fun):
 
     return wrapper
     
-def get_instance_id_by_name(name):
-    """Common function to get the ID of an instance by its name."""
-    response = requests.get(config.get('postgrest', 'instance_url') + "?db_name=eq." + name)
+@gen.coroutine
+def get_instance_id_by_name(name, cached=True):
+    """
+    Common function to get the ID of an instance by its name. It returns
+    *None* if the instance does not exist or in case of internal error.
+
+    The ids found are kept in a cache (see the *[cache]* section of the
+    configuration file), which has to be invalidated when an instance is
+    created, renamed or deleted. Every process has its own cache, so an id
+    may be outdated if the instance has been renamed or deleted by another
+    one: the writes look it up again with *cached* set to *False*, and the
+    reads which find nothing for a cached id retry with it.
+    """
+    if cached:
+        entid = instance_id_cache.get(name)
+        if entid is not None:
+            raise gen.Return(entid)
+    response = yield client.get(config.get('postgrest', 'instance_url') + "?db_name=eq." + name)
     if response.ok:
         data = response.json()
         if data:
-            return data[0]["id"]
-    return None
+            instance_id_cache.set(name, data[0]["id"])
+            raise gen.Return(data[0]["id"])
+    raise gen.Return(None)
     
 class DocHandler(tornado.web.RequestHandler):
     """Shows the list of endpoints available in the API"""
@@ -90,11 +111,18 @@ class DocHandler(tornado.web.RequestHandler):
         logging.info("Generating API endpoints doc")
         response = """Please use :
             <p>http://hostname:port/api/v1/instance/NAME</p>
+            <p>http://hostname:port/api/v1/instance?names=NAME1,NAME2</p>
+            <p>http://hostname:port/api/v1/instance?db_type=TYPE&class=CLASS&state=STATE&host=HOSTNAME&limit=LIMIT&cursor=CURSOR</p>
             <p>http://hostname:port/api/v1/instance/alias/NAME</p>
+            <p>http://hostname:port/api/v1/instance/alias?dns_name=DNSNAME</p>
+            <p>http://hostname:port/api/v1/instance/alias?alias=ALIAS</p>
+            <p>http://hostname:port/api/v1/alias/pool</p>
             <p>http://hostname:port/api/v1/host/aliases/HOSTNAME</p>
+            <p>http://hostname:port/api/v1/host/aliases</p>
             <p>http://hostname:port/api/v1/metadata/instance/NAME</p>
             <p>http://hostname:port/api/v1/metadata/host/HOSTNAME</p>
             <p>http://hostname:port/api/v1/rundeck/resources.xml</p>
-            <p>http://hostname:port/api/v1/rundeck/job/JOB/NODE</p>"""
+            <p>http://hostname:port/api/v1/rundeck/job/JOB/NODE</p>
+            <p>http://hostname:port/metrics</p>"""
         self.set_header("Content-Type", 'text/html')
         self.write(response)
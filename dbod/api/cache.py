@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015, CERN
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file "LICENSE".
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Cache module, with the in-memory caches used by the endpoints to avoid a
+PostgREST round trip on every request.
+"""
+
+import collections
+import logging
+import time
+import tornado.web
+
+from tornado import gen
+
+from dbod.config import get_option
+
+class Cache(object):
+    """
+    Bounded in-memory cache. Every entry expires *ttl* seconds after being
+    stored and, when the cache is full, the least recently used entry is
+    evicted. A *size* of 0 disables the cache.
+
+    The number of hits and misses is kept in the *hits* and *misses* counters.
+    """
+
+    def __init__(self, name, size, ttl):
+        self.name = name
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        """
+        Returns the value stored for *key* or *None* if it is not cached or
+        it has expired.
+        """
+        entry = self._entries.pop(key, None)
+        if entry:
+            value, expiration = entry
+            if expiration > time.time():
+                # Reinsert the entry to mark it as the most recently used
+                self._entries[key] = entry
+                self.hits += 1
+                logging.debug("Cache hit in %s: %s", self.name, key)
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        """Stores *value* for *key*, evicting the oldest entries if needed"""
+        if self.size <= 0:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = (value, time.time() + self.ttl)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Removes the entry for *key* or all the entries if it is not given"""
+        if key is None:
+            logging.debug("Invalidating %s", self.name)
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def resize(self, size, ttl):
+        """
+        Changes the *size* and the *ttl* of the cache, evicting the least
+        recently used entries which do not fit. The entries already stored
+        keep their expiration time.
+        """
+        self.size = size
+        self.ttl = ttl
+        if size <= 0:
+            self._entries.clear()
+        while len(self._entries) > max(size, 0):
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+class PeriodicCache(object):
+    """
+    Base class of the data which is read as a whole and refreshed in
+    background every *interval* seconds, instead of being requested for
+    every request.
+
+    Subclasses implement :func:`load`. Only one load runs at a time: calling
+    :func:`refresh` meanwhile returns the same Future. If the data is
+    invalidated while it is being loaded, it is loaded again, as it may not
+    include the last changes. If it cannot be loaded, the previous data is
+    kept and the error is stored in *error*. The data is then not expired
+    for *RETRY_DELAY* seconds (or *interval*, if it is shorter), so the
+    requests do not wait for the upstream again and again while it is down.
+    """
+
+    interval = 0
+    RETRY_DELAY = 5
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Discards the state of the cache"""
+        self.timestamp = 0
+        self.failed = 0
+        self.error = None
+        self._refreshing = None
+        self._outdated = False
+
+    def expired(self):
+        """True if the data has to be loaded again before serving it"""
+        now = time.time()
+        return (now - self.timestamp >= self.interval and
+                now - self.failed >= min(self.interval, self.RETRY_DELAY))
+
+    def invalidate(self):
+        """Marks the data as outdated, after a change of its source"""
+        self.timestamp = 0
+        if self._refreshing is not None and not self._refreshing.done():
+            self._outdated = True
+
+    def refresh(self):
+        """
+        Loads the data, if it is not already being loaded, and returns a
+        Future resolved when it is done
+        """
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = self.__refresh__()
+        return self._refreshing
+
+    @gen.coroutine
+    def __refresh__(self):
+        """Loads the data until it is up to date"""
+        while True:
+            self._outdated = False
+            try:
+                yield self.load()
+            except tornado.web.HTTPError as e:
+                self.error = e
+                self.failed = time.time()
+                break
+            self.error = None
+            self.failed = 0
+            self.timestamp = time.time()
+            if not self._outdated:
+                break
+
+    @gen.coroutine
+    def load(self):
+        """
+        Reads the data
+
+        :raises: HTTPError - when the data cannot be read
+        """
+        raise NotImplementedError()
+
+# Default size and ttl of every cache, overridden by the *[cache]* section
+DEFAULTS = {
+    'metadata': (2000, 60),
+    'instance_id': (5000, 300),
+    }
+
+# Metadata of instances and hosts, keyed by (class, name)
+metadata_cache = Cache('metadata', *DEFAULTS['metadata'])
+
+# Instance ids, keyed by database name
+instance_id_cache = Cache('instance_id', *DEFAULTS['instance_id'])
+
+def configure():
+    """
+    Applies the *<name>_size* and *<name>_ttl* options of the *[cache]*
+    section to every cache. It is called again when the configuration file
+    is reloaded.
+    """
+    for cache in (metadata_cache, instance_id_cache):
+        size, ttl = DEFAULTS[cache.name]
+        cache.resize(get_option('cache', cache.name + '_size', size),
+                get_option('cache', cache.name + '_ttl', ttl))
+
+configure()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015, CERN
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file "LICENSE".
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Non-blocking HTTP client module used by the endpoints to query PostgREST
+and Rundeck.
+
+Every upstream gets its own pool of connections, configured in its section of
+the configuration file:
+
+* *pool_size* - maximum number of simultaneous requests to the upstream. The
+  requests over this limit are queued instead of opening new connections
+* *connect_timeout* and *request_timeout* - timeouts in seconds
+
+If `pycurl <http://pycurl.io/>`_ is installed, libcurl is used and the
+connections (and TLS sessions) are kept alive and reused between requests.
+Otherwise a warning is logged when the server starts, as every request opens
+a new connection.
+"""
+
+import json
+import logging
+import re
+import time
+import urllib
+
+from tornado import gen
+from tornado.escape import json_decode, json_encode
+from tornado.httpclient import HTTPRequest
+from tornado.ioloop import IOLoop
+from tornado.simple_httpclient import SimpleAsyncHTTPClient
+
+from dbod.api import metrics, tracing
+from dbod.config import get_option
+
+try:
+    from tornado.curl_httpclient import CurlAsyncHTTPClient as HTTPClient
+    CURL = True
+except ImportError:
+    HTTPClient = SimpleAsyncHTTPClient
+    CURL = False
+
+# Characters left untouched when quoting an URL. It is the same set used by
+# the requests library, so the composed URLs reach PostgREST as they did
+# before (e.g. the '{', '}' in the array filters of the metadata endpoint)
+SAFE_CHARS = "!#$%&'()*+,/:;=?@[]~"
+
+# Tornado reports connection errors and timeouts with this internal code
+CONNECTION_ERROR = 599
+
+# Upstream used when none is given, and its default settings
+POSTGREST = 'postgrest'
+RUNDECK = 'rundeck'
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_REQUEST_TIMEOUT = 30.0
+
+# HTTP client of each upstream, created on first use
+_clients = {}
+
+class Response(object):
+    """
+    Response of an upstream request. It exposes the same attributes the
+    handlers were using from the *requests* library responses: *ok*,
+    *status_code*, *text* and *json()*.
+
+    Connection errors and timeouts are reported as *502 Bad Gateway*, as
+    Tornado's internal *599* code is not a valid HTTP status to propagate.
+    """
+
+    def __init__(self, response):
+        self.status_code = response.code
+        if self.status_code == CONNECTION_ERROR:
+            logging.error("Error connecting to %s: %s", response.effective_url,
+                    response.error)
+            self.status_code = 502
+        self.headers = response.headers
+        self.text = response.body or ''
+        self.error = response.error
+
+    @property
+    def ok(self):
+        """True if the status code is lower than 400"""
+        return self.status_code < 400
+
+    def json(self):
+        """Returns the decoded JSON body of the response"""
+        return json_decode(self.text)
+
+class JSONStream(object):
+    """
+    Incremental decoder of a JSON array of objects, as returned by PostgREST.
+    It is fed with the chunks of a response as they are received (see the
+    *streaming_callback* argument of :class:`tornado.httpclient.HTTPRequest`)
+    and returns every object as soon as it is complete, so the whole response
+    never has to be held in memory.
+    """
+
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r'\s*')
+
+    def __init__(self):
+        self._buffer = ''
+        self._started = False
+        self._ended = False
+
+    def feed(self, chunk):
+        """Returns the list of objects completed by *chunk*"""
+        buf = self._buffer + chunk
+        elements = []
+        position = 0
+        while True:
+            position = self.whitespace.match(buf, position).end()
+            if position == len(buf):
+                break
+            if not self._started:
+                if buf[position] != '[':
+                    raise ValueError("Expected a JSON array")
+                self._started = True
+                position += 1
+            elif self._ended:
+                raise ValueError("Unexpected data after the JSON array")
+            elif buf[position] == ',':
+                position += 1
+            elif buf[position] == ']':
+                self._ended = True
+                position += 1
+            else:
+                try:
+                    element, position = self.decoder.raw_decode(buf, position)
+                except ValueError:
+                    # The object is not complete yet
+                    break
+                elements.append(element)
+        self._buffer = buf[position:]
+        return elements
+
+    def close(self):
+        """Raises *ValueError* if the array has not been completely received"""
+        if not self._ended or self._buffer.strip():
+            raise ValueError("Incomplete JSON array")
+
+def get_client(upstream=POSTGREST):
+    """
+    Returns the HTTP client of an upstream, creating it with the settings of
+    its configuration section if needed. The clients are bound to the
+    current IOLoop, so a new one is created if the IOLoop has changed (e.g.
+    in the tests or after forking).
+
+    :param upstream: name of the configuration section of the upstream
+    :type upstream: str
+    :rtype: :class:`tornado.httpclient.AsyncHTTPClient`
+    """
+    http_client = _clients.get(upstream)
+    if http_client is None or http_client.io_loop is not IOLoop.current():
+        pool_size = get_option(upstream, 'pool_size', DEFAULT_POOL_SIZE)
+        http_client = HTTPClient(force_instance=True,
+                max_clients=pool_size,
+                defaults=dict(
+                    connect_timeout=get_option(upstream, 'connect_timeout',
+                        DEFAULT_CONNECT_TIMEOUT),
+                    request_timeout=get_option(upstream, 'request_timeout',
+                        DEFAULT_REQUEST_TIMEOUT)))
+        logging.debug("Created %s client for %s with %s connections",
+                HTTPClient.__name__, upstream, pool_size)
+        _clients[upstream] = http_client
+    return http_client
+
+def close():
+    """Closes the HTTP clients of all the upstreams"""
+    for http_client in _clients.values():
+        http_client.close()
+    _clients.clear()
+
+def configure():
+    """
+    Discards the HTTP clients of all the upstreams, so they are created again
+    with the current settings of the configuration file. It is called when
+    the file is reloaded. The requests in progress are not interrupted, the
+    old clients are closed once their requests have timed out.
+    """
+    for http_client in _clients.values():
+        timeout = (http_client.defaults['connect_timeout'] +
+                http_client.defaults['request_timeout'])
+        http_client.io_loop.call_later(timeout, http_client.close)
+    _clients.clear()
+
+def quote_url(url):
+    """Escapes the unsafe characters of a composed URL"""
+    if isinstance(url, unicode):
+        url = url.encode('utf-8')
+    return urllib.quote(url, safe=SAFE_CHARS)
+
+@gen.coroutine
+def fetch(url, method='GET', json=None, data=None, headers=None,
+        upstream=POSTGREST, **kwargs):
+    """
+    Executes an HTTP request without blocking the IOLoop and returns a
+    :class:`Response`. HTTP errors are not raised, they have to be checked
+    through the *ok* and *status_code* attributes. The request is recorded in
+    the upstream metrics and in the trace of the request being served (see
+    :mod:`dbod.api.metrics` and :mod:`dbod.api.tracing`).
+
+    :param url: the URL to request
+    :type url: str
+    :param method: the HTTP method
+    :type method: str
+    :param json: object to be sent JSON encoded in the body of the request
+    :param data: dictionary to be sent form encoded in the body of the request
+    :type data: dict
+    :param headers: additional headers of the request
+    :type headers: dict
+    :param upstream: the upstream whose connection pool is used (see
+        :func:`get_client`)
+    :type upstream: str
+    :param kwargs: any other argument accepted by
+        :class:`tornado.httpclient.HTTPRequest` (e.g. *validate_cert*)
+    :rtype: :class:`Response`
+    """
+    headers = dict(headers or {})
+    body = None
+    if json is not None:
+        body = json_encode(json)
+        headers.setdefault('Content-Type', 'application/json')
+    elif data is not None:
+        body = urllib.urlencode(data)
+        headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
+    elif method in ('POST', 'PATCH', 'PUT'):
+        body = ''
+    request = HTTPRequest(quote_url(url), method=method, headers=headers,
+            body=body, **kwargs)
+    start = time.time()
+    response = Response((yield get_client(upstream).fetch(request, raise_error=False)))
+    duration = time.time() - start
+    option = metrics.url_option(upstream, url)
+    metrics.observe_upstream(upstream, option, response.status_code, duration)
+    tracing.record(upstream, option, method, response.status_code, start, duration)
+    raise gen.Return(response)
+
+def get(url, **kwargs):
+    """Executes a *GET* request. See :func:`fetch`"""
+    return fetch(url, 'GET', **kwargs)
+
+def post(url, **kwargs):
+    """Executes a *POST* request. See :func:`fetch`"""
+    return fetch(url, 'POST', **kwargs)
+
+def patch(url, **kwargs):
+    """Executes a *PATCH* request. See :func:`fetch`"""
+    return fetch(url, 'PATCH', **kwargs)
+
+def delete(url, **kwargs):
+    """Executes a *DELETE* request. See :func:`fetch`"""
+    return fetch(url, 'DELETE', **kwargs)
+
+@gen.coroutine
+def stream(url, callback, **kwargs):
+    """
+    Executes a *GET* request of a JSON array of objects and calls *callback*
+    with every object as soon as it is received, so the whole response is
+    never held in memory. The objects are only decoded if the request is
+    successful.
+
+    :param url: the URL to request
+    :type url: str
+    :param callback: function called with every object of the array
+    :param kwargs: any other argument accepted by :func:`fetch`
+    :rtype: :class:`Response` - its *text* is only set in case of error
+    :raises: ValueError - if the array is not completely received
+    """
+    parser = JSONStream()
+    status = [None]
+    error = []
+
+    def on_header(line):
+        if line.startswith('HTTP/'):
+            status[0] = int(line.split(' ', 2)[1])
+
+    def on_chunk(chunk):
+        if status[0] < 300:
+            for element in parser.feed(chunk):
+                callback(element)
+        else:
+            error.append(chunk)
+
+    response = yield get(url, header_callback=on_header, streaming_callback=on_chunk, **kwargs)
+    if response.ok:
+        parser.close()
+    else:
+        response.text = ''.join(error)
+    raise gen.Return(response)
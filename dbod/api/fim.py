@@ -14,9 +14,11 @@ FIM module, which has the endpoint to read FIM's data
 
 import tornado.web
 import logging
-import requests
 import json
 
+from tornado import gen
+
+from dbod.api import client
 from dbod.api.base import *
 from dbod.config import config
 
@@ -36,6 +38,7 @@ class Fim(tornado.web.RequestHandler):
     The request method implemented for this endpoint is just the :func:`get`.
 
     """
+    @gen.coroutine
     def get(self, name):
         """Returns the FIM's data for an instance
         (No any special headers for this request)
@@ -48,7 +51,7 @@ class Fim(tornado.web.RequestHandler):
 
         """
         
-        response = requests.get(config.get('postgrest', 'fim_url') + '?instance_name=eq.' + name, verify=False)
+        response = yield client.get(config.get('postgrest', 'fim_url') + '?instance_name=eq.' + name, validate_cert=False)
         if response.ok:
             data = response.json()
             if data:
@@ -13,17 +13,59 @@
 
 import logging
 import json
-from sys import exc_info
-import requests
 import tornado.web
 import tornado.escape
+from tornado import gen
+from dbod.api import client, metrics
 from dbod.api.base import *
-from dbod.config import config
+from dbod.api.cache import PeriodicCache
+from dbod.config import config, get_option
+
+class AliasPool(PeriodicCache):
+    """
+    Cached number of free and used *dns names* of the pool of functional
+    aliases, read from the *functional_aliases_pool* view.
+
+    It is refreshed in background every *interval* seconds (the
+    *alias_pool_interval* option of the *[cache]* section) and, after any
+    change of the functional aliases, when it is requested again. Every
+    refresh updates the *dbod_api_alias_pool_dns_names* metric and logs a
+    warning if the free *dns names* are less than the *alias_pool_low* option
+    of the *[cache]* section. An *interval* of 0 disables the cache.
+    """
+
+    def reset(self):
+        """Discards the cached status"""
+        super(AliasPool, self).reset()
+        self.status = None
+
+    @property
+    def interval(self):
+        """Seconds between refreshes"""
+        return get_option('cache', 'alias_pool_interval', 60)
+
+    @gen.coroutine
+    def load(self):
+        """Reads the status of the pool and updates the metric"""
+        response = yield client.get(config.get('postgrest', 'alias_pool_url'))
+        if not response.ok:
+            logging.error("Error reading the functional aliases pool: " + response.text)
+            raise tornado.web.HTTPError(response.status_code)
+        self.status = response.json()[0]
+        metrics.alias_pool.set(('free',), self.status['free'])
+        metrics.alias_pool.set(('used',), self.status['used'])
+        if self.status['free'] < get_option('cache', 'alias_pool_low', 0):
+            logging.warning("Only %s dns_names left in the functional aliases pool",
+                    self.status['free'])
+
+# Cached status of the pool of functional aliases
+pool = AliasPool()
 
 class FunctionalAlias(tornado.web.RequestHandler):
 
     """
-    This is the handler of **/instance/alias/<database name>** endpoint.
+    This is the handler of **/instance/alias/<database name>** and
+    **/instance/alias** endpoints.
 
     Things that are given for the development of this endpoint:
 
@@ -45,8 +87,8 @@ class FunctionalAlias(tornado.web.RequestHandler):
 
     The request methods implemented for this endpoint are:
 
-    * :func:`get`
-    * :func:`post`
+    * :func:`get` - (or, in **/instance/alias?dns_name=<dns name>** or **/instance/alias?alias=<alias>**, lookup of the instance of a *dns name* or *alias*)
+    * :func:`post` - (or, in **/instance/alias**, bulk assignment of aliases to many instances)
     * :func:`delete` 
 
     .. note::
@@ -56,9 +98,13 @@ class FunctionalAlias(tornado.web.RequestHandler):
 
     """
 
-    url = config.get('postgrest', 'functional_alias_url')
+    def prepare(self):
+        """Only the *GET* and *POST* methods are allowed without a database name"""
+        if not self.path_kwargs.get('db_name') and self.request.method not in ('GET', 'POST'):
+            raise tornado.web.HTTPError(405)
 
-    def get(self, db_name, *args):
+    @gen.coroutine
+    def get(self, db_name=None, *args):
 
         """
         The *GET* method returns the database name's *alias* and *dns name*.
@@ -71,9 +117,12 @@ class FunctionalAlias(tornado.web.RequestHandler):
         
         """
         logging.debug('Arguments:' + str(self.request.arguments))
-        composed_url = self.url + '?db_name=eq.' + db_name + '&select=dns_name,alias'
+        if not db_name:
+            yield self.__lookup__()
+            return
+        composed_url = config.get('postgrest', 'functional_alias_url') + '?db_name=eq.' + db_name + '&select=dns_name,alias'
         logging.info('Requesting ' + composed_url)
-        response = requests.get(composed_url)
+        response = yield client.get(composed_url)
         data = response.json()
         if response.ok and data:
             logging.debug("response: " + json.dumps(data))
@@ -85,8 +134,37 @@ class FunctionalAlias(tornado.web.RequestHandler):
             logging.error("Error fetching functional alias: " + response.text)
             raise tornado.web.HTTPError(response.status_code)
 
+    @gen.coroutine
+    def __lookup__(self):
+        """
+        This is a private function which is used by :func:`get` to find the
+        instance which a *dns name* or an *alias* is assigned to. Exactly one
+        of the *dns_name* or *alias* arguments has to be given. Both columns
+        are indexed, so only the matching row is read.
+
+        :raises: HTTPError - when the arguments are not right, the *dns name* or *alias* is not assigned or if there is an internal error
+        """
+        filters = [(name, self.get_argument(name)) for name in ('dns_name', 'alias')
+                if self.get_argument(name, None)]
+        if len(filters) != 1:
+            logging.error("Either the dns_name or the alias argument has to be given")
+            raise tornado.web.HTTPError(BAD_REQUEST)
+        name, value = filters[0]
+        composed_url = config.get('postgrest', 'functional_alias_url') + '?' + name + '=eq.' + value + '&db_name=isnot.null&select=db_name,dns_name,alias'
+        logging.info('Requesting ' + composed_url)
+        response = yield client.get(composed_url)
+        if response.ok and response.json():
+            self.write({'response' : response.json()})
+        elif response.ok:
+            logging.warning("Functional alias not found for %s: %s" % (name, value))
+            raise tornado.web.HTTPError(NOT_FOUND)
+        else:
+            logging.error("Error fetching functional alias: " + response.text)
+            raise tornado.web.HTTPError(response.status_code)
+
     @http_basic_auth
-    def post(self, db_name, *args):
+    @gen.coroutine
+    def post(self, db_name=None, *args):
 
         """
         The *POST* method inserts a new *database name* and its *alias* into the database. It
@@ -94,7 +172,11 @@ class FunctionalAlias(tornado.web.RequestHandler):
 
         The *dns name* is chosen automatically from a pool; so, in the background this method 
         actually updates the *database name* and *alias* fields, which were *NULL* in the 
-        begining.
+        begining. The first free *dns name* is claimed and assigned in a single call to the
+        *claim_functional_alias* function of the database, which skips the *dns names*
+        being claimed by concurrent requests instead of waiting for them. It
+        responds with *409* if the instance already has an alias and *503* if
+        there are no *dns names* available.
 
         .. note::
 
@@ -114,43 +196,75 @@ class FunctionalAlias(tornado.web.RequestHandler):
         """
 
         logging.debug('Arguments:' + str(self.request.arguments))
+        if not db_name:
+            yield self.__post_aliases__()
+            return
         try:
             alias = self.get_argument('alias')
             logging.debug("alias: %s" % (alias))
-            
-            dns_name = self._next_dnsname()
-
-            if dns_name:
-                logging.debug("dns_name picked: " + str(dns_name))
-                headers = {'Prefer': 'return=representation'}
-                insert_data = {"db_name": db_name, 
-                               "alias": alias}
-                logging.debug("Data to insert: " + str(insert_data))
-
-                composed_url = self.url + '?dns_name=eq.' + dns_name
-                logging.debug('Requesting insertion: ' + composed_url)
-                
-                response = requests.patch(composed_url, json=insert_data, headers=headers)
-            
-                if response.ok:
-                    logging.info('Data inserted in the functional_aliases table')
-                    logging.debug(response.text)
-                    self.set_status(CREATED)
-                else:
-                    logging.error("Error inserting the functional alias: " + response.text)
-                    self.set_status(response.status_code)
-                        
-            else:
-                logging.error("No dns_name available in the functional_aliases table")
-                self.set_status(SERVICE_UNAVAILABLE)
         except:
             logging.error("Argument not recognized or not defined.")
             logging.error("Try adding header 'Content-Type:application/x-www-form-urlencoded'")
             logging.error("The right format should be: alias=<alias>")
             raise tornado.web.HTTPError(BAD_REQUEST)
 
+        insert_data = {"db_name": db_name, "alias": alias}
+        logging.debug("Data to insert: " + str(insert_data))
+        response = yield client.post(config.get('postgrest', 'claim_functional_alias_url'),
+                json=insert_data)
+
+        if response.ok:
+            dns_name = response.json()[0]["claim_functional_alias"]
+            if dns_name:
+                logging.info("dns_name %s assigned to %s" % (dns_name, db_name))
+                self.set_status(CREATED)
+            else:
+                # No dns_name is returned either if the instance already has
+                # an alias or if the pool is exhausted
+                composed_url = config.get('postgrest', 'functional_alias_url') + '?db_name=eq.' + db_name + '&select=dns_name'
+                assigned = yield client.get(composed_url)
+                if assigned.ok and assigned.json():
+                    logging.error("The instance %s already has a functional alias" % (db_name))
+                    self.set_status(CONFLICT)
+                else:
+                    logging.error("No dns_name available in the functional_aliases table")
+                    self.set_status(SERVICE_UNAVAILABLE)
+        else:
+            logging.error("Error inserting the functional alias: " + response.text)
+            self.set_status(response.status_code)
+
+    @gen.coroutine
+    def __post_aliases__(self):
+        """
+        This is a private function which is used by :func:`post` to assign
+        functional aliases to many instances in a single transaction. The
+        *request body* is a list of objects with the *db_name* and the *alias*
+        of every instance.
+
+        The free *dns names* are claimed by the *claim_functional_aliases*
+        function of the database. The response includes the list of aliases
+        with the *dns_name* and the status of each one: *201* if it has been
+        assigned, *400* if the *db_name* or the *alias* are missing or too
+        long, *409* if the instance already has an alias and *503* if there
+        are no *dns names* available.
+        """
+        try:
+            aliases = json.loads(self.request.body)
+        except ValueError:
+            aliases = None
+        if not isinstance(aliases, list) or not aliases:
+            logging.error("The request contains no valid data")
+            raise tornado.web.HTTPError(BAD_REQUEST)
+        response = yield client.post(config.get('postgrest', 'claim_functional_aliases_url'),
+                json={'aliases': aliases})
+        if response.ok:
+            self.write({'response' : response.json()[0]["claim_functional_aliases"]})
+        else:
+            logging.error("Error inserting the functional aliases: " + response.text)
+            raise tornado.web.HTTPError(response.status_code)
 
     @http_basic_auth
+    @gen.coroutine
     def delete(self, db_name, *args):
         """
         The *DELETE* method deletes or else asssigns to *NULL* the *database name* and 
@@ -169,15 +283,15 @@ class FunctionalAlias(tornado.web.RequestHandler):
 
         logging.debug('Arguments:' + str(self.request.arguments))
 
-        dns_name = self._get_dns(db_name)
+        dns_name = yield self._get_dns(db_name)
         logging.debug(dns_name)
         if dns_name:
             headers = {'Prefer': 'return=representation', 'Content-Type': 'application/json'}
-            composed_url = self.url + '?dns_name=eq.' + dns_name
+            composed_url = config.get('postgrest', 'functional_alias_url') + '?dns_name=eq.' + dns_name
             logging.debug('Requesting deletion: ' + composed_url)
             delete_data = '{"db_name": null, "alias": null}'
             logging.debug("dns_name to be remained: " + dns_name)
-            response = requests.patch(composed_url, json=json.loads(delete_data), headers=headers)
+            response = yield client.patch(composed_url, json=json.loads(delete_data), headers=headers)
 
             if response.ok:
                 logging.info("Delete success of: " + dns_name)
@@ -190,33 +304,7 @@ class FunctionalAlias(tornado.web.RequestHandler):
         else:
             logging.info("db_name not found. Nothing to do")
 
-    def _next_dnsname(self):
-        """
-        This is a private function which is used by :func:`post` method.
-        Returns the next dnsname which can be used for a newly created instance.  
-        If there is no available *dns name* in the pool or if there is any internal error it returns *None*.
-
-        :rtype: str or None
-
-        """
-        #LIMIT is not working in postgrest but it uses some headers for that as well
-        headers = {'Range-Unit': 'items', 'Range': '0-0'}
-        # select the next available dns_name with db_name and alias assigned to NULL
-        query_select = '?select=dns_name&order=dns_name.asc&'
-        query_filter = 'db_name=is.null&alias=is.null&dns_name=isnot.null'
-        composed_url = self.url + query_select + query_filter
-        try:
-            response_dns = requests.get(composed_url, headers=headers)
-            if response_dns.ok:
-                response_dns_dict = json.loads(response_dns.text)[0]
-                return response_dns_dict['dns_name']
-            else:
-                return None
-        except:
-            error_msg = exc_info()[0]
-            logging.error(error_msg)
-            return None
-
+    @gen.coroutine
     def _get_dns(self, db_name):
         """
         This is a private function which is used by :func:`delete` mehtod.
@@ -228,15 +316,51 @@ class FunctionalAlias(tornado.web.RequestHandler):
         :rtype: str or None
 
         """
-        composed_url = self.url + '?db_name=eq.' + db_name + '&select=dns_name'
-        response = requests.get(composed_url)
+        composed_url = config.get('postgrest', 'functional_alias_url') + '?db_name=eq.' + db_name + '&select=dns_name'
+        response = yield client.get(composed_url)
         if response.ok:
             try:
                 dns_name_dict = json.loads(response.text)[0]
-                return dns_name_dict['dns_name']
+                raise gen.Return(dns_name_dict['dns_name'])
             except IndexError:
                 self.set_status(BAD_REQUEST)
-                return None
+                raise gen.Return(None)
         else:
             self.set_status(SERVICE_UNAVAILABLE) 
-            return None
+            raise gen.Return(None)
+
+    def on_finish(self):
+        """
+        Invalidates the cached status of the pool after any request which
+        may have modified the functional aliases.
+        """
+        if self.request.method != 'GET':
+            pool.invalidate()
+
+class FunctionalAliasPool(tornado.web.RequestHandler):
+    """
+    This is the handler of **/alias/pool** endpoint.
+
+    It returns the number of *free*, *used* and *total* dns names of the pool
+    of functional aliases, to check how many functional aliases can still be
+    created. The response is served from the :class:`AliasPool` cache. If
+    the status cannot be refreshed, the last one read is served with a
+    *Warning: 110* header.
+    """
+
+    @gen.coroutine
+    def get(self):
+        """
+        The *GET* method returns the status of the pool of *dns names*.
+        (No any special headers for this request)
+
+        :rtype: json -- the response of the request
+        :raises: HTTPError - when the status of the pool has never been read
+        """
+        if pool.expired():
+            yield pool.refresh()
+        if pool.status is None:
+            raise pool.error
+        if pool.error:
+            self.set_header('Warning', '110 - "Response is Stale"')
+        self.write({'response' : pool.status})
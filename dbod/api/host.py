@@ -13,9 +13,10 @@
 
 import logging
 import json
-import requests
 import tornado.web
 import tornado.escape
+from tornado import gen
+from dbod.api import client
 from dbod.api.base import *
 from dbod.config import config
 
@@ -54,8 +55,7 @@ class Host(tornado.web.RequestHandler):
 
     """
 
-    url = config.get('postgrest', 'host_url')
-
+    @gen.coroutine
     def get(self, name, *args):
 
         """
@@ -70,9 +70,9 @@ class Host(tornado.web.RequestHandler):
         """
 
         logging.debug('Arguments:' + str(self.request.arguments))
-        composed_url = self.url + '?name=eq.' + name + '&select=memory'
+        composed_url = config.get('postgrest', 'host_url') + '?name=eq.' + name + '&select=memory'
         logging.info("Requesting " + composed_url)
-        response = requests.get(composed_url)
+        response = yield client.get(composed_url)
         data = response.json()
         if response.ok and data:
             logging.debug("response: " + json.dumps(data))
@@ -85,6 +85,7 @@ class Host(tornado.web.RequestHandler):
             raise tornado.web.HTTPError(response.status_code)
 
     @http_basic_auth
+    @gen.coroutine
     def post(self, name, *args):
 
         """
@@ -116,12 +117,12 @@ class Host(tornado.web.RequestHandler):
                 insert_data = {"name": name,
                                "memory": memory}
                 logging.debug("Data to insert: %s" %(insert_data))
-                composed_url = self.url + '?name=eq.' + name
+                composed_url = config.get('postgrest', 'host_url') + '?name=eq.' + name
                 logging.debug('Requesting insertion: ' + composed_url)
                 
-                response = requests.post(composed_url, 
-                                         json=insert_data, 
-                                         headers=headers)
+                response = yield client.post(composed_url, 
+                                             json=insert_data, 
+                                             headers=headers)
                 if response.ok:
                         logging.info('Data inserted in the table')
                         logging.debug(response.text)
@@ -147,6 +148,7 @@ class Host(tornado.web.RequestHandler):
 
 	
     @http_basic_auth   
+    @gen.coroutine
     def put(self, name, *args):
         """
         The *PUT* method updates the *memory* size of the given *name* according to the example above.
@@ -181,11 +183,11 @@ class Host(tornado.web.RequestHandler):
                 update_data = {"name": name,
                                "memory": memory}
                 logging.debug("Data to insert: %s" %(update_data))
-                composed_url = self.url + '?name=eq.' + name
+                composed_url = config.get('postgrest', 'host_url') + '?name=eq.' + name
                 logging.debug('Requesting insertion: ' + composed_url)
-                response = requests.patch(composed_url, 
-                                          json=update_data, 
-                                          headers=headers)
+                response = yield client.patch(composed_url, 
+                                              json=update_data, 
+                                              headers=headers)
                 if response.ok:
                         logging.info('Data updated in the table')
                         logging.debug(response.text)
@@ -211,6 +213,7 @@ class Host(tornado.web.RequestHandler):
                 raise tornado.web.HTTPError(BAD_REQUEST)
 
     @http_basic_auth
+    @gen.coroutine
     def delete(self, name, *args):
         """
         The *DELETE* method deletes an entry from the table given the *name* in the url.
@@ -232,9 +235,9 @@ class Host(tornado.web.RequestHandler):
         """
 	headers = {'Prefer': 'return=representation',
 		   'Content-Type': 'application/json'}
-	composed_url = self.url + '?name=eq.' + name
-	response = requests.delete(composed_url,
-				   headers=headers)
+	composed_url = config.get('postgrest', 'host_url') + '?name=eq.' + name
+	response = yield client.delete(composed_url,
+				       headers=headers)
 	logging.info("Requesting deletion of: " + name)
 	if response.ok:
 		logging.info("Data deleted")
@@ -12,10 +12,49 @@
 
 import tornado.web
 import logging
-import requests
 
+from tornado import gen
+
+from dbod.api import client
 from dbod.api.base import *
-from dbod.config import config
+from dbod.api.cache import PeriodicCache
+from dbod.config import config, get_option
+
+class HostAliasesMap(PeriodicCache):
+    """
+    In-memory map of every host to the aliases of its instances, read from
+    the whole *host_aliases* view in a single request, so the aliases of a
+    host are served without aggregating the instances for every request.
+
+    It is refreshed in background every *interval* seconds (the
+    *host_aliases_interval* option of the *[cache]* section) and, after any
+    change of the instances, when it is requested again. If it cannot be
+    refreshed, the previous map keeps being served. An *interval* of 0
+    disables the cache and the view is queried for every request.
+    """
+
+    def reset(self):
+        """Discards the cached map"""
+        super(HostAliasesMap, self).reset()
+        self.hosts = None
+
+    @property
+    def interval(self):
+        """Seconds between refreshes"""
+        return get_option('cache', 'host_aliases_interval', 60)
+
+    @gen.coroutine
+    def load(self):
+        """Reads the aliases of all the hosts"""
+        response = yield client.get(config.get('postgrest', 'host_aliases_url'))
+        if not response.ok:
+            logging.error("Error fetching aliases: " + response.text)
+            raise tornado.web.HTTPError(response.status_code)
+        self.hosts = dict((row[u'host'], row) for row in response.json())
+        logging.info("Host aliases map refreshed with %s hosts", len(self.hosts))
+
+# Cached aliases of every host
+host_aliases = HostAliasesMap()
 
 class HostAliases(tornado.web.RequestHandler):
     """
@@ -37,9 +76,15 @@ class HostAliases(tornado.web.RequestHandler):
         * The *aliases* are the aliases of the databases that exist in this host/machine 
 
     The request method implemented for this endpoint is just the :func:`get`.
+    In **/host/aliases** it returns the aliases of all the hosts.
+
+    The aliases are served from the :class:`HostAliasesMap` cache. If it
+    cannot be refreshed, the previous version is served with a *Warning: 110*
+    header.
 
     """
-    def get(self, host):
+    @gen.coroutine
+    def get(self, host=None):
 
         """ 
         The *GET* method returns the list of ip-aliases registered in a host.
@@ -52,9 +97,34 @@ class HostAliases(tornado.web.RequestHandler):
 
         """
 
+        if host_aliases.interval > 0:
+            if host_aliases.expired():
+                yield host_aliases.refresh()
+            if host_aliases.hosts is None:
+                raise host_aliases.error
+            if host_aliases.error:
+                self.set_header('Warning', '110 - "Response is Stale"')
+            if host is None:
+                self.write({'response' : [host_aliases.hosts[name] for name in sorted(host_aliases.hosts)]})
+            elif host in host_aliases.hosts:
+                self.write({'response' : [host_aliases.hosts[host]]})
+            else:
+                logging.warning("Host aliases not found: " + host)
+                raise tornado.web.HTTPError(NOT_FOUND)
+            return
+
+        if host is None:
+            composed_url = config.get('postgrest', 'host_aliases_url') + '?order=host.asc'
+            response = yield client.get(composed_url)
+            if response.ok:
+                self.write({'response' : response.json()})
+                return
+            logging.error("Error fetching aliases: " + response.text)
+            raise tornado.web.HTTPError(response.status_code)
+
         composed_url = config.get('postgrest', 'host_aliases_url') + '?host=eq.' + host
         logging.info('Requesting ' + composed_url )
-        response = requests.get(composed_url)
+        response = yield client.get(composed_url)
         data = response.json()
         if response.ok and data:
             logging.debug("response: " + response.text)
@@ -14,17 +14,24 @@ REST API Server for the DB On Demand System
 
 import tornado.web
 import logging
-import requests
 import json
 import urllib
 
+from tornado import gen
+
+from dbod.api import client
 from dbod.api.base import *
+from dbod.api.cache import metadata_cache, instance_id_cache
+from dbod.api.hostaliases import host_aliases
+from dbod.api.metadata import views
+from dbod.api.rundeck import resources
 from dbod.config import config
 
 class Instance(tornado.web.RequestHandler):
 
     """
-    This is the handler of **/instance/<database name>** endpoint.
+    This is the handler of **/instance/<database name>** and **/instance**
+    endpoints.
 
     Things that are given for the development of this endpoint:
 
@@ -65,7 +72,7 @@ class Instance(tornado.web.RequestHandler):
   
     The request methods implemented for this endpoint are:
 
-    * :func:`get`
+    * :func:`get` - of one instance or, in **/instance**, of a batch of instances
     * :func:`post` - (creation)
     * :func:`put` - (update)
     * :func:`delete` - (deletion)
@@ -80,18 +87,51 @@ class Instance(tornado.web.RequestHandler):
     """
 
 
-    def get(self, name):
+    # Maximum number of names requested to PostgREST in a single query
+    BATCH_SIZE = 100
+
+    # Default and maximum number of instances in a page of the listing
+    PAGE_SIZE = 1000
+    MAX_PAGE_SIZE = 10000
+
+    # Fields which can be used to filter the listing of instances
+    FILTERS = ('db_type', 'class', 'state')
+
+    # The listing is flushed to the client every FLUSH_SIZE bytes
+    FLUSH_SIZE = 64 * 1024
+
+    def prepare(self):
+        """Only the *GET* method is allowed without a database name"""
+        if not self.path_args and self.request.method != 'GET':
+            raise tornado.web.HTTPError(405)
+
+    @gen.coroutine
+    def get(self, name=None):
         """
         The *GET* method returns am *instance* given a *database name*.
         (No any special headers for this request)
 
+        Without a *database name*, it returns the instances given in the
+        *names* argument (a comma separated list, which can be repeated) as
+        a map keyed by database name. The instances which do not exist are
+        not included in the map.
+
+        Without a *database name* nor *names*, it returns a page of the list
+        of all the instances (see :func:`__list_instances__`).
+
         :param name: the database name which is given in the url
         :type name: str
         :rtype: json - the response of the request
         :raises: HTTPError - when the requested database name does not exist or if in case of an internal error 
 
         """
-        response = requests.get(config.get('postgrest', 'instance_url') + "?db_name=eq." + name)
+        if not name:
+            if self.get_arguments('names'):
+                yield self.__get_instances__()
+            else:
+                yield self.__list_instances__()
+            return
+        response = yield client.get(config.get('postgrest', 'instance_url') + "?db_name=eq." + name)
         if response.ok:
             data = response.json()
             if data:
@@ -104,7 +144,112 @@ class Instance(tornado.web.RequestHandler):
             logging.error("Entity metadata not found: " + name)
             raise tornado.web.HTTPError(NOT_FOUND)
 
+    @gen.coroutine
+    def __get_instances__(self):
+        """
+        This is a private function which is used by :func:`get` to return a
+        batch of instances. The names are requested to PostgREST with a *in*
+        filter, in groups of *BATCH_SIZE* names which are requested
+        concurrently.
+        """
+        names = []
+        for argument in self.get_arguments('names'):
+            for name in argument.split(','):
+                name = name.strip()
+                if name and name not in names:
+                    names.append(name)
+        if not names:
+            logging.error("No instance names given")
+            raise tornado.web.HTTPError(BAD_REQUEST)
+        url = config.get('postgrest', 'instance_url') + "?db_name=in."
+        responses = yield [client.get(url + ','.join(names[i:i + self.BATCH_SIZE]))
+                for i in range(0, len(names), self.BATCH_SIZE)]
+        instances = {}
+        for response in responses:
+            if not response.ok:
+                logging.error("Error fetching instances: " + response.text)
+                raise tornado.web.HTTPError(response.status_code)
+            for instance in response.json():
+                instances[instance["db_name"]] = instance
+        logging.debug("Found %s of %s instances", len(instances), len(names))
+        self.write({'response' : instances})
+
+    @gen.coroutine
+    def __list_instances__(self):
+        """
+        This is a private function which is used by :func:`get` to return a
+        page of the list of instances, ordered by database name. The
+        arguments of the request are:
+
+        * *db_type*, *class*, *state* and *host* - optional filters
+        * *limit* - the number of instances in the page, *PAGE_SIZE* by default
+        * *cursor* - the *next* value returned with the previous page
+
+        The response includes the list of instances and the *next* cursor,
+        which is *null* in the last page. As the *host* filter is applied
+        after requesting the page, a page may contain less instances than the
+        limit even if it is not the last one.
+
+        The page is requested to PostgREST with a *Range* header and a filter
+        on the database name (keyset pagination) and it is written to the
+        client while it is being received.
+        """
+        try:
+            limit = int(self.get_argument('limit', self.PAGE_SIZE))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= self.MAX_PAGE_SIZE:
+            logging.error("Invalid limit: " + self.get_argument('limit'))
+            raise tornado.web.HTTPError(BAD_REQUEST)
+
+        query = '?order=db_name.asc'
+        cursor = self.get_argument('cursor', None)
+        if cursor:
+            query += '&db_name=gt.' + cursor
+        for field in self.FILTERS:
+            value = self.get_argument(field, None)
+            if value:
+                query += '&' + field + '=eq.' + value
+        self._host = self.get_argument('host', None)
+        if self._host:
+            # The hosts are stored as a comma separated list
+            query += '&host=like.*' + self._host + '*'
+
+        self._rows = 0
+        self._written = 0
+        self._last = None
+        self._pending = 0
+        self.set_header('Content-Type', 'application/json; charset=UTF-8')
+        self.write('{"response": [')
+        headers = {'Range-Unit': 'items', 'Range': '0-' + str(limit - 1)}
+        try:
+            response = yield client.stream(config.get('postgrest', 'instance_url') + query,
+                    self.__on_instance__, headers=headers)
+        except ValueError as e:
+            logging.error("Error reading the instances: %s", e)
+            raise tornado.web.HTTPError(BAD_GATEWAY)
+        if not response.ok:
+            logging.error("Error listing the instances: " + response.text)
+            raise tornado.web.HTTPError(response.status_code)
+        next_cursor = self._last if self._rows == limit else None
+        self.write('], "next": ' + json.dumps(next_cursor) + '}')
+
+    def __on_instance__(self, instance):
+        """Writes an instance of the listing"""
+        self._rows += 1
+        self._last = instance["db_name"]
+        if self._host and self._host not in (instance["host"] or '').split(','):
+            return
+        text = (',' if self._written else '') + json.dumps(instance)
+        self.write(text)
+        self._written += 1
+        self._pending += len(text)
+        if self._pending >= self.FLUSH_SIZE:
+            self._pending = 0
+            self.flush()
+
     @http_basic_auth
+    @gen.coroutine
     def post(self, name):
         """
         The *POST* method inserts a new instance into the database wih all the
@@ -112,16 +257,16 @@ class Instance(tornado.web.RequestHandler):
 
         In the request body we specify all the information of the *instance*
         table along with the *attribute* and *volume* tables. We extract and
-        separate the information of each table. After inserting the information
-        in the *instance* table we use its *id* to relate the specific instance
-        with the *attribute* and *volume* table.
+        separate the information of each table and all of them are inserted
+        in a single transaction by the *create_instance* function of the
+        database, called through PostgREST.
         
         .. note::
             
             
             * It's possible to insert more than one *hosts* or *volumes* in one instance.
             * The database names have to be unique
-            * If any of the 3 insertions (in *instance*, *attribute*, *volume* table) is not successful then an *Exception* is raised and the private function :func:`__delete_instance__` is used in order to delete what may has been created.  
+            * If any of the 3 insertions (in *instance*, *attribute*, *volume* table) is not successful then nothing is created and an *Exception* is raised.
             * Also, the creation is not successful 
 
                 * if the client is not authorized or
@@ -163,50 +308,21 @@ class Instance(tornado.web.RequestHandler):
             volumes = instance["volumes"]
             del instance["volumes"]
         
-        # Insert the instance in database using PostREST
-        response = requests.post(config.get('postgrest', 'instance_url'), json=instance, headers={'Prefer': 'return=representation'})
+        # Insert the instance, volumes and attributes in a single transaction
+        body = {'instance': instance, 'volumes': volumes or [], 'attributes': attributes or {}}
+        response = yield client.post(config.get('postgrest', 'create_instance_url'), json=body)
         if response.ok:
-            entid = json.loads(response.text)["id"]
-            logging.info("Created instance " + instance["db_name"])
+            entid = response.json()[0]["create_instance"]
+            logging.info("Created instance " + instance["db_name"] + " with id " + str(entid))
             logging.debug(response.text)
+            views.invalidate()
             self.set_status(CREATED)
         else:
             logging.error("Error creating the instance: " + response.text)
             raise tornado.web.HTTPError(response.status_code)
-        
-        # Add instance id to volumes
-        if volumes:
-            for volume in volumes:
-                volume["instance_id"] = entid
-
-            # Insert the volumes in database using PostREST
-            logging.debug(volumes)
-            response = requests.post(config.get('postgrest', 'volume_url'), json=volumes)
-            if response.ok:
-                logging.debug("Inserting volumes: " + json.dumps(volumes))
-                self.set_status(CREATED)
-            else:
-                logging.error("Error creating the volumes: " + response.text)
-                self.__delete_instance__(entid)
-                raise tornado.web.HTTPError(response.status_code)
-                
-        # Insert the attributes
-        if attributes:
-            insert_attributes = []
-            for attribute in attributes:
-                insert_attr = {'instance_id': entid, 'name': attribute, 'value': attributes[attribute]}
-                logging.debug("Inserting attribute: " + json.dumps(insert_attr))
-                insert_attributes.append(insert_attr)
-            
-            response = requests.post(config.get('postgrest', 'attribute_url'), json=insert_attributes)
-            if response.ok:
-                self.set_status(CREATED)
-            else:
-                logging.error("Error inserting attributes: " + response.text)
-                self.__delete_instance__(entid)
-                raise tornado.web.HTTPError(response.status_code)
             
     @http_basic_auth
+    @gen.coroutine
     def put(self, name):
         """
         The *PUT* method updates an instance into the database wih all the information that is needed.
@@ -217,11 +333,11 @@ class Instance(tornado.web.RequestHandler):
         The procedure of this method is the following:
 
         * We extract and separate the information of each table. 
-        * We get the *id* of the row from the given (unique) database from the url.
-        * If it exists, we delete if any information with that *id* exists in the tables.
-        * After that, we insert the information to the related table along with the instance *id*. 
-        * In case of more than one attributes we insert each one separetely.  
-        * Finally, we update the *instance* table's row (which include the given database name) with the new given information.
+        * We send the changes to the *update_instance* function of the database, which applies them in a single transaction:
+
+            * If *volumes* are given, they replace the current ones. The volumes are matched by mounting path and only the new, modified or removed ones are written.
+            * If *attributes* are given, they replace the current ones. Only the new, modified or removed attributes are written.
+            * The *instance* table's row (which include the given database name) is updated with the rest of the given information.
 
         :param name: the database name which is given in the url
         :type name: str
@@ -230,55 +346,16 @@ class Instance(tornado.web.RequestHandler):
         """
         logging.debug(self.request.body)
         instance = json.loads(self.request.body)
-        entid = self.__get_instance_id__(name)
-        if not entid:
-            logging.error("Instance '" + name + "' doest not exist.")
-            raise tornado.web.HTTPError(NOT_FOUND)
+        body = {'inst_name': name}
         
         # Check if the volumes are changed
         if "volumes" in instance:
-            volumes = instance["volumes"]
-            for volume in volumes:
-                volume["instance_id"] = entid
+            body["volumes"] = instance["volumes"]
             del instance["volumes"]
-            
-            # Delete current volumes
-            response = requests.delete(config.get('postgrest', 'volume_url') + "?instance_id=eq." + str(entid))
-            logging.debug("Volumes to insert: " + json.dumps(volumes))
-            if response.ok or response.status_code == 404:
-                if len(volumes) > 0:
-                    response = requests.post(config.get('postgrest', 'volume_url'), json=volumes)
-                    if response.ok:
-                        self.set_status(NO_CONTENT)
-                    else:
-                        logging.error("Error adding volumes: " + response.text)
-                        raise tornado.web.HTTPError(response.status_code)
-            else:
-                logging.error("Error deleting old volumes: " + response.text)
-                raise tornado.web.HTTPError(response.status_code)
                 
         # Check if the attributes are changed
         if "attributes" in instance:
-            attributes = instance["attributes"]
-            response = requests.delete(config.get('postgrest', 'attribute_url') + "?instance_id=eq." + str(entid))
-            if response.ok or response.status_code == 404:
-                if len(attributes) > 0:
-                    # Insert the attributes
-                    insert_attributes = []
-                    for attribute in attributes:
-                        insert_attr = {'instance_id': entid, 'name': attribute, 'value': attributes[attribute]}
-                        logging.debug("Inserting attribute: " + json.dumps(insert_attr))
-                        insert_attributes.append(insert_attr)
-                        
-                    response = requests.post(config.get('postgrest', 'attribute_url'), json=insert_attributes)
-                    if response.ok:
-                        self.set_status(NO_CONTENT)
-                    else:
-                        logging.error("Error inserting attributes: " + response.text)
-                        raise tornado.web.HTTPError(response.status_code)
-            else:
-                logging.error("Error deleting attributes: " + response.text)
-                raise tornado.web.HTTPError(response.status_code)
+            body["attributes"] = instance["attributes"]
             del instance["attributes"]
         
         if instance:
@@ -290,57 +367,55 @@ class Instance(tornado.web.RequestHandler):
                         hosts = hosts + "," + instance["hosts"][i]
                 instance["host"] = hosts
                 del instance["hosts"]
+            body["instance"] = instance
         
-            response = requests.patch(config.get('postgrest', 'instance_url') + "?db_name=eq." + name, json=instance)
-            if response.ok:
-                self.set_status(NO_CONTENT)
-            else:
-                logging.error("Error editing the instance: " + response.text)
-                raise tornado.web.HTTPError(response.status_code)
-        else:
+        response = yield client.post(config.get('postgrest', 'update_instance_url'), json=body)
+        if response.ok:
+            if response.json()[0]["update_instance"] is None:
+                logging.error("Instance '" + name + "' doest not exist.")
+                raise tornado.web.HTTPError(NOT_FOUND)
+            views.invalidate()
             self.set_status(NO_CONTENT)
+        else:
+            logging.error("Error editing the instance: " + response.text)
+            raise tornado.web.HTTPError(response.status_code)
             
     @http_basic_auth
+    @gen.coroutine
     def delete(self, name):
         """
         The *DELETE* method deletes an instance by *database name*.
         
-        In order to delete an instance we have to delete all the related information of the specified database name in *instance*, *attribute* and *volume* tables (:func:`__delete_instance__`). To achieve that we have to first find the *id* of the given database name (:func:__get_instance_id__).
+        In order to delete an instance we have to delete all the related information of the specified database name in *instance*, *attribute* and *volume* tables (:func:`__delete_instance__`). To achieve that we have to first find the *id* of the given database name (:func:`dbod.api.base.get_instance_id_by_name`).
 
         :param name: the database name which is given in the url
         :type name: str
         :raises: HTTPError - when the given database name cannot be found
 
         """
-        entid = self.__get_instance_id__(name)
+        entid = yield get_instance_id_by_name(name, cached=False)
         if entid:
             logging.debug("Deleting instance id: " + str(entid))
-            self.__delete_instance__(entid)
+            yield self.__delete_instance__(entid)
+            views.invalidate()
             self.set_status(204)
         else:
             logging.error("Instance not found: " + name)
             raise tornado.web.HTTPError(NOT_FOUND)
             
-    def __get_instance_id__(self, name):
+    def on_finish(self):
         """
-        This is a private function which is used by :func:`put` and :func:`delete` methods.
-        Returns the instance *id* given the database name in order to be able to operate on the instance related tables. It returns *None* if the specified database name does not exist in the *instance* table or in case of internal error.
-
-        :param name: the database name from which we want to get the *id*
-        :type name: str
-        :rtype: str or None
-
+        Invalidates the cached metadata, resources.xml, host aliases and
+        instance id after any request which may have modified an instance.
         """
-        response = requests.get(config.get('postgrest', 'instance_url') + "?db_name=eq." + name)
-        if response.ok:
-            data = response.json()
-            if data:
-                return data[0]["id"]
-            else:
-                return None
-        else:
-            return None
-            
+        if self.request.method != 'GET' and self.path_args:
+            metadata_cache.invalidate()
+            resources.invalidate()
+            host_aliases.invalidate()
+            # The instance may have been created, renamed or deleted
+            instance_id_cache.invalidate(self.path_args[0])
+
+    @gen.coroutine
     def __delete_instance__(self, inst_id):
         """
         This is a private function that is used by :func:`put` and :func:`delete` methods.
@@ -350,8 +425,8 @@ class Instance(tornado.web.RequestHandler):
         :type inst_id: str
 
         """
-        requests.delete(config.get('postgrest', 'attribute_url') + "?instance_id=eq." + str(inst_id))
-        requests.delete(config.get('postgrest', 'volume_url') + "?instance_id=eq." + str(inst_id))
-        requests.delete(config.get('postgrest', 'instance_url') + "?id=eq." + str(inst_id))
+        yield client.delete(config.get('postgrest', 'attribute_url') + "?instance_id=eq." + str(inst_id))
+        yield client.delete(config.get('postgrest', 'volume_url') + "?instance_id=eq." + str(inst_id))
+        yield client.delete(config.get('postgrest', 'instance_url') + "?id=eq." + str(inst_id))
         
 
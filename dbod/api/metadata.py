@@ -14,11 +14,23 @@ Metadata module, which includes all the classes related with metadata endpoints.
 
 import tornado.web
 import logging
-import requests
 import json
+import os
+import stat
+import tempfile
+import time
 
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from dbod.api import client
 from dbod.api.base import *
-from dbod.config import config
+from dbod.api.cache import PeriodicCache, metadata_cache
+from dbod.api.rundeck import resources
+from dbod.config import config, get_option
+
+# Status codes meaning PostgREST could not be reached
+UNREACHABLE = (BAD_GATEWAY, SERVICE_UNAVAILABLE, 504)
 
 class Metadata(tornado.web.RequestHandler):
     """
@@ -43,7 +55,14 @@ class Metadata(tornado.web.RequestHandler):
 
     The request method implemented for this endpoint is just the :func:`get`.
 
+    The responses are kept in an in-memory cache (see the *[cache]* section of
+    the configuration file), so repeated requests for the same instance or host
+    are served without querying PostgREST. If PostgREST can not be reached, the
+    metadata is served from the last on-disk :class:`Snapshot` and the response
+    includes a *Warning: 110* header.
+
     """
+    @gen.coroutine
     def get(self, **args):
         """Returns the metadata of a host or an instance
         The *GET* method returns the instance(s)' metadata given the *host* or the *database name*. 
@@ -71,11 +90,23 @@ class Metadata(tornado.web.RequestHandler):
             else:
                 logging.error("Unsupported endpoint")
                 raise tornado.web.HTTPError(BAD_REQUEST)
+            data = metadata_cache.get((etype, name))
+            if data:
+                self.write({'response' : data})
+                return
             logging.info('Requesting ' + composed_url)
-            response = requests.get(composed_url, verify=False)
-            data = response.json()
-            if response.ok and data:
+            response = yield client.get(composed_url, validate_cert=False)
+            if response.status_code in UNREACHABLE:
+                data = snapshot.lookup(etype, name)
+                if data:
+                    logging.warning("PostgREST unreachable, serving metadata from snapshot: " + name)
+                    self.set_header('Warning', '110 - "Response is Stale"')
+                    self.write({'response' : data})
+                    return
+            data = response.json() if response.ok else None
+            if data:
                 logging.debug("response: " + json.dumps(data))
+                metadata_cache.set((etype, name), data)
                 self.write({'response' : data})
             elif response.ok:
                 logging.warning("Instance metadata not found: " + name)
@@ -86,3 +117,187 @@ class Metadata(tornado.web.RequestHandler):
         else:
             logging.error("Unsupported endpoint")
             raise tornado.web.HTTPError(BAD_REQUEST)
+
+class Snapshot(object):
+    """
+    On-disk copy of the whole *metadata* view, stored in the file defined by
+    the *path* option of the *[cache]* section.
+
+    The file is a JSON array with an instance per line, so it can be loaded
+    line by line without parsing the whole document at once. It is written
+    to a temporary file which is then renamed, so a reader never finds a
+    partially written snapshot. The file is not synced to disk, not to block
+    the IOLoop while it is written: after a crash the previous snapshot may
+    be found instead, which is refreshed soon anyway.
+
+    The snapshot is loaded when the server starts, and it is only used by
+    :class:`Metadata` if PostgREST is unreachable.
+    A *readonly* snapshot is refreshed in memory but not written (e.g. by
+    all the worker processes but the first one).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.instances = {}
+        self.hosts = {}
+        self.timestamp = None
+        self.readonly = False
+        self._refreshing = False
+
+    def lookup(self, etype, name):
+        """
+        Returns the list of instances' metadata for an instance or a host
+        name, as returned by the *metadata* view
+        """
+        if etype == u'instance':
+            if name in self.instances:
+                return [self.instances[name]]
+        elif etype == u'host':
+            return [self.instances[db_name] for db_name in self.hosts.get(name, [])]
+        return []
+
+    def load(self):
+        """
+        Reads the snapshot file. It does not fill the metadata cache, as the
+        snapshot may be outdated: it is only served if PostgREST is
+        unreachable, marked as stale.
+        """
+        if not self.path or not os.path.isfile(self.path):
+            logging.info("Metadata snapshot not found: %s", self.path)
+            return
+        try:
+            with open(self.path) as snapshot_file:
+                data = [json.loads(line.rstrip().rstrip(','))
+                        for line in snapshot_file if line.startswith('{')]
+            self._index(data)
+            self.timestamp = os.path.getmtime(self.path)
+        except (IOError, ValueError) as e:
+            logging.error("Error loading metadata snapshot %s: %s", self.path, e)
+            return
+        logging.info("Loaded metadata snapshot of %s instances from %s",
+                len(self.instances), self.path)
+
+    def dump(self, data):
+        """Writes atomically the list of instances' metadata to the snapshot file"""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metadata')
+        try:
+            with os.fdopen(fd, 'w') as snapshot_file:
+                snapshot_file.write('[\n')
+                snapshot_file.write(',\n'.join(json.dumps(entry) for entry in data))
+                snapshot_file.write('\n]\n')
+            # The temporary file is only readable by its owner, so it is
+            # given the permissions of the previous snapshot
+            os.chmod(tmp_path, self._mode())
+            os.rename(tmp_path, self.path)
+        except:
+            os.unlink(tmp_path)
+            raise
+
+    def _mode(self):
+        """
+        Returns the permissions of the snapshot file, or the default ones
+        of a new file if it does not exist yet
+        """
+        try:
+            return stat.S_IMODE(os.stat(self.path).st_mode)
+        except OSError:
+            umask = os.umask(0)
+            os.umask(umask)
+            return 0666 & ~umask
+
+    @gen.coroutine
+    def refresh(self):
+        """Fetches the whole *metadata* view and stores it in the snapshot file"""
+        if self._refreshing:
+            return
+        self._refreshing = True
+        try:
+            response = yield client.get(config.get('postgrest', 'metadata_url'),
+                    validate_cert=False)
+            if response.ok:
+                data = response.json()
+                self._index(data)
+                self.timestamp = time.time()
+                if not self.readonly:
+                    self.dump(data)
+                    logging.info("Metadata snapshot of %s instances written to %s",
+                            len(data), self.path)
+            else:
+                logging.error("Error fetching metadata for the snapshot: " + response.text)
+        except (IOError, OSError) as e:
+            logging.error("Error writing metadata snapshot %s: %s", self.path, e)
+        finally:
+            self._refreshing = False
+
+    def _index(self, data):
+        """Indexes the list of instances' metadata by name and by host"""
+        instances = {}
+        hosts = {}
+        for entry in data:
+            instances[entry[u'db_name']] = entry
+            for host in entry.get(u'hosts') or []:
+                hosts.setdefault(host, []).append(entry[u'db_name'])
+        self.instances = instances
+        self.hosts = hosts
+
+snapshot = Snapshot(None)
+
+class MaterializedViews(PeriodicCache):
+    """
+    Keeps the materialized *metadata* and *rundeck_instances* views up to
+    date, calling the *refresh_metadata* function of the database through
+    the URL defined by the *refresh_metadata_url* option.
+
+    The function only refreshes the views if the instances have changed or
+    if they are older than *max_age* seconds, so it is cheap to call it
+    often. It is called periodically and, through :func:`invalidate`, by the
+    handlers which modify the instances, without waiting for it, so the
+    changes are visible shortly after the response. When the views are
+    refreshed, the metadata cache and the cached resources.xml are
+    invalidated.
+
+    If the URL is not defined (e.g. the API is configured to read the views
+    which are not materialized) nothing is done.
+    """
+
+    def __init__(self, url, max_age):
+        super(MaterializedViews, self).__init__()
+        self.url = url
+        self.max_age = max_age
+
+    def invalidate(self):
+        """Schedules the refresh of the views, after a change of the instances"""
+        super(MaterializedViews, self).invalidate()
+        IOLoop.current().add_callback(self.refresh)
+
+    @gen.coroutine
+    def load(self):
+        """Calls the refresh function"""
+        if not self.url:
+            return
+        response = yield client.post(self.url, json={'max_age': self.max_age},
+                validate_cert=False)
+        if not response.ok:
+            logging.error("Error refreshing the materialized views: " + response.text)
+            raise tornado.web.HTTPError(response.status_code)
+        if response.json()[0]["refresh_metadata"]:
+            logging.info("Materialized metadata views refreshed")
+            metadata_cache.invalidate()
+            resources.invalidate()
+
+views = MaterializedViews(None, None)
+
+def configure():
+    """
+    Applies the options of the configuration file to the metadata snapshot
+    and to the materialized views. It is called again when the file is
+    reloaded.
+    """
+    snapshot.path = get_option('cache', 'path')
+    views.url = get_option('postgrest', 'refresh_metadata_url')
+    views.max_age = get_option('cache', 'views_max_age', 300)
+
+configure()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015, CERN
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file "LICENSE".
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Metrics module, with the counters and latency histograms of the requests
+served by the API and of the requests done to PostgREST and Rundeck. They are
+exposed in the `Prometheus <https://prometheus.io/>`_ text format by the
+**/metrics** endpoint.
+
+The requests served are recorded by :func:`log_request`, set as the
+*log_function* of the application, so every handler is measured without
+changes. The upstream requests are recorded by :func:`dbod.api.client.fetch`,
+labelled with the name of the option of the configuration file which defines
+their URL (e.g. *metadata_url*).
+"""
+
+import ConfigParser
+import tornado.web
+
+from tornado.log import access_log
+
+from dbod.api import process, tracing
+from dbod.api.cache import metadata_cache, instance_id_cache
+from dbod.config import config
+
+# Upper bounds, in seconds, of the buckets of the latency histograms
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Caches whose hits and misses are exposed
+CACHES = (metadata_cache, instance_id_cache)
+
+def format_labels(names, values):
+    """
+    Returns the text representation of a set of labels. In the worker
+    processes it includes the *worker* label, with the task id.
+    """
+    worker = process.task_id()
+    if worker is not None:
+        names = ('worker',) + tuple(names)
+        values = (worker,) + tuple(values)
+    if not names:
+        return ''
+    escaped = (unicode(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+            for value in values)
+    return '{' + ','.join('%s="%s"' % label for label in zip(names, escaped)) + '}'
+
+class Counter(object):
+    """Counter of events, with a value for every combination of *labels*"""
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, values=(), amount=1):
+        """Increments the counter of the label *values*"""
+        self.values[values] = self.values.get(values, 0) + amount
+
+    def render(self):
+        """Returns the lines of the counter in the text format"""
+        lines = ['# HELP %s %s' % (self.name, self.description),
+                 '# TYPE %s counter' % self.name]
+        for values, value in sorted(self.values.items()):
+            lines.append('%s%s %s' % (self.name, format_labels(self.labels, values), value))
+        return lines
+
+class Gauge(object):
+    """Current value of a measure, for every combination of *labels*"""
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+
+    def set(self, values, value):
+        """Sets the value of the label *values*"""
+        self.values[values] = value
+
+    def render(self):
+        """Returns the lines of the gauge in the text format"""
+        lines = ['# HELP %s %s' % (self.name, self.description),
+                 '# TYPE %s gauge' % self.name]
+        for values, value in sorted(self.values.items()):
+            lines.append('%s%s %s' % (self.name, format_labels(self.labels, values), value))
+        return lines
+
+class Histogram(object):
+    """
+    Histogram of durations, with the number of observations lower or equal
+    to every bound of *BUCKETS*, for every combination of *labels*
+    """
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+
+    def observe(self, values, duration):
+        """Records a *duration*, in seconds, for the label *values*"""
+        if values not in self.values:
+            # Observations of every bucket, count and sum
+            self.values[values] = [[0] * len(BUCKETS), 0, 0.0]
+        entry = self.values[values]
+        for i, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                entry[0][i] += 1
+        entry[1] += 1
+        entry[2] += duration
+
+    def render(self):
+        """Returns the lines of the histogram in the text format"""
+        lines = ['# HELP %s %s' % (self.name, self.description),
+                 '# TYPE %s histogram' % self.name]
+        bucket_labels = self.labels + ('le',)
+        for values, (buckets, count, total) in sorted(self.values.items()):
+            for bound, observations in zip(BUCKETS, buckets) + [('+Inf', count)]:
+                lines.append('%s_bucket%s %s' % (self.name,
+                    format_labels(bucket_labels, values + (bound,)), observations))
+            labels = format_labels(self.labels, values)
+            lines.append('%s_sum%s %r' % (self.name, labels, total))
+            lines.append('%s_count%s %s' % (self.name, labels, count))
+        return lines
+
+requests_total = Counter('dbod_api_requests_total',
+        'Requests served, by handler, method and status code',
+        ('handler', 'method', 'code'))
+request_duration = Histogram('dbod_api_request_duration_seconds',
+        'Time to serve a request, by handler and method',
+        ('handler', 'method'))
+upstream_requests_total = Counter('dbod_api_upstream_requests_total',
+        'Requests done to an upstream, by URL option and status code',
+        ('upstream', 'url', 'code'))
+upstream_request_duration = Histogram('dbod_api_upstream_request_duration_seconds',
+        'Time to get the response of an upstream, including the time queued '
+        'waiting for a connection, by URL option',
+        ('upstream', 'url'))
+alias_pool = Gauge('dbod_api_alias_pool_dns_names',
+        'DNS names of the functional aliases pool, by state (free or used), '
+        'as of its last refresh',
+        ('state',))
+
+# Prefixes of the URLs of every upstream, with the name of their option
+_url_options = {}
+
+def url_option(upstream, url):
+    """
+    Returns the name of the option of the *upstream* section of the
+    configuration file which defines *url*, or *other* if there is none. The
+    URLs with parameters (e.g. *{0}*) are matched up to the first one.
+    """
+    if upstream not in _url_options:
+        prefixes = []
+        try:
+            for option, value in config.items(upstream, raw=True):
+                if value.startswith('http'):
+                    prefixes.append((value.split('{')[0].split('?')[0], option))
+        except ConfigParser.NoSectionError:
+            pass
+        # Longest prefixes first, so the most specific one is found
+        _url_options[upstream] = sorted(prefixes, reverse=True)
+    path = url.split('?')[0]
+    for prefix, option in _url_options[upstream]:
+        if path.startswith(prefix):
+            return option
+    return 'other'
+
+def configure():
+    """
+    Forgets the URLs of the upstreams, so they are read again from the
+    configuration file. It is called when the file is reloaded.
+    """
+    _url_options.clear()
+
+def observe_upstream(upstream, option, code, duration):
+    """
+    Records a request done to an upstream, to the URL defined by the
+    configuration *option* (see :func:`url_option`)
+    """
+    upstream_requests_total.inc((upstream, option, str(code)))
+    upstream_request_duration.observe((upstream, option), duration)
+
+def log_request(handler):
+    """
+    Records the metrics of a request served by *handler* and writes it to the
+    access log, as Tornado does by default, along with its trace if it is
+    slow (see :func:`dbod.api.tracing.log_trace`). It is set as the
+    *log_function* of the application.
+    """
+    status = handler.get_status()
+    duration = handler.request.request_time()
+    name = type(handler).__name__
+    requests_total.inc((name, handler.request.method, str(status)))
+    request_duration.observe((name, handler.request.method), duration)
+    if status < 400:
+        log_method = access_log.info
+    elif status < 500:
+        log_method = access_log.warning
+    else:
+        log_method = access_log.error
+    log_method("%d %s %.2fms", status, handler._request_summary(), 1000.0 * duration)
+    tracing.log_trace(handler)
+
+def render():
+    """Returns all the metrics in the Prometheus text format"""
+    lines = []
+    for metric in (requests_total, request_duration,
+            upstream_requests_total, upstream_request_duration, alias_pool):
+        lines.extend(metric.render())
+    for kind in ('hits', 'misses'):
+        counter = Counter('dbod_api_cache_%s_total' % kind, 'Cache %s, by cache' % kind, ('cache',))
+        for cache in CACHES:
+            counter.inc((cache.name,), getattr(cache, kind))
+        lines.extend(counter.render())
+    lines.append('# HELP dbod_api_cache_entries Entries stored, by cache')
+    lines.append('# TYPE dbod_api_cache_entries gauge')
+    for cache in CACHES:
+        lines.append('dbod_api_cache_entries%s %s' % (format_labels(('cache',), (cache.name,)), len(cache)))
+    return '\n'.join(lines) + '\n'
+
+class Metrics(tornado.web.RequestHandler):
+    """
+    This is the handler of **/metrics** endpoint.
+
+    It returns the metrics of the API in the text format read by Prometheus:
+
+    * *dbod_api_requests_total* and *dbod_api_request_duration_seconds* - the
+      requests served, by handler
+    * *dbod_api_upstream_requests_total* and
+      *dbod_api_upstream_request_duration_seconds* - the requests done to
+      PostgREST and Rundeck, by the configuration option of their URL
+    * *dbod_api_cache_hits_total*, *dbod_api_cache_misses_total* and
+      *dbod_api_cache_entries* - the usage of the in-memory caches
+    * *dbod_api_alias_pool_dns_names* - the free and used DNS names of the
+      functional aliases pool
+
+    The metrics are kept by every process since it was started. With several
+    processes, a request to the server port is served by any of them, so
+    every worker also serves its own metrics, labelled with its *worker* id,
+    in the port *metrics_port* + *worker* (*metrics_port* is an option of the
+    *[server]* section).
+    """
+
+    def get(self):
+        """Returns the metrics in the Prometheus text format"""
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.write(render())
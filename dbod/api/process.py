@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015, CERN
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file "LICENSE".
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Process module, to run the API server in several worker processes which
+share the listening sockets.
+
+It works like :func:`tornado.process.fork_processes`, but the parent process
+also forwards the signals it receives to the workers, so the whole server is
+stopped (or reloaded) by signalling only the parent.
+"""
+
+import errno
+import logging
+import os
+import signal
+import sys
+
+from tornado.ioloop import IOLoop
+from tornado.process import cpu_count
+
+# Signals forwarded by the parent process to the workers
+FORWARDED_SIGNALS = (signal.SIGTERM, signal.SIGINT, signal.SIGHUP)
+
+# Signals which stop the server
+STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+_task_id = None
+
+def task_id():
+    """Returns the id of the worker process or *None* if it is not a worker"""
+    return _task_id
+
+def fork_processes(num_processes, max_restarts=100):
+    """
+    Starts *num_processes* worker processes, or one per CPU if it is 0 or
+    negative, and returns in each of them its task id, between 0 and
+    *num_processes* - 1. No IOLoop can be created before calling it.
+
+    The parent process never returns. It restarts the workers which die
+    (killed by a signal or with an exit status other than 0), up to
+    *max_restarts* times, and forwards the *FORWARDED_SIGNALS* to them.
+    After a stop signal the workers are not restarted and the parent exits
+    once all of them have finished.
+
+    :param num_processes: number of worker processes
+    :type num_processes: int
+    :param max_restarts: maximum number of restarts of the workers
+    :type max_restarts: int
+    :rtype: int
+    :raises: RuntimeError - if the workers have been restarted too many times
+    """
+    global _task_id
+    if num_processes is None or num_processes <= 0:
+        num_processes = cpu_count()
+    if IOLoop.initialized():
+        raise RuntimeError("Cannot fork the worker processes after creating the IOLoop")
+    logging.info("Starting %d worker processes", num_processes)
+    parent = os.getpid()
+    children = {}
+    stopping = []
+    # Stop signals received by a worker before resetting the handlers
+    pending = []
+
+    def forward(signum, frame):
+        if os.getpid() != parent:
+            if signum in STOP_SIGNALS:
+                pending.append(signum)
+            return
+        if signum in STOP_SIGNALS:
+            stopping.append(signum)
+        for pid in list(children):
+            try:
+                os.kill(pid, signum)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+    def start_child(i):
+        pid = os.fork()
+        if pid == 0:
+            global _task_id
+            _task_id = i
+            for signum in FORWARDED_SIGNALS:
+                signal.signal(signum, signal.SIG_DFL)
+            for signum in pending:
+                os.kill(os.getpid(), signum)
+            return i
+        children[pid] = i
+        # A stop signal received while forking has not been forwarded to it
+        if stopping:
+            os.kill(pid, stopping[-1])
+        return None
+
+    for signum in FORWARDED_SIGNALS:
+        signal.signal(signum, forward)
+    for i in range(num_processes):
+        id = start_child(i)
+        if id is not None:
+            return id
+    num_restarts = 0
+    while children:
+        try:
+            pid, status = os.wait()
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+        if pid not in children:
+            continue
+        id = children.pop(pid)
+        if os.WIFSIGNALED(status):
+            logging.warning("Worker %d (pid %d) killed by signal %d", id, pid, os.WTERMSIG(status))
+        elif os.WEXITSTATUS(status) != 0:
+            logging.warning("Worker %d (pid %d) exited with status %d", id, pid, os.WEXITSTATUS(status))
+        else:
+            logging.info("Worker %d (pid %d) exited normally", id, pid)
+            continue
+        if stopping:
+            continue
+        num_restarts += 1
+        if num_restarts > max_restarts:
+            raise RuntimeError("Too many worker restarts, giving up")
+        logging.info("Restarting worker %d", id)
+        new_id = start_child(id)
+        if new_id is not None:
+            return new_id
+    sys.exit(0)
@@ -15,47 +15,166 @@ Rundeck module, which includes the rundeck classes and endpoints.
 import tornado.web
 import logging
 import json
-import requests
-import time
+import hashlib
 
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from dbod.api import client
 from dbod.api.base import *
-from dbod.config import config
+from dbod.api.cache import PeriodicCache
+from dbod.config import config, get_option
+
+class ResourcesRenderer(object):
+    """
+    Generates the resources.xml document from the *rundeck_instances* view.
+
+    The instances are requested to PostgREST ordered by name and every node is
+    written with *write* while the response is being received, so the memory
+    used does not depend on the number of instances.
+    """
+
+    def __init__(self, write):
+        self.write = write
+        self.nodes = 0
+        self._previous = None
+
+    @gen.coroutine
+    def render(self):
+        """
+        Writes the whole document
+
+        :raises: HTTPError - when the instances can not be fetched from PostgREST
+        """
+        # Page Header
+        self.write('<?xml version="1.0" encoding="UTF-8"?>')
+        self.write('<project>')
+        try:
+            response = yield client.stream(config.get('postgrest', 'rundeck_resources_url') + '?order=db_name.asc',
+                    self.__on_entry__)
+        except ValueError as e:
+            logging.error("Error reading Rundeck resources: %s", e)
+            raise tornado.web.HTTPError(BAD_GATEWAY)
+        if not response.ok:
+            logging.error("Error fetching Rundeck resources.xml")
+            raise tornado.web.HTTPError(NOT_FOUND)
+        if self._previous:
+            self.__write_node__(self._previous)
+        self.write('</project>')
+        logging.debug("Rundeck resources.xml with %s nodes", self.nodes)
+
+    def __on_entry__(self, entry):
+        """Writes the node of the previous instance once it is complete"""
+        # An instance repeated in consecutive rows is written only once,
+        # with its last values
+        if self._previous and self._previous[u'db_name'] != entry[u'db_name']:
+            self.__write_node__(self._previous)
+        self._previous = entry
+
+    def __write_node__(self, body):
+        """Writes the XML node of an instance"""
+        self.write('<node name="%s" description="" hostname="%s" username="%s" type="%s" subcategory="%s" port="%s" tags="%s"/>' % 
+                ( body.get(u'db_name'), # Name
+                  body.get(u'hostname'),
+                  body.get(u'username'),
+                  body.get(u'category'), 
+                  body.get(u'db_type'), 
+                  body.get(u'port'), 
+                  body.get(u'tags')
+                  ))
+        self.nodes += 1
+
+class ResourcesDocument(PeriodicCache):
+    """
+    Cached resources.xml document, with the ETag of its content.
+
+    It is regenerated in background every *interval* seconds (the
+    *resources_interval* option of the *[cache]* section) and whenever
+    :func:`invalidate` is called after an instance is modified. Meanwhile
+    the previous version keeps being served. An *interval* of 0 disables the
+    cache and the document is generated for every request.
+    """
+
+    def __init__(self, interval):
+        super(ResourcesDocument, self).__init__()
+        self.interval = interval
+
+    def reset(self):
+        """Discards the cached document"""
+        super(ResourcesDocument, self).reset()
+        self.xml = None
+        self.etag = None
+
+    def invalidate(self):
+        """Schedules the regeneration of the document"""
+        super(ResourcesDocument, self).invalidate()
+        if self.interval > 0:
+            IOLoop.current().add_callback(self.refresh)
+
+    @gen.coroutine
+    def load(self):
+        """Generates the document"""
+        chunks = []
+        renderer = ResourcesRenderer(chunks.append)
+        yield renderer.render()
+        self.xml = ''.join(chunks)
+        self.etag = '"%s"' % hashlib.sha1(self.xml).hexdigest()
+        logging.info("Rundeck resources.xml regenerated with %s nodes", renderer.nodes)
 
 class RundeckResources(tornado.web.RequestHandler):
-    """The class of /rundeck/resources.xml"""
+    """
+    The class of /rundeck/resources.xml
+
+    The document is served from the :class:`ResourcesDocument` cache, with
+    its *ETag*, so Rundeck polls get a *304 Not Modified* response while the
+    instances do not change. If the cache is disabled the document is
+    flushed to the client every *FLUSH_SIZE* bytes while it is generated.
+    """
+
+    FLUSH_SIZE = 64 * 1024
+
+    @gen.coroutine
     def get(self):
         """Returns a valid resources.xml file to import target entities in 
             Rundeck"""
-        response = requests.get(config.get('postgrest', 'rundeck_resources_url'))
-        if response.ok:
-            data = json.loads(response.text)
-            d = {}
-            for entry in data:
-                d[entry[u'db_name']] = entry
-            self.set_header('Content-Type', 'text/xml')
-            # Page Header
-            logging.debug('<?xml version="1.0" encoding="UTF-8"?>')
-            self.write('<?xml version="1.0" encoding="UTF-8"?>')
-            logging.debug('<project>')
-            self.write('<project>')
-            for instance in sorted(d.keys()):
-                body = d[instance]
-                text = ('<node name="%s" description="" hostname="%s" username="%s" type="%s" subcategory="%s" port="%s" tags="%s"/>' % 
-                        ( instance, # Name
-                          body.get(u'hostname'),
-                          body.get(u'username'),
-                          body.get(u'category'), 
-                          body.get(u'db_type'), 
-                          body.get(u'port'), 
-                          body.get(u'tags')
-                          ))
-                logging.debug(text)
-                self.write(text)
-            logging.debug('</project>')
-            self.write('</project>')
-        else: 
-            logging.error("Error fetching Rundeck resources.xml")
-            raise tornado.web.HTTPError(NOT_FOUND)
+        self.set_header('Content-Type', 'text/xml')
+        if resources.interval > 0:
+            if resources.xml is None and resources.expired():
+                yield resources.refresh()
+            if resources.xml is None:
+                raise resources.error
+            self.set_header('Etag', resources.etag)
+            if self.check_etag_header():
+                self.set_status(NOT_MODIFIED)
+            else:
+                self.write(resources.xml)
+        else:
+            self._pending = 0
+            # If part of the document was already flushed when an error is
+            # found, the connection is finished without the closing tag, so
+            # Rundeck discards it
+            yield ResourcesRenderer(self.__write__).render()
+
+    def __write__(self, text):
+        """Writes a part of the document, flushing it every *FLUSH_SIZE* bytes"""
+        self.write(text)
+        self._pending += len(text)
+        if self._pending >= self.FLUSH_SIZE:
+            self._pending = 0
+            self.flush()
+
+# Cached resources.xml document
+resources = ResourcesDocument(None)
+
+def configure():
+    """
+    Applies the *resources_interval* option of the *[cache]* section to the
+    cached resources.xml. It is called again when the configuration file is
+    reloaded.
+    """
+    resources.interval = get_option('cache', 'resources_interval', 60)
+
+configure()
             
 class RundeckJobs(tornado.web.RequestHandler):
     """
@@ -68,11 +187,12 @@ class RundeckJobs(tornado.web.RequestHandler):
         You need to be authenticated in order to execute a job.
     """
     @http_basic_auth
+    @gen.coroutine
     def get(self, **args):
         """
         The *GET* method returns the output of a job execution"""
         job = args.get('job')
-        response = self.__get_output__(job)
+        response = yield self.__get_output__(job)
         if response.ok:
             logging.debug("response: " + response.text)
             self.write({'response' : json.loads(response.text)})
@@ -81,6 +201,7 @@ class RundeckJobs(tornado.web.RequestHandler):
             raise tornado.web.HTTPError(response.status_code)
 
     @http_basic_auth
+    @gen.coroutine
     def post(self, **args):
         """
         The *POST* method executes a new Rundeck job and returns the output.
@@ -93,17 +214,19 @@ class RundeckJobs(tornado.web.RequestHandler):
         :type node: str
         :raises: HTTPError - if the job didn't succeed or if the timeout has exceeded or in case of an internal error
 
-        When a job is executed the request call hangs and waits for a response for a maximum time of 10 seconds. The api constantly calls rundeck's api to check if the job has finished. When it finishes it prints out the response or raises an error if it didn't succeed.
+        When a job is executed the request call hangs and waits for a response for a maximum time of *timeout* seconds (as defined in the *rundeck* section of the configuration file). The api calls rundeck's api every half a second to check if the job has finished. When it finishes it prints out the response or raises an error if it didn't succeed.
+
+        The waiting is done without blocking the server, so other requests (including other job executions) are served in the meantime.
         """
         job = args.get('job')
         node = args.get('node')
-        response_run = self.__run_job__(job, node)
+        response_run = yield self.__run_job__(job, node)
         if response_run.ok:
             data = json.loads(response_run.text)
             exid = str(data["id"])
             timeout = int(config.get('rundeck', 'timeout')) * 2
             while timeout > 0:
-                response_output = self.__get_output__(exid)
+                response_output = yield self.__get_output__(exid)
                 if response_output.ok:
                     output = json.loads(response_output.text)
                     if output["execCompleted"]:
@@ -116,7 +239,7 @@ class RundeckJobs(tornado.web.RequestHandler):
                             raise tornado.web.HTTPError(BAD_GATEWAY)
                     else:
                         timeout -= 1
-                        time.sleep(0.500)
+                        yield gen.sleep(0.500)
                 else:
                     logging.error("Error reading the job from Rundeck: " + response_output.text)
                     raise tornado.web.HTTPError(response_output.status_code)
@@ -127,14 +250,14 @@ class RundeckJobs(tornado.web.RequestHandler):
     def __get_output__(self, execution):
         """Returns the output of a job execution"""
         api_job_output = config.get('rundeck', 'api_job_output').format(execution)
-        return requests.get(api_job_output, headers={'Authorization': config.get('rundeck', 'api_authorization')}, verify=False)
+        return client.get(api_job_output, headers={'Authorization': config.get('rundeck', 'api_authorization')}, validate_cert=False, upstream=client.RUNDECK)
             
     def __run_job__(self, job, node):
         """Executes a new Rundeck job and returns the output"""
         jobid = config.get('rundeck-jobs', job)
         if jobid:
             run_job_url = config.get('rundeck', 'api_run_job').format(jobid)
-            return requests.post(run_job_url, headers={'Authorization': config.get('rundeck', 'api_authorization')}, verify=False, data = {'filter':'name: ' + node})
+            return client.post(run_job_url, headers={'Authorization': config.get('rundeck', 'api_authorization')}, validate_cert=False, upstream=client.RUNDECK, data = {'filter':'name: ' + node})
         
         
         
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015, CERN
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file "LICENSE".
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Tracing module, which records the requests done to PostgREST and Rundeck
+while serving every request of the API.
+
+The :class:`Tracer` wraps the application and runs every request inside a
+:class:`tornado.stack_context.StackContext`, which makes its :class:`Trace`
+the current one in all the callbacks of the request. The requests done by
+:func:`dbod.api.client.fetch` are recorded in the current trace and:
+
+* they are returned to the client in a *Server-Timing* header, with the
+  name of the option of their URL, the method, the status code and the
+  duration in milliseconds. Only the requests done before the headers are
+  sent (e.g. before the first flush of a streamed response) are included
+* if the request takes longer than the *slow_request* option of the
+  *[logging]* section (in seconds), the trace is logged as a JSON document
+"""
+
+import contextlib
+import functools
+import json
+import logging
+import time
+
+from tornado import httputil
+from tornado.stack_context import StackContext
+
+from dbod.config import get_option
+
+# Trace of the request being executed
+_current = None
+
+class Trace(object):
+    """
+    Upstream requests (spans) done while serving a request. Only the first
+    *MAX_SPANS* are kept.
+    """
+
+    MAX_SPANS = 100
+
+    def __init__(self):
+        self.start = time.time()
+        self.spans = []
+        self.dropped = 0
+
+    def add(self, upstream, option, method, code, start, duration):
+        """Records an upstream request"""
+        if len(self.spans) >= self.MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append({
+            'upstream': upstream,
+            'url': option,
+            'method': method,
+            'status': code,
+            'start': round(start - self.start, 6),
+            'duration': round(duration, 6),
+            })
+
+    def server_timing(self):
+        """Returns the value of the *Server-Timing* header"""
+        return ', '.join('%s;desc="%s %s";dur=%.2f' % (span['url'], span['method'],
+            span['status'], span['duration'] * 1000) for span in self.spans)
+
+def current():
+    """Returns the :class:`Trace` of the request being executed or *None*"""
+    return _current
+
+def record(upstream, option, method, code, start, duration):
+    """Records an upstream request in the current trace, if there is one"""
+    if _current is not None:
+        _current.add(upstream, option, method, code, start, duration)
+
+@contextlib.contextmanager
+def _activate(trace):
+    """Makes *trace* the current one while a callback of its request runs"""
+    global _current
+    previous, _current = _current, trace
+    try:
+        yield
+    finally:
+        _current = previous
+
+def log_trace(handler):
+    """
+    Logs the trace of the request served by *handler* if it has taken longer
+    than the *slow_request* option of the *[logging]* section
+    """
+    threshold = get_option('logging', 'slow_request', 0.0)
+    trace = current()
+    duration = handler.request.request_time()
+    if trace is None or threshold <= 0 or duration < threshold:
+        return
+    logging.warning("Slow request: %s", json.dumps({
+        'request': handler.request.method + ' ' + handler.request.uri,
+        'handler': type(handler).__name__,
+        'status': handler.get_status(),
+        'duration': round(duration, 6),
+        'spans': trace.spans,
+        'dropped': trace.dropped,
+        }))
+
+class _TracedConnection(object):
+    """
+    Connection of a traced request, which adds the *Server-Timing* header to
+    the response and reports when it is finished. Everything else is
+    delegated to the actual connection.
+    """
+
+    def __init__(self, connection, trace, on_finish):
+        self._connection = connection
+        self._trace = trace
+        self._on_finish = on_finish
+
+    def write_headers(self, start_line, headers, chunk=None, callback=None):
+        if self._trace.spans:
+            headers.add('Server-Timing', self._trace.server_timing())
+        return self._connection.write_headers(start_line, headers, chunk, callback)
+
+    def finish(self):
+        self._connection.finish()
+        self._on_finish()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+class _TracedRequest(httputil.HTTPMessageDelegate):
+    """
+    Runs every step of the request handling with its trace as the current
+    one, and keeps the count of requests in progress of the :class:`Tracer`
+    """
+
+    def __init__(self, tracer, trace):
+        self._tracer = tracer
+        self._trace = trace
+        self._context = functools.partial(_activate, trace)
+        self._active = False
+        self.delegate = None
+
+    def headers_received(self, start_line, headers):
+        # The request starts now, the connection may have been idle before
+        self._trace.start = time.time()
+        self._active = True
+        self._tracer.active += 1
+        with StackContext(self._context):
+            return self.delegate.headers_received(start_line, headers)
+
+    def data_received(self, chunk):
+        with StackContext(self._context):
+            return self.delegate.data_received(chunk)
+
+    def finish(self):
+        with StackContext(self._context):
+            return self.delegate.finish()
+
+    def on_connection_close(self):
+        try:
+            with StackContext(self._context):
+                return self.delegate.on_connection_close()
+        finally:
+            self.done()
+
+    def done(self):
+        """Marks the request as no longer in progress"""
+        if self._active:
+            self._active = False
+            self._tracer.active -= 1
+
+class Tracer(httputil.HTTPServerConnectionDelegate):
+    """
+    Wraps a :class:`tornado.web.Application` to create a new :class:`Trace`
+    for every request. It is given to the HTTP server instead of the
+    application.
+
+    It also keeps in *active* the number of requests in progress, whose
+    headers have been received but whose response has not been finished,
+    so they can be waited for when the server is stopped.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.active = 0
+
+    def start_request(self, server_conn, request_conn):
+        trace = Trace()
+        request = _TracedRequest(self, trace)
+        connection = _TracedConnection(request_conn, trace, request.done)
+        request.delegate = self.application.start_request(server_conn, connection)
+        return request
+
+    def on_close(self, server_conn):
+        self.application.on_close(server_conn)
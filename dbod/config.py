@@ -13,6 +13,7 @@ Configuration module, which reads and parses the configuration file.
 """
 
 import ConfigParser
+import logging
 import sys, traceback
 import argparse
 
@@ -45,17 +46,40 @@ optionalConfig = {
                   }
 
 
+def get_option(section, option, default=None):
+    """
+    Returns the value of an optional field of the configuration file, 
+    converted to the type of the *default* value, or *default* if the
+    field is not defined.
+    """
+    if not config.has_option(section, option):
+        return default
+    if isinstance(default, bool):
+        return config.getboolean(section, option)
+    if isinstance(default, int):
+        return config.getint(section, option)
+    if isinstance(default, float):
+        return config.getfloat(section, option)
+    return config.get(section, option)
+
+def arguments():
+    """
+    Parses the command line arguments, ignoring the unknown ones
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+            "-c", "--config", default="/etc/dbod/api.cfg", 
+            help = "specify the location of the config file"
+            )
+    args, unk = parser.parse_known_args()
+    return args
+
 def load( config_file = None ):
     """
     Reads configuration file
     """
     try:
-        parser = argparse.ArgumentParser()
-        parser.add_argument(
-                "-c", "--config", default="/etc/dbod/api.cfg", 
-                help = "specify the location of the config file"
-                )
-        args, unk = parser.parse_known_args()
+        args = arguments()
 
         # Load configuration from file
         config = ConfigParser.ConfigParser()
@@ -88,6 +112,45 @@ def load( config_file = None ):
         traceback.print_exc(file=sys.stdout)
         sys.exit(e.code)
 
+def reload( config_file = None ):
+    """
+    Reads again the configuration file and replaces the contents of *config*
+    with it, so the modules which imported it see the new values. If the file
+    cannot be read or a required field is missing, the error is logged and
+    the current configuration is kept.
+
+    :param config_file: path of the file, by default the one given with *-c*
+    :type config_file: str
+    :rtype: bool - True if the configuration has been replaced
+    """
+    path = config_file or arguments().config
+    new_config = ConfigParser.ConfigParser()
+    new_config.add_section('tornado')
+    new_config.set('tornado', 'debug', 'false')
+    try:
+        if len(new_config.read(path)) != 1:
+            logging.error("Configuration file '%s' cannot be read, keeping the current one", path)
+            return False
+    except ConfigParser.Error as e:
+        logging.error("Error parsing configuration file '%s', keeping the current one: %s", path, e)
+        return False
+    for section, options in requiredConfig.items():
+        for option in options:
+            if not new_config.has_option(section, option):
+                logging.error("Option '%s' not present in section %s of '%s', keeping the current configuration",
+                        option, section, path)
+                return False
+    for section in config.sections():
+        config.remove_section(section)
+    config.defaults().clear()
+    config.defaults().update(new_config.defaults())
+    for section in new_config.sections():
+        config.add_section(section)
+        for option in new_config.options(section):
+            config.set(section, option, new_config.get(section, option, raw=True))
+    logging.info("Configuration reloaded from '%s'", path)
+    return True
+
 # Loads config
 config = load()
 
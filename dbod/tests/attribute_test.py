@@ -13,12 +13,16 @@ import json
 import urllib
 import logging
 import base64
+import requests
 
+from mock import patch, MagicMock
+from tornado import gen
 from tornado.testing import AsyncHTTPTestCase
 from tornado.testing import get_unused_port
 from timeout_decorator import timeout
 
 from dbod.api.api import *
+from dbod.api.cache import instance_id_cache
 
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 
@@ -260,4 +264,54 @@ class AttributeTest(AsyncHTTPTestCase):
         response = self.fetch("/api/v1/instance/testdb/attribute/port", method='DELETE', headers={'Authorization': self.authentication})
         self.assertEquals(response.code, 404)
 
-    
\ No newline at end of file
+    
+
+    @patch('dbod.api.metadata.views.url', None)
+    @patch('dbod.api.attribute.client.post')
+    def test_set_attributes(self, mock_post):
+        """Set attributes of many instances in one request"""
+        result = [{"instance": "dbod01", "name": "port", "value": "5501", "status": 200},
+                  {"instance": "dbod01", "name": None, "value": "5501", "status": 400},
+                  {"instance": "invalid", "name": "port", "value": "5501", "status": 404}]
+        mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                            ok=True,
+                                                            status_code=200,
+                                                            json=lambda: [{"set_attributes": result}]))
+        attributes = [{"instance": "dbod01", "name": "port", "value": "5501"},
+                      {"instance": "dbod01", "name": None, "value": "5501"},
+                      {"instance": "invalid", "name": "port", "value": "5501"}]
+        response = self.fetch("/api/v1/instance/attribute", method='PUT', headers={'Authorization': self.authentication}, body=json.dumps(attributes))
+        self.assertEquals(response.code, 200)
+        self.assertEquals(json.loads(response.body)["response"], result)
+        self.assertEquals(mock_post.call_count, 1)
+        self.assertEquals(mock_post.call_args[1]['json'], {'attributes': attributes})
+
+    def test_set_attributes_invalid(self):
+        """Set attributes of many instances with a wrong request body"""
+        response = self.fetch("/api/v1/instance/attribute", method='PUT', headers={'Authorization': self.authentication}, body='{"port": "5501"}')
+        self.assertEquals(response.code, 400)
+        response = self.fetch("/api/v1/instance/attribute", method='PUT', headers={'Authorization': self.authentication}, body='[{"instance": ')
+        self.assertEquals(response.code, 400)
+        response = self.fetch("/api/v1/instance/attribute", method='GET')
+        self.assertEquals(response.code, 405)
+
+    @patch('dbod.api.attribute.client.get')
+    def test_get_attribute_outdated_id(self, mock_get):
+        """Get an attribute of an instance whose cached id is outdated"""
+        def get(url):
+            if 'instance_id=eq.42' in url:
+                data = [{"value": "5501"}]
+            elif 'db_name=eq.' in url:
+                data = [{"id": 42}]
+            else:
+                data = []
+            return gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                              ok=True,
+                                              status_code=200,
+                                              json=lambda: data))
+        mock_get.side_effect = get
+        instance_id_cache.set('renamed', 7)
+        response = self.fetch("/api/v1/instance/renamed/attribute/port")
+        self.assertEquals(response.code, 200)
+        self.assertEquals(response.body, "5501")
+        self.assertEquals(instance_id_cache.get('renamed'), 42)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015, CERN
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file "COPYING".
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import requests
+
+from mock import patch, MagicMock
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+
+from dbod.api.base import get_instance_id_by_name
+from dbod.api.cache import instance_id_cache
+
+class InstanceIdTest(AsyncTestCase):
+    """Class to test the resolution of instance ids"""
+
+    def setUp(self):
+        super(InstanceIdTest, self).setUp()
+        instance_id_cache.invalidate()
+
+    @patch('dbod.api.base.client.get')
+    @gen_test
+    def test_cached_id(self, mock_get):
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=True,
+                                                           status_code=200,
+                                                           json=lambda: [{"id": 42}]))
+        entid = yield get_instance_id_by_name('dbod42')
+        self.assertEquals(entid, 42)
+        entid = yield get_instance_id_by_name('dbod42')
+        self.assertEquals(entid, 42)
+        self.assertEquals(mock_get.call_count, 1)
+
+        instance_id_cache.invalidate('dbod42')
+        yield get_instance_id_by_name('dbod42')
+        self.assertEquals(mock_get.call_count, 2)
+
+    @patch('dbod.api.base.client.get')
+    @gen_test
+    def test_uncached_id(self, mock_get):
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=True,
+                                                           status_code=200,
+                                                           json=lambda: [{"id": 42}]))
+        instance_id_cache.set('dbod42', 7)
+        entid = yield get_instance_id_by_name('dbod42', cached=False)
+        self.assertEquals(entid, 42)
+        self.assertEquals(mock_get.call_count, 1)
+        self.assertEquals(instance_id_cache.get('dbod42'), 42)
+
+    @patch('dbod.api.base.client.get')
+    @gen_test
+    def test_not_existing(self, mock_get):
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=True,
+                                                           status_code=200,
+                                                           json=lambda: []))
+        entid = yield get_instance_id_by_name('none')
+        self.assertIsNone(entid)
+        self.assertEquals(len(instance_id_cache), 0)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015, CERN
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file "COPYING".
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import unittest
+import tornado.web
+
+from mock import patch
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.testing import AsyncTestCase, gen_test
+
+from dbod.api.cache import Cache, PeriodicCache
+
+class CacheTest(unittest.TestCase):
+    """Class to test the in-memory cache"""
+
+    def test_hit_and_miss(self):
+        cache = Cache('test', 10, 60)
+        self.assertEquals(cache.get('key'), None)
+        cache.set('key', 'value')
+        self.assertEquals(cache.get('key'), 'value')
+        self.assertEquals(cache.hits, 1)
+        self.assertEquals(cache.misses, 1)
+
+    @patch('dbod.api.cache.time.time')
+    def test_expiration(self, mock_time):
+        cache = Cache('test', 10, 60)
+        mock_time.return_value = 1000
+        cache.set('key', 'value')
+        mock_time.return_value = 1059
+        self.assertEquals(cache.get('key'), 'value')
+        mock_time.return_value = 1061
+        self.assertEquals(cache.get('key'), None)
+        self.assertEquals(len(cache), 0)
+
+    def test_lru_eviction(self):
+        cache = Cache('test', 2, 60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # 'a' becomes the most recently used entry
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEquals(len(cache), 2)
+        self.assertEquals(cache.get('b'), None)
+        self.assertEquals(cache.get('a'), 1)
+        self.assertEquals(cache.get('c'), 3)
+
+    def test_invalidate(self):
+        cache = Cache('test', 10, 60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.invalidate('a')
+        self.assertEquals(cache.get('a'), None)
+        self.assertEquals(cache.get('b'), 2)
+        cache.invalidate()
+        self.assertEquals(len(cache), 0)
+
+    def test_disabled(self):
+        cache = Cache('test', 0, 60)
+        cache.set('a', 1)
+        self.assertEquals(cache.get('a'), None)
+
+    def test_resize(self):
+        cache = Cache('test', 10, 60)
+        for key in 'abc':
+            cache.set(key, key)
+        cache.get('a')
+        cache.resize(2, 30)
+        # The least recently used entry is evicted
+        self.assertEquals(cache.get('b'), None)
+        self.assertEquals(cache.get('a'), 'a')
+        self.assertEquals(cache.ttl, 30)
+        cache.resize(0, 30)
+        self.assertEquals(len(cache), 0)
+
+class Counter(PeriodicCache):
+    """Periodic cache which counts its loads, each one waiting for *gate*"""
+
+    interval = 60
+
+    def __init__(self):
+        super(Counter, self).__init__()
+        self.loads = 0
+        self.gate = None
+        self.fail = False
+
+    @gen.coroutine
+    def load(self):
+        if self.gate:
+            yield self.gate
+        if self.fail:
+            raise tornado.web.HTTPError(502)
+        self.loads += 1
+
+class PeriodicCacheTest(AsyncTestCase):
+    """Class to test the periodically refreshed caches"""
+
+    @gen_test
+    def test_single_flight(self):
+        counter = Counter()
+        counter.gate = Future()
+        first = counter.refresh()
+        self.assertIs(counter.refresh(), first)
+        self.assertTrue(counter.expired())
+        counter.gate.set_result(None)
+        yield first
+        self.assertEquals(counter.loads, 1)
+        self.assertFalse(counter.expired())
+
+    @gen_test
+    def test_invalidate_while_loading(self):
+        counter = Counter()
+        counter.gate = Future()
+        refreshing = counter.refresh()
+        counter.invalidate()
+        counter.gate.set_result(None)
+        yield refreshing
+        # The data may not include the change, so it is loaded again
+        self.assertEquals(counter.loads, 2)
+        self.assertFalse(counter.expired())
+        counter.invalidate()
+        self.assertTrue(counter.expired())
+
+    @gen_test
+    def test_error(self):
+        counter = Counter()
+        yield counter.refresh()
+        counter.invalidate()
+        counter.fail = True
+        yield counter.refresh()
+        self.assertEquals(counter.error.status_code, 502)
+        self.assertEquals(counter.loads, 1)
+        # It is not loaded again on request until the retry delay passes
+        self.assertFalse(counter.expired())
+        counter.failed -= counter.RETRY_DELAY
+        self.assertTrue(counter.expired())
+        counter.fail = False
+        yield counter.refresh()
+        self.assertIsNone(counter.error)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015, CERN
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file "COPYING".
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import unittest
+import tornado.web
+
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from dbod.api import client
+
+class EchoHandler(tornado.web.RequestHandler):
+    def post(self):
+        self.write({'method': self.request.method, 'body': self.request.body})
+
+class ClientTest(AsyncHTTPTestCase):
+    """Class to test the pooled HTTP client"""
+
+    def get_app(self):
+        return tornado.web.Application([(r"/echo", EchoHandler)])
+
+    def tearDown(self):
+        client.close()
+        super(ClientTest, self).tearDown()
+
+    def test_client_per_upstream(self):
+        postgrest = client.get_client(client.POSTGREST)
+        rundeck = client.get_client(client.RUNDECK)
+        self.assertIs(client.get_client(), postgrest)
+        self.assertIsNot(postgrest, rundeck)
+        self.assertIs(postgrest.io_loop, self.io_loop)
+        self.assertEquals(postgrest.max_clients, 20)
+        self.assertEquals(rundeck.max_clients, 4)
+        self.assertEquals(rundeck.defaults['request_timeout'], 30)
+
+    @gen_test
+    def test_fetch_json(self):
+        response = yield client.post(self.get_url('/echo'), json={'key': 'value'})
+        self.assertTrue(response.ok)
+        self.assertEquals(response.json()['body'], '{"key": "value"}')
+
+    @gen_test
+    def test_connection_error(self):
+        response = yield client.get('http://localhost:1/')
+        self.assertFalse(response.ok)
+        self.assertEquals(response.status_code, 502)
+
+class JSONStreamTest(unittest.TestCase):
+    """Class to test the incremental JSON array decoder"""
+
+    def test_feed_chunks(self):
+        text = ' [{"a": 1, "b": "x,]"} ,\n{"a": [2]}, {"c": "\u00e9"}] '
+        stream = client.JSONStream()
+        elements = []
+        for char in text:
+            elements.extend(stream.feed(char))
+        stream.close()
+        self.assertEquals(elements, [{'a': 1, 'b': 'x,]'}, {'a': [2]}, {'c': u'\xe9'}])
+
+    def test_empty_array(self):
+        stream = client.JSONStream()
+        self.assertEquals(stream.feed('[]'), [])
+        stream.close()
+
+    def test_incomplete(self):
+        stream = client.JSONStream()
+        self.assertEquals(stream.feed('[{"a": 1}, {"a"'), [{'a': 1}])
+        self.assertRaises(ValueError, stream.close)
+
+    def test_not_an_array(self):
+        stream = client.JSONStream()
+        self.assertRaises(ValueError, stream.feed, '{"message": "error"}')
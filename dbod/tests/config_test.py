@@ -9,10 +9,12 @@
 # or submit itself to any jurisdiction.
 
 import logging
+import os
+import tempfile
 import unittest
 import sys
 
-from dbod.config import load
+from dbod.config import config, load, reload
 
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 
@@ -34,3 +36,33 @@ class ConfigTest(unittest.TestCase):
             config = load('/tmp/api_missing_option.cfg')
         self.assertEqual(cm.exception.code, 2)
 
+class ConfigReloadTest(unittest.TestCase):
+    """Test configuration reloading"""
+
+    def setUp(self):
+        # Copy of the current configuration, restored after every test
+        fd, self.original = tempfile.mkstemp(suffix='.cfg')
+        with os.fdopen(fd, 'w') as config_file:
+            config.write(config_file)
+
+    def tearDown(self):
+        reload(self.original)
+        os.unlink(self.original)
+
+    def test_reload(self):
+        with open(self.original) as config_file:
+            content = config_file.read()
+        fd, path = tempfile.mkstemp(suffix='.cfg')
+        try:
+            with os.fdopen(fd, 'w') as config_file:
+                config_file.write(content.replace('[api]\n', '[api]\nreloaded = yes\n'))
+            self.assertTrue(reload(path))
+            self.assertEqual(config.get('api', 'reloaded'), 'yes')
+        finally:
+            os.unlink(path)
+
+    def test_reload_invalid_file(self):
+        port = config.get('server', 'port')
+        self.assertFalse(reload('/path/to/unexisting/file'))
+        self.assertFalse(reload('/tmp/api_missing_option.cfg'))
+        self.assertEqual(config.get('server', 'port'), port)
@@ -108,6 +108,7 @@ CREATE TABLE public.volume (
     mounting_path varchar(256) NOT NULL,
     PRIMARY KEY (id)
 );
+CREATE INDEX volume_instance_id_idx ON public.volume (instance_id);
 
 -- HOST
 CREATE TABLE public.host (
@@ -137,6 +138,13 @@ CREATE TABLE public.functional_aliases (
     CONSTRAINT db_name_con UNIQUE (db_name)
 );
 
+-- Free dns_names of the pool, in the order they are assigned
+CREATE INDEX functional_aliases_free_idx ON public.functional_aliases (dns_name)
+  WHERE db_name IS NULL AND alias IS NULL;
+
+-- Aliases, to find their instance
+CREATE INDEX functional_aliases_alias_idx ON public.functional_aliases (alias);
+
 -- FIM TABLE
 CREATE TABLE public.fim_data (
     internal_id character varying(36) NOT NULL,
@@ -322,21 +330,208 @@ SELECT * FROM public.attribute;
 CREATE VIEW api.host AS
 SELECT * FROM public.host;
 
+-- Create instance function
+-- Inserts an instance along with its volumes and attributes in a single
+-- transaction and returns the id of the new instance. The instance fields
+-- are the columns of the api.instance view.
+CREATE OR REPLACE FUNCTION api.create_instance(instance JSON, volumes JSON DEFAULT '[]', attributes JSON DEFAULT '{}')
+RETURNS INTEGER AS $$
+DECLARE
+  inst_id INTEGER;
+  columns TEXT;
+BEGIN
+  SELECT string_agg(quote_ident(k.name), ',') FROM json_object_keys(instance) AS k(name) INTO columns;
+  EXECUTE format('INSERT INTO api.instance (%s) SELECT %s FROM json_populate_record(NULL::api.instance, $1) RETURNING id', columns, columns)
+    USING instance INTO inst_id;
+  INSERT INTO public.volume (instance_id, file_mode, owner, "group", server, mount_options, mounting_path)
+    SELECT inst_id, v.file_mode, v.owner, v."group", v.server, v.mount_options, v.mounting_path
+    FROM json_populate_recordset(NULL::public.volume, volumes) v;
+  INSERT INTO public.attribute (instance_id, name, value)
+    SELECT inst_id, a.key, a.value
+    FROM json_each_text(attributes) a;
+  RETURN inst_id;
+END
+$$ LANGUAGE plpgsql;
+
+-- Update instance function
+-- Applies the changes of an instance, its volumes and its attributes in a
+-- single transaction and returns the id of the instance, or NULL if it does
+-- not exist. Only the given arguments are changed:
+--   * instance: fields of the api.instance view to update
+--   * volumes: the new list of volumes, matched by mounting path
+--   * attributes: the new set of attributes, matched by name
+-- Only the rows which are different are written.
+CREATE OR REPLACE FUNCTION api.update_instance(inst_name VARCHAR, instance JSON DEFAULT NULL, volumes JSON DEFAULT NULL, attributes JSON DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+  inst_id INTEGER;
+  old_values TEXT;
+  new_values TEXT;
+  assignments TEXT;
+BEGIN
+  SELECT id INTO inst_id FROM public.dod_instances WHERE db_name = inst_name;
+  IF inst_id IS NULL THEN
+    RETURN NULL;
+  END IF;
+  -- The instances are read through a foreign table, which can not be locked
+  -- with FOR UPDATE, so the concurrent changes of an instance are serialized
+  -- with an advisory lock on its id. It may have been renamed or deleted
+  -- while waiting for it.
+  PERFORM pg_advisory_xact_lock(hashtext('public.dod_instances'), inst_id);
+  IF NOT EXISTS (SELECT 1 FROM public.dod_instances WHERE id = inst_id AND db_name = inst_name) THEN
+    RETURN NULL;
+  END IF;
+
+  IF volumes IS NOT NULL THEN
+    DELETE FROM public.volume V
+      WHERE V.instance_id = inst_id
+      AND NOT EXISTS (SELECT 1 FROM json_populate_recordset(NULL::public.volume, volumes) n
+                      WHERE n.mounting_path = V.mounting_path);
+    UPDATE public.volume V
+      SET file_mode = n.file_mode, owner = n.owner, "group" = n."group", server = n.server, mount_options = n.mount_options
+      FROM json_populate_recordset(NULL::public.volume, volumes) n
+      WHERE V.instance_id = inst_id AND V.mounting_path = n.mounting_path
+      AND (V.file_mode, V.owner, V."group", V.server, V.mount_options) IS DISTINCT FROM
+          (n.file_mode, n.owner, n."group", n.server, n.mount_options);
+    INSERT INTO public.volume (instance_id, file_mode, owner, "group", server, mount_options, mounting_path)
+      SELECT inst_id, n.file_mode, n.owner, n."group", n.server, n.mount_options, n.mounting_path
+      FROM json_populate_recordset(NULL::public.volume, volumes) n
+      WHERE NOT EXISTS (SELECT 1 FROM public.volume V
+                        WHERE V.instance_id = inst_id AND V.mounting_path = n.mounting_path);
+  END IF;
+
+  IF attributes IS NOT NULL THEN
+    DELETE FROM public.attribute A
+      WHERE A.instance_id = inst_id
+      AND NOT EXISTS (SELECT 1 FROM json_each_text(attributes) n WHERE n.key = A.name);
+    UPDATE public.attribute A
+      SET value = n.value
+      FROM json_each_text(attributes) n
+      WHERE A.instance_id = inst_id AND A.name = n.key AND A.value IS DISTINCT FROM n.value;
+    INSERT INTO public.attribute (instance_id, name, value)
+      SELECT inst_id, n.key, n.value
+      FROM json_each_text(attributes) n
+      WHERE NOT EXISTS (SELECT 1 FROM public.attribute A WHERE A.instance_id = inst_id AND A.name = n.key);
+  END IF;
+
+  IF instance IS NOT NULL THEN
+    SELECT string_agg(format('%I = r.%I', k.name, k.name), ','),
+           string_agg(format('I.%I', k.name), ','),
+           string_agg(format('r.%I', k.name), ',')
+      FROM json_object_keys(instance) AS k(name) INTO assignments, old_values, new_values;
+    IF assignments IS NOT NULL THEN
+      EXECUTE format('UPDATE api.instance I SET %s FROM json_populate_record(NULL::api.instance, $1) r WHERE I.id = $2 AND ROW(%s) IS DISTINCT FROM ROW(%s)',
+                     assignments, old_values, new_values)
+        USING instance, inst_id;
+    END IF;
+  END IF;
+
+  RETURN inst_id;
+END
+$$ LANGUAGE plpgsql;
+
+-- Set attributes function
+-- Sets a list of attributes of any number of instances in a single
+-- transaction. Every attribute is an object with "instance", "name" and
+-- "value" keys: it is created if it does not exist and updated otherwise.
+-- If the same attribute is given more than once, the last value is set.
+-- Returns the list of attributes with the status of each one: 201 if it has
+-- been created, 200 if it has been updated (or it already had the value),
+-- 400 if the name or the value are missing or too long and 404 if the
+-- instance does not exist. The invalid attributes do not abort the rest.
+CREATE OR REPLACE FUNCTION api.set_attributes(attributes JSON)
+RETURNS JSON AS $$
+DECLARE
+  result JSON;
+BEGIN
+  -- The instances are read through a foreign table, which can not be locked
+  -- with FOR UPDATE, so the concurrent changes of their attributes are
+  -- serialized with advisory locks on their ids, taken in order
+  PERFORM pg_advisory_xact_lock(hashtext('public.dod_instances'), I.id)
+    FROM (SELECT DISTINCT I.id FROM public.dod_instances I
+          WHERE I.db_name IN (SELECT e->>'instance' FROM json_array_elements(attributes) e)
+          ORDER BY I.id) I;
+
+  WITH items AS (
+    SELECT e.position, e.item->>'instance' instance, e.item->>'name' name, e.item->>'value' value, I.id instance_id,
+           -- Sizes of the name and value columns of public.attribute
+           coalesce(length(e.item->>'name') <= 32 AND length(e.item->>'value') <= 250, FALSE) valid
+    FROM json_array_elements(attributes) WITH ORDINALITY AS e(item, position)
+    LEFT JOIN public.dod_instances I ON I.db_name = e.item->>'instance'
+  ),
+  last_items AS (
+    SELECT DISTINCT ON (instance_id, name) *,
+           NOT EXISTS (SELECT 1 FROM public.attribute A WHERE A.instance_id = items.instance_id AND A.name = items.name) AS created
+    FROM items
+    WHERE instance_id IS NOT NULL AND valid
+    ORDER BY instance_id, name, position DESC
+  ),
+  upserted AS (
+    INSERT INTO public.attribute AS A (instance_id, name, value)
+      SELECT L.instance_id, L.name, L.value
+      FROM last_items L
+      ON CONFLICT (instance_id, name) DO UPDATE
+      SET value = EXCLUDED.value
+      WHERE A.value IS DISTINCT FROM EXCLUDED.value
+  )
+  SELECT json_agg(json_build_object('instance', items.instance, 'name', items.name, 'value', items.value,
+                    'status', CASE WHEN NOT items.valid THEN 400
+                                   WHEN items.instance_id IS NULL THEN 404
+                                   WHEN L.created THEN 201
+                                   ELSE 200 END)
+                  ORDER BY items.position)
+    FROM items LEFT JOIN last_items L ON L.instance_id = items.instance_id AND L.name = items.name
+    INTO result;
+  RETURN result;
+END
+$$ LANGUAGE plpgsql;
+
 -- Metadata View
 CREATE OR REPLACE VIEW api.metadata AS
 SELECT 
-    id, 
-    username, 
-    db_name, 
-    category "class", 
-    db_type, 
-    version, 
-    string_to_array(dod_instances.host::text, ','::text) AS hosts, 
-    api.get_attributes(id) attributes,
-    public.get_attribute('port', id) port, 
-    get_volumes volumes, 
+    i.id, 
+    i.username, 
+    i.db_name, 
+    i.category "class", 
+    i.db_type, 
+    i.version, 
+    string_to_array(i.host::text, ','::text) AS hosts, 
+    a.attributes,
+    a.port, 
+    v.volumes, 
     d.*
-FROM public.dod_instances, public.get_volumes(id), public.get_directories(db_name, db_type, version, public.get_attribute('port', id)) d;
+FROM public.dod_instances i
+CROSS JOIN LATERAL (
+    SELECT json_object_agg(name, value) attributes,
+           (max(value) FILTER (WHERE name = 'port'))::VARCHAR port
+    FROM public.attribute
+    WHERE instance_id = i.id) a
+CROSS JOIN LATERAL (
+    SELECT COALESCE(array_agg(row_to_json(volume) ORDER BY volume.id), '{}') volumes
+    FROM public.volume
+    WHERE instance_id = i.id) v
+CROSS JOIN LATERAL (
+    SELECT
+      (CASE WHEN i.db_type = 'MYSQL' THEN '/usr/local/mysql/mysql-' || i.version
+            WHEN i.db_type = 'PG' THEN '/usr/local/pgsql/pgsql-' || i.version
+            WHEN i.db_type = 'InfluxDB' THEN '/usr/local/influxdb/influxdb-' || i.version
+            ELSE '/ORA/dbs01/oracle/product/rdbms' END)::VARCHAR basedir,
+      (CASE WHEN i.db_type = 'MYSQL' THEN '/usr/local/mysql/mysql-' || i.version || '/bin'
+            WHEN i.db_type = 'PG' THEN '/usr/local/pgsql/pgsql-' || i.version || '/bin'
+            WHEN i.db_type = 'InfluxDB' THEN '/usr/local/influxdb/influxdb-' || i.version || '/bin'
+            ELSE '/ORA/dbs01/oracle/product/rdbms' END)::VARCHAR bindir,
+      (CASE WHEN i.db_type = 'MYSQL' THEN '/ORA/dbs03/' || upper(i.db_name) || '/mysql'
+            WHEN i.db_type = 'PG' THEN '/ORA/dbs03/' || upper(i.db_name) || '/data'
+            ELSE '/ORA/dbs03/' || upper(i.db_name) END)::VARCHAR datadir,
+      (CASE WHEN i.db_type = 'MYSQL' THEN '/ORA/dbs02/' || upper(i.db_name) || '/mysql'
+            WHEN i.db_type = 'PG' THEN '/ORA/dbs02/' || upper(i.db_name) || '/pg_xlog'
+            ELSE '/ORA/dbs02/' || upper(i.db_name) END)::VARCHAR logdir,
+      (CASE WHEN i.db_type = 'MYSQL' THEN '/var/lib/mysql/mysql.sock.' || lower(i.db_name) || '.' || a.port
+            WHEN i.db_type IN ('PG', 'InfluxDB') THEN '/var/lib/pgsql/'
+            ELSE '/ORA/dbs01/oracle/product/rdbms/network/admin' END)::VARCHAR socket
+    -- Like public.get_directories, there are no directories (nor metadata)
+    -- for other types of instances
+    WHERE i.db_type IN ('MYSQL', 'PG', 'InfluxDB', 'ORACLE', 'ORA')) d;
 
 -- Rundeck instances View
 CREATE OR REPLACE VIEW api.rundeck_instances AS
@@ -350,6 +545,190 @@ SELECT public.dod_instances.db_name,
 FROM public.dod_instances JOIN public.functional_aliases ON
 public.dod_instances.db_name = public.functional_aliases.db_name;
 
+-- Materialized views
+CREATE MATERIALIZED VIEW public.metadata_mv AS
+SELECT * FROM api.metadata;
+CREATE UNIQUE INDEX metadata_mv_id_idx ON public.metadata_mv (id);
+CREATE INDEX metadata_mv_db_name_idx ON public.metadata_mv (db_name);
+CREATE INDEX metadata_mv_hosts_idx ON public.metadata_mv USING gin (hosts);
+
+-- The production schema allows more than one functional alias per instance,
+-- so a single row (with the first alias) is kept for every instance, as
+-- required by the unique index of the concurrent refresh
+CREATE MATERIALIZED VIEW public.rundeck_instances_mv AS
+SELECT DISTINCT ON (db_name) * FROM api.rundeck_instances
+ORDER BY db_name, hostname;
+CREATE UNIQUE INDEX rundeck_instances_mv_db_name_idx ON public.rundeck_instances_mv (db_name);
+
+-- Views used by PostgREST, which does not expose materialized views
+CREATE OR REPLACE VIEW api.materialized_metadata AS
+SELECT * FROM public.metadata_mv;
+
+CREATE OR REPLACE VIEW api.materialized_rundeck_instances AS
+SELECT * FROM public.rundeck_instances_mv;
+
+-- Version of the data of the materialized views
+-- Every change takes a new value of the metadata_version sequence, which
+-- does not lock any row, and refreshed_version is the value included in the
+-- last refresh. The transactions changing the tables hold a shared advisory
+-- lock until they finish, so refresh_metadata can wait for them before
+-- reading the sequence.
+CREATE SEQUENCE public.metadata_version;
+CREATE TABLE public.metadata_refresh (
+    refreshed_version bigint NOT NULL,
+    refreshed timestamp with time zone NOT NULL
+);
+INSERT INTO public.metadata_refresh (refreshed_version, refreshed)
+VALUES (0, now());
+
+-- Metadata changed trigger function
+CREATE OR REPLACE FUNCTION public.metadata_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_advisory_xact_lock_shared(hashtext('public.metadata_version'));
+  PERFORM nextval('public.metadata_version');
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER metadata_changed AFTER INSERT OR UPDATE OR DELETE
+ON public.dod_instances FOR EACH STATEMENT EXECUTE PROCEDURE public.metadata_changed();
+CREATE TRIGGER metadata_changed AFTER INSERT OR UPDATE OR DELETE
+ON public.attribute FOR EACH STATEMENT EXECUTE PROCEDURE public.metadata_changed();
+CREATE TRIGGER metadata_changed AFTER INSERT OR UPDATE OR DELETE
+ON public.volume FOR EACH STATEMENT EXECUTE PROCEDURE public.metadata_changed();
+CREATE TRIGGER metadata_changed AFTER INSERT OR UPDATE OR DELETE
+ON public.functional_aliases FOR EACH STATEMENT EXECUTE PROCEDURE public.metadata_changed();
+
+-- Refresh metadata function
+-- Refreshes the materialized views if the tables have changed since the last
+-- refresh or if it is older than max_age seconds (0 forces the refresh).
+-- Returns true if the views have been refreshed, and false if they were up
+-- to date. Concurrent calls wait for the running refresh, which usually
+-- leaves the views up to date for them.
+CREATE OR REPLACE FUNCTION api.refresh_metadata(max_age INTEGER)
+RETURNS BOOLEAN AS $$
+DECLARE
+  current_version BIGINT;
+  outdated BOOLEAN;
+BEGIN
+  PERFORM pg_advisory_xact_lock(hashtext('api.refresh_metadata'));
+  -- The values of the sequence taken by the transactions still changing the
+  -- tables would be recorded as refreshed without their changes, so they
+  -- are waited for. The lock is released at once, not to block the writers
+  -- during the refresh.
+  PERFORM pg_advisory_lock(hashtext('public.metadata_version'));
+  SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM public.metadata_version
+  INTO current_version;
+  PERFORM pg_advisory_unlock(hashtext('public.metadata_version'));
+  SELECT current_version > refreshed_version OR refreshed <= now() - max_age * interval '1 second'
+  FROM public.metadata_refresh INTO outdated;
+  IF NOT outdated THEN
+    RETURN FALSE;
+  END IF;
+  -- The changes committed before this point are included in the refresh
+  REFRESH MATERIALIZED VIEW CONCURRENTLY public.metadata_mv;
+  REFRESH MATERIALIZED VIEW CONCURRENTLY public.rundeck_instances_mv;
+  UPDATE public.metadata_refresh SET refreshed_version = current_version, refreshed = now();
+  RETURN TRUE;
+END
+$$ LANGUAGE plpgsql;
+
+-- Claim functional alias function
+-- Assigns the first free dns_name of the pool to an instance and its alias
+-- and returns it, or NULL if the instance already has an alias or there is
+-- none available. The free dns_names being claimed by concurrent calls are
+-- skipped instead of waited for, so the calls do not serialize on the same
+-- row. Only the concurrent calls for the same instance wait for each other,
+-- as there is no unique constraint on db_name.
+CREATE OR REPLACE FUNCTION api.claim_functional_alias(db_name VARCHAR, alias VARCHAR)
+RETURNS VARCHAR AS $$
+DECLARE
+  claimed VARCHAR;
+BEGIN
+  PERFORM pg_advisory_xact_lock(hashtext('public.functional_aliases'), hashtext(claim_functional_alias.db_name));
+  IF EXISTS (SELECT 1 FROM public.functional_aliases F WHERE F.db_name = claim_functional_alias.db_name) THEN
+    RETURN NULL;
+  END IF;
+  UPDATE public.functional_aliases F
+    SET db_name = claim_functional_alias.db_name, alias = claim_functional_alias.alias
+    WHERE F.dns_name = (
+      SELECT P.dns_name FROM public.functional_aliases P
+        WHERE P.db_name IS NULL AND P.alias IS NULL
+        ORDER BY P.dns_name
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED)
+    RETURNING F.dns_name INTO claimed;
+  RETURN claimed;
+END
+$$ LANGUAGE plpgsql;
+
+-- Claim functional aliases function
+-- Assigns a free dns_name of the pool to every object of a list with
+-- "db_name" and "alias" keys, in the order they are given. Returns the list
+-- with the dns_name and the status of each one: 201 if it has been assigned,
+-- 400 if the db_name or the alias are missing or longer than their columns,
+-- 409 if the instance already has an alias (or it is repeated in the list)
+-- and 503 if there are no free dns_names left. The invalid items do not abort
+-- the rest. The free dns_names being claimed by concurrent calls are
+-- skipped, and the concurrent calls for the same instances wait for each
+-- other, like in claim_functional_alias.
+CREATE OR REPLACE FUNCTION api.claim_functional_aliases(aliases JSON)
+RETURNS JSON AS $$
+DECLARE
+  result JSON;
+BEGIN
+  PERFORM pg_advisory_xact_lock(hashtext('public.functional_aliases'), hashtext(db_name))
+    FROM (SELECT DISTINCT e.item->>'db_name' db_name
+          FROM json_array_elements(aliases) AS e(item)
+          WHERE e.item->>'db_name' IS NOT NULL
+          ORDER BY 1) names;
+  WITH items AS (
+    SELECT e.position, e.item->>'db_name' db_name, e.item->>'alias' alias,
+           coalesce(length(e.item->>'db_name') <= 8 AND length(e.item->>'alias') <= 256, FALSE) valid
+    FROM json_array_elements(aliases) WITH ORDINALITY AS e(item, position)
+  ),
+  valid AS (
+    SELECT row_number() OVER (ORDER BY position) n, *
+    FROM (
+      SELECT DISTINCT ON (I.db_name) I.position, I.db_name, I.alias
+      FROM items I
+      WHERE I.valid
+        AND NOT EXISTS (SELECT 1 FROM public.functional_aliases F WHERE F.db_name = I.db_name)
+      ORDER BY I.db_name, I.position
+    ) first_items
+  ),
+  free AS (
+    SELECT row_number() OVER (ORDER BY dns_name) n, dns_name
+    FROM (
+      SELECT P.dns_name FROM public.functional_aliases P
+        WHERE P.db_name IS NULL AND P.alias IS NULL
+        ORDER BY P.dns_name
+        LIMIT (SELECT count(*) FROM valid)
+        FOR UPDATE SKIP LOCKED
+    ) free_rows
+  ),
+  claimed AS (
+    UPDATE public.functional_aliases F
+      SET db_name = V.db_name, alias = V.alias
+      FROM valid V JOIN free ON free.n = V.n
+      WHERE F.dns_name = free.dns_name
+      RETURNING V.position, F.dns_name
+  )
+  SELECT json_agg(json_build_object('db_name', I.db_name, 'alias', I.alias, 'dns_name', C.dns_name,
+                    'status', CASE WHEN C.dns_name IS NOT NULL THEN 201
+                                   WHEN NOT I.valid THEN 400
+                                   WHEN V.position IS NULL THEN 409
+                                   ELSE 503 END)
+                  ORDER BY I.position)
+    FROM items I
+    LEFT JOIN valid V ON V.position = I.position
+    LEFT JOIN claimed C ON C.position = I.position
+    INTO result;
+  RETURN result;
+END
+$$ LANGUAGE plpgsql;
+
 -- Host aliases View
 CREATE OR REPLACE VIEW api.host_aliases AS
 SELECT host, string_agg('dbod-' || db_name || 'domain', E',') aliases 
@@ -361,6 +740,49 @@ CREATE OR REPLACE VIEW api.functional_aliases AS
 SELECT * 
 FROM functional_aliases;
 
+-- Number of dns_names of the pool
+-- It only changes when dns_names are added to or removed from the pool, not
+-- when they are claimed or released, so keeping it in a single row does not
+-- serialize the claims.
+CREATE TABLE public.functional_aliases_total (
+    total bigint NOT NULL
+);
+INSERT INTO public.functional_aliases_total (total)
+SELECT count(*) FROM public.functional_aliases;
+
+-- Functional aliases total trigger function
+CREATE OR REPLACE FUNCTION public.functional_aliases_counted()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    UPDATE public.functional_aliases_total SET total = total + 1;
+  ELSIF TG_OP = 'DELETE' THEN
+    UPDATE public.functional_aliases_total SET total = total - 1;
+  ELSE
+    UPDATE public.functional_aliases_total SET total = 0;
+  END IF;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER functional_aliases_counted AFTER INSERT OR DELETE
+ON public.functional_aliases FOR EACH ROW EXECUTE PROCEDURE public.functional_aliases_counted();
+CREATE TRIGGER functional_aliases_truncated AFTER TRUNCATE
+ON public.functional_aliases FOR EACH STATEMENT EXECUTE PROCEDURE public.functional_aliases_counted();
+
+-- Functional aliases pool view
+-- The free dns_names are counted with an index-only scan of their partial
+-- index, which gets smaller as the pool runs out, and the total is read from
+-- functional_aliases_total instead of scanning the table. OFFSET 0 keeps the
+-- count from being computed twice.
+CREATE OR REPLACE VIEW api.functional_aliases_pool AS
+SELECT free, total - free used, total
+FROM (
+  SELECT (SELECT count(*) FROM public.functional_aliases WHERE db_name IS NULL AND alias IS NULL) free,
+         (SELECT total FROM public.functional_aliases_total) total
+  OFFSET 0
+) counts;
+
 -- Fim data view
 CREATE OR REPLACE VIEW api.fim_data AS
 SELECT 
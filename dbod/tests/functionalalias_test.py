@@ -17,10 +17,13 @@ import tornado.web
 
 from mock import patch
 from mock import MagicMock
+from tornado import gen
 from tornado.testing import AsyncHTTPTestCase
 from timeout_decorator import timeout
 
+from dbod.api import metrics
 from dbod.api.api import handlers
+from dbod.api.functionalalias import pool
 from dbod.config import config
 
 class FunctionalAliasTest(AsyncHTTPTestCase, unittest.TestCase):
@@ -62,19 +65,63 @@ class FunctionalAliasTest(AsyncHTTPTestCase, unittest.TestCase):
         self.assertEquals(response.headers['Content-Type'], 'text/html; charset=UTF-8')
 
     @timeout(5)
-    @patch('dbod.api.functionalalias.requests.get')
+    @patch('dbod.api.functionalalias.client.get')
     def test_get_bad_response(self, mock_get):
         """test when the get response code is not 200. Server/api error"""
         print "test_get_bad_response"
         status_code_test = 503
-        mock_get.return_value = MagicMock(spec=requests.models.Response, 
-                                          ok=False,
-                                          status_code=status_code_test)
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response, 
+                                                           ok=False,
+                                                           status_code=status_code_test))
         db_name = 'dbod01'
         response = self.fetch("/api/v1/instance/alias/%s" %(db_name))
         self.assertEquals(response.code, status_code_test)
         self.assertEquals(response.headers['Content-Type'], 'text/html; charset=UTF-8')
 
+    @timeout(5)
+    def test_get_by_dns_name(self):
+        """test the lookup of the instance of a dns_name"""
+        print "test_get_by_dns_name"
+        response = self.fetch("/api/v1/instance/alias?dns_name=db-dbod-dns01")
+        self.assertEquals(response.code, 200)
+        data = json.loads(response.body)["response"]
+        self.assertEquals(len(data), 1)
+        self.assertEquals(data[0]["db_name"], "dbod01")
+        self.assertEquals(data[0]["alias"], "dbod-dbod-01.cern.ch")
+
+    @timeout(5)
+    def test_get_by_alias(self):
+        """test the lookup of the instance of an alias"""
+        print "test_get_by_alias"
+        response = self.fetch("/api/v1/instance/alias?alias=dbod-dbod-01.cern.ch")
+        self.assertEquals(response.code, 200)
+        data = json.loads(response.body)["response"]
+        self.assertEquals(len(data), 1)
+        self.assertEquals(data[0]["db_name"], "dbod01")
+        self.assertEquals(data[0]["dns_name"], "db-dbod-dns01")
+
+    @timeout(5)
+    @patch('dbod.api.functionalalias.client.get')
+    def test_get_by_alias_not_found(self, mock_get):
+        """test the lookup of an alias which is not assigned"""
+        print "test_get_by_alias_not_found"
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=True,
+                                                           status_code=200,
+                                                           json=lambda: []))
+        response = self.fetch("/api/v1/instance/alias?alias=invalid.cern.ch")
+        self.assertEquals(response.code, 404)
+        url = mock_get.call_args[0][0]
+        self.assertTrue('?alias=eq.invalid.cern.ch&' in url)
+
+    @timeout(5)
+    def test_get_lookup_invalid_arguments(self):
+        """test the lookup without exactly one of the dns_name or alias arguments"""
+        print "test_get_lookup_invalid_arguments"
+        for query in ('', '?db_name=dbod01', '?dns_name=db-dbod-dns01&alias=dbod-dbod-01.cern.ch'):
+            response = self.fetch("/api/v1/instance/alias" + query)
+            self.assertEquals(response.code, 400)
+
     @timeout(5)
     def test_novalid_db(self):
         """test when the given db does not exist"""
@@ -158,14 +205,14 @@ class FunctionalAliasTest(AsyncHTTPTestCase, unittest.TestCase):
         self.assertEquals(response.code, 400)
     
     @timeout(5)
-    @patch('dbod.api.functionalalias.requests.get')
-    def test_post_nextdns_failure(self, mock_get):
-        """test when there is a server error when getting an available dns_name"""
+    @patch('dbod.api.functionalalias.client.post')
+    def test_post_nextdns_failure(self, mock_post):
+        """test when there is a server error when claiming an available dns_name"""
         print "test_post_nextdns_failure"
         status_code_test = 503
-        mock_get.return_value = MagicMock(spec=requests.models.Response, 
-                                          ok=False,
-                                          status_code=status_code_test)
+        mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response, 
+                                                           ok=False,
+                                                           status_code=status_code_test))
         
         body = 'alias=%s' + self.alias_test
         response = self.fetch("/api/v1/instance/alias/%s" %(self.db_name_test), 
@@ -204,14 +251,14 @@ class FunctionalAliasTest(AsyncHTTPTestCase, unittest.TestCase):
         self.assertEquals(response.code, 400)
 
     @timeout(5)
-    @patch('dbod.api.functionalalias.requests.get')
+    @patch('dbod.api.functionalalias.client.get')
     def test_delete_getdns_failure(self, mock_get):
         """test an unsuccessful get of the dns_name"""
         print "test_delete_getdns_failure"
         status_code_test = 503
-        mock_get.return_value = MagicMock(spec=requests.models.Response,
-                                          ok=False,
-                                          status_code=status_code_test)
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=False,
+                                                           status_code=status_code_test))
         response = self.fetch("/api/v1/instance/alias/%s" %('dbod01'),
                               headers={'Authorization': self.authentication},
                               method="DELETE")
@@ -219,15 +266,117 @@ class FunctionalAliasTest(AsyncHTTPTestCase, unittest.TestCase):
         self.assertEquals(response.code, 503)
 
     @timeout(5)
-    @patch('dbod.api.functionalalias.requests.patch')
+    @patch('dbod.api.functionalalias.client.patch')
     def test_delete_nosuccess(self, mock_patch):
         """test an unsuccessful deletion"""
         print "test_delete_nosuccess_delete"
         status_code_test = 503
-        mock_patch.return_value = MagicMock(spec=requests.models.Response,
-                                            ok=False,
-                                            status_code=status_code_test) 
+        mock_patch.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                             ok=False,
+                                                             status_code=status_code_test)) 
         response = self.fetch("/api/v1/instance/alias/%s" %('dbod01'),
                               headers={'Authorization': self.authentication},
                               method="DELETE")
         self.assertEquals(response.code, status_code_test)
+
+    @timeout(5)
+    @patch('dbod.api.functionalalias.client.post')
+    def test_post_aliases(self, mock_post):
+        """test the assignment of the aliases of many instances in one request"""
+        print "test_post_aliases"
+        result = [{"db_name": "dbod42", "alias": "dbod-dbod-42.cern.ch", "dns_name": "db-dbod-dns05", "status": 201},
+                  {"db_name": "dbod01", "alias": "dbod-dbod-01.cern.ch", "dns_name": None, "status": 409}]
+        mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                            ok=True,
+                                                            status_code=200,
+                                                            json=lambda: [{"claim_functional_aliases": result}]))
+        aliases = [{"db_name": "dbod42", "alias": "dbod-dbod-42.cern.ch"},
+                   {"db_name": "dbod01", "alias": "dbod-dbod-01.cern.ch"}]
+        response = self.fetch("/api/v1/instance/alias",
+                              method="POST",
+                              headers={'Authorization': self.authentication},
+                              body=json.dumps(aliases))
+        self.assertEquals(response.code, 200)
+        self.assertEquals(json.loads(response.body)["response"], result)
+        self.assertEquals(mock_post.call_args[1]["json"], {"aliases": aliases})
+
+    @timeout(5)
+    def test_post_aliases_invalid(self):
+        """test the assignment of many aliases with a wrong request body"""
+        print "test_post_aliases_invalid"
+        for body in ('alias=' + self.alias_test, '[]', '{"db_name": "dbod42"}'):
+            response = self.fetch("/api/v1/instance/alias/",
+                                  method="POST",
+                                  headers={'Authorization': self.authentication},
+                                  body=body)
+            self.assertEquals(response.code, 400)
+        # Only the GET and POST methods are allowed without a database name
+        response = self.fetch("/api/v1/instance/alias",
+                              headers={'Authorization': self.authentication},
+                              method="DELETE")
+        self.assertEquals(response.code, 405)
+
+    @timeout(5)
+    @patch('dbod.api.functionalalias.logging')
+    @patch('dbod.api.functionalalias.client.get')
+    def test_get_pool(self, mock_get, mock_logging):
+        """test the cached status of the dns_names pool"""
+        print "test_get_pool"
+        status = {"free": 1, "used": 4, "total": 5}
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=True,
+                                                           status_code=200,
+                                                           json=lambda: [status]))
+        pool.reset()
+        for _ in range(2):
+            response = self.fetch("/api/v1/alias/pool")
+            self.assertEquals(response.code, 200)
+            self.assertEquals(json.loads(response.body)["response"], status)
+        self.assertEquals(mock_get.call_count, 1)
+        self.assertEquals(metrics.alias_pool.values[('free',)], 1)
+        self.assertEquals(metrics.alias_pool.values[('used',)], 4)
+        # Less free dns_names than the alias_pool_low option
+        self.assertTrue(mock_logging.warning.called)
+        # Any change of the aliases invalidates the cached status
+        with patch('dbod.api.functionalalias.client.post') as mock_post:
+            mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                                ok=False,
+                                                                status_code=503))
+            self.fetch("/api/v1/instance/alias/%s" %(self.db_name_test),
+                       method="POST",
+                       headers={'Authorization': self.authentication},
+                       body='alias=' + self.alias_test)
+        self.fetch("/api/v1/alias/pool")
+        self.assertEquals(mock_get.call_count, 2)
+
+    @timeout(5)
+    @patch('dbod.api.functionalalias.client.get')
+    def test_get_pool_failure(self, mock_get):
+        """test when the status of the dns_names pool cannot be read"""
+        print "test_get_pool_failure"
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=False,
+                                                           status_code=503))
+        pool.reset()
+        response = self.fetch("/api/v1/alias/pool")
+        self.assertEquals(response.code, 503)
+
+    @timeout(5)
+    @patch('dbod.api.functionalalias.client.get')
+    def test_get_pool_stale(self, mock_get):
+        """test that the last status of the pool is served if it cannot be refreshed"""
+        print "test_get_pool_stale"
+        status = {"free": 1, "used": 4, "total": 5}
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=True,
+                                                           json=lambda: [status]))
+        pool.reset()
+        self.fetch("/api/v1/alias/pool")
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=False,
+                                                           status_code=503))
+        pool.invalidate()
+        response = self.fetch("/api/v1/alias/pool")
+        self.assertEquals(response.code, 200)
+        self.assertEquals(json.loads(response.body)["response"], status)
+        self.assertEquals(response.headers['Warning'], '110 - "Response is Stale"')
@@ -17,6 +17,7 @@ import tornado.web
 
 from mock import patch
 from mock import MagicMock
+from tornado import gen
 from tornado.testing import AsyncHTTPTestCase
 from timeout_decorator import timeout
 
@@ -35,7 +36,7 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         return tornado.web.Application(handlers)
 
     @timeout(5)
-    @patch('dbod.api.host.requests.get')
+    @patch('dbod.api.host.client.get')
     @patch('dbod.api.host.json.dumps')
     @patch('dbod.api.host.Host.write')
     def test_get_valid_name(self, mock_write, mock_json, mock_get):
@@ -43,10 +44,10 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
     	print "test_get_valid_name"
         status_code_test = 200
         response_output = [{u'memory': 512}]
-        mock_get.return_value = MagicMock(spec=requests.models.Response,
-                                          ok=True,
-                                          status_code=status_code_test,
-                                          content=response_output)
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=True,
+                                                           status_code=status_code_test,
+                                                           content=response_output))
         #mock_get.json.return_value.content = response_output
         #mock_json.return_value = MagicMock(content=[{"memory": 512}])
         response = self.fetch("/api/v1/host/names/host42")
@@ -62,11 +63,11 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
 
             def json(self):
                 return self.json_data
-        return MockResponse(True,200,[])
+        return gen.maybe_future(MockResponse(True,200,[]))
 
 
     @timeout(5)
-    @patch('dbod.api.host.requests.get', side_effect=empty_json)
+    @patch('dbod.api.host.client.get', side_effect=empty_json)
     def test_get_empty(self, mock_get):
         """test when the response of the request is empty"""
         print "test_get_empty"
@@ -75,22 +76,22 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         self.assertEquals(response.code, 404)
     
     @timeout(5)
-    @patch('dbod.api.host.requests.get')
+    @patch('dbod.api.host.client.get')
     def test_get_notexist(self, mock_get):
         """test when the given name does not exist"""
         print "test_get_notexist"
         
         status_code_test_error = 502
         response_output = [{u'memory': 512}]
-        mock_get.return_value = MagicMock(spec=requests.models.Response,
-                                          ok=False,
-                                          status_code=status_code_test_error,
-                                          content=response_output)
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=False,
+                                                           status_code=status_code_test_error,
+                                                           content=response_output))
         response = self.fetch("/api/v1/host/names/host42")
         self.assertEquals(response.code, status_code_test_error)
     
     @timeout(5)
-    @patch('dbod.api.host.requests.post')
+    @patch('dbod.api.host.client.post')
     def test_post_valid(self, mock_post):
         """test when the post request is valid"""
         print "test_post_valid"
@@ -98,9 +99,9 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         status_code_test = 201
         memory_test = '512'
         body_test = 'memory=' + memory_test
-        mock_post.return_value = MagicMock(spec=requests.models.Response,
-                                          ok=True,
-                                          status_code=status_code_test)
+        mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=True,
+                                                           status_code=status_code_test))
 
         response = self.fetch("/api/v1/host/names/host42", 
                               method="POST", 
@@ -109,7 +110,7 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         self.assertEquals(response.code, status_code_test)
    
     @timeout(5)
-    @patch('dbod.api.host.requests.post')
+    @patch('dbod.api.host.client.post')
     def test_post_duplicate(self, mock_post):
         """test when the post request tries to insert a duplicate entry"""
         print "test_post_duplicate"
@@ -117,9 +118,9 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         status_code_test_error = 409
         memory_test = '512'
         body_test = 'memory=' + memory_test
-        mock_post.return_value = MagicMock(spec=requests.models.Response,
-                                          ok=False,
-                                          status_code=status_code_test_error)
+        mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=False,
+                                                           status_code=status_code_test_error))
 
         response = self.fetch("/api/v1/host/names/host42", 
                               method="POST", 
@@ -128,7 +129,7 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         self.assertEquals(response.code, status_code_test_error)
 
     @timeout(5)
-    @patch('dbod.api.host.requests.post')
+    @patch('dbod.api.host.client.post')
     def test_post_wrongargument(self, mock_post):
         """test when the argument in the body of post request is wrong"""
         print "test_post_duplicate"
@@ -136,8 +137,8 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         status_code_test_error = 400
         memory_test = '512'
         body_test = 'something=' + memory_test
-        mock_post.return_value = MagicMock(spec=requests.models.Response,
-                                           status_code=status_code_test_error)
+        mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                            status_code=status_code_test_error))
 
         response = self.fetch("/api/v1/host/names/host42", 
                               method="POST", 
@@ -146,7 +147,7 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         self.assertEquals(response.code, status_code_test_error)
     
     @timeout(5)
-    @patch('dbod.api.host.requests.post')
+    @patch('dbod.api.host.client.post')
     def test_post_badargument(self, mock_post):
         """test when the value of the argument of post request is string"""
         print "test_post_badargument"
@@ -154,8 +155,8 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         status_code_test_error = 400
         memory_test = 'forty-two'
         body_test = 'memory=' + memory_test
-        mock_post.return_value = MagicMock(spec=requests.models.Response,
-                                           status_code=status_code_test_error)
+        mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                            status_code=status_code_test_error))
 
         response = self.fetch("/api/v1/host/names/host42", 
                               method="POST", 
@@ -164,7 +165,7 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         self.assertEquals(response.code, status_code_test_error)
 
     @timeout(5)
-    @patch('dbod.api.host.requests.patch')
+    @patch('dbod.api.host.client.patch')
     def test_put_valid(self, mock_patch):
         """test when the put request is valid"""
         print "test_put_valid"
@@ -172,9 +173,9 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         status_code_test = 200
         memory_test = '42'
         body_test = 'memory=' + memory_test
-        mock_patch.return_value = MagicMock(spec=requests.models.Response,
-                                          ok=True,
-                                          status_code=status_code_test)
+        mock_patch.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=True,
+                                                           status_code=status_code_test))
 
         response = self.fetch("/api/v1/host/names/host42", 
                               method="PUT", 
@@ -184,7 +185,7 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         self.assertEquals(response.code, status_code_test)
 
     @timeout(5)
-    @patch('dbod.api.host.requests.patch')
+    @patch('dbod.api.host.client.patch')
     def test_put_notexist(self, mock_patch):
         """test when the name to update with put request does not exist"""
         print "test_put_notexist"
@@ -192,9 +193,9 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         status_code_test_error = 404
         memory_test = '512'
         body_test = 'memory=' + memory_test
-        mock_patch.return_value = MagicMock(spec=requests.models.Response,
-                                          ok=False,
-                                          status_code=status_code_test_error)
+        mock_patch.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=False,
+                                                           status_code=status_code_test_error))
 
         response = self.fetch("/api/v1/host/names/host42", 
                               method="PUT", 
@@ -205,7 +206,7 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
 
 
     @timeout(5)
-    @patch('dbod.api.host.requests.patch')
+    @patch('dbod.api.host.client.patch')
     def test_put_wrongargument(self, mock_patch):
         """test when the argument in the body of put request is wrong"""
         print "test_put_wrongargument"
@@ -213,8 +214,8 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         status_code_test_error = 400
         memory_test = '42'
         body_test = 'something=' + memory_test
-        mock_patch.return_value = MagicMock(spec=requests.models.Response,
-                                          status_code=status_code_test_error)
+        mock_patch.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           status_code=status_code_test_error))
 
         response = self.fetch("/api/v1/host/names/host42", 
                               method="PUT", 
@@ -224,7 +225,7 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         self.assertEquals(response.code, status_code_test_error)
     
     @timeout(5)
-    @patch('dbod.api.host.requests.patch')
+    @patch('dbod.api.host.client.patch')
     def test_put_badargument(self, mock_patch):
         """test when the value of the argument of put request is string"""
         print "test_put_badargument"
@@ -232,8 +233,8 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         status_code_test_error = 400
         memory_test = 'forty-two'
         body_test = 'memory=' + memory_test
-        mock_patch.return_value = MagicMock(spec=requests.models.Response,
-                                          status_code=status_code_test_error)
+        mock_patch.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           status_code=status_code_test_error))
 
         response = self.fetch("/api/v1/host/names/host42", 
                               method="PUT", 
@@ -243,7 +244,7 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         self.assertEquals(response.code, status_code_test_error)
     
     @timeout(5)
-    @patch('dbod.api.host.requests.delete')
+    @patch('dbod.api.host.client.delete')
     def test_delete_valid(self, mock_delete):
         """test when the delete request is valid"""
         print "test_delete_valid"
@@ -251,9 +252,9 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         status_code_test = 200
         memory_test = '512'
         body_test = 'memory=' + memory_test
-        mock_delete.return_value = MagicMock(spec=requests.models.Response,
-                                             ok=True,
-                                             status_code=status_code_test)
+        mock_delete.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                              ok=True,
+                                                              status_code=status_code_test))
 
         response = self.fetch("/api/v1/host/names/host42", 
                               method="DELETE", 
@@ -261,7 +262,7 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         self.assertEquals(response.code, status_code_test)
 
     @timeout(5)
-    @patch('dbod.api.host.requests.delete')
+    @patch('dbod.api.host.client.delete')
     def test_delete_notexist(self, mock_delete):
         """test when the name to delete with delete request does not exist"""
         print "test_delete_notexist"
@@ -269,9 +270,9 @@ class HostTest(AsyncHTTPTestCase, unittest.TestCase):
         status_code_test_error = 404
         memory_test = '512'
         body_test = 'memory=' + memory_test
-        mock_delete.return_value = MagicMock(spec=requests.models.Response,
-                                          ok=False,
-                                          status_code=status_code_test_error)
+        mock_delete.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=False,
+                                                           status_code=status_code_test_error))
 
         response = self.fetch("/api/v1/host/names/host42", 
                               method="DELETE", 
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015, CERN
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file "COPYING".
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import json
+import unittest
+import requests
+import tornado.web
+
+from mock import patch
+from mock import MagicMock
+from tornado import gen
+from tornado.testing import AsyncHTTPTestCase
+from timeout_decorator import timeout
+
+from dbod.api.api import handlers
+from dbod.api.hostaliases import host_aliases
+
+HOSTS = [{"host": "host02", "aliases": ["dbod-dbod02.cern.ch"]},
+         {"host": "host01", "aliases": ["dbod-dbod01.cern.ch", "dbod-dbod03.cern.ch"]}]
+
+def mock_response(ok=True, status_code=200, data=HOSTS):
+    return gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                      ok=ok,
+                                      status_code=status_code,
+                                      json=lambda: data))
+
+class HostAliasesTest(AsyncHTTPTestCase, unittest.TestCase):
+    """Class for testing the host aliases endpoint and its cache"""
+
+    def get_app(self):
+        return tornado.web.Application(handlers)
+
+    def setUp(self):
+        super(HostAliasesTest, self).setUp()
+        host_aliases.reset()
+
+    @timeout(5)
+    @patch('dbod.api.hostaliases.client.get')
+    def test_get_cached(self, mock_get):
+        """test that the aliases of all the hosts are read once"""
+        mock_get.return_value = mock_response()
+        response = self.fetch("/api/v1/host/aliases/host01")
+        self.assertEquals(response.code, 200)
+        self.assertEquals(json.loads(response.body)["response"], [HOSTS[1]])
+        response = self.fetch("/api/v1/host/aliases")
+        self.assertEquals(response.code, 200)
+        self.assertEquals(json.loads(response.body)["response"], [HOSTS[1], HOSTS[0]])
+        self.assertEquals(self.fetch("/api/v1/host/aliases/host42").code, 404)
+        self.assertEquals(mock_get.call_count, 1)
+        self.assertFalse('?' in mock_get.call_args[0][0])
+
+    @timeout(5)
+    @patch('dbod.api.hostaliases.client.get')
+    def test_get_invalidated(self, mock_get):
+        """test that the aliases are read again after a change of the instances"""
+        mock_get.return_value = mock_response()
+        self.fetch("/api/v1/host/aliases/host01")
+        host_aliases.invalidate()
+        self.fetch("/api/v1/host/aliases/host01")
+        self.assertEquals(mock_get.call_count, 2)
+
+    @timeout(5)
+    @patch('dbod.api.hostaliases.client.get')
+    def test_get_stale(self, mock_get):
+        """test that the previous aliases are served if they cannot be refreshed"""
+        mock_get.return_value = mock_response()
+        self.fetch("/api/v1/host/aliases")
+        host_aliases.invalidate()
+        mock_get.return_value = mock_response(ok=False, status_code=502)
+        response = self.fetch("/api/v1/host/aliases/host02")
+        self.assertEquals(response.code, 200)
+        self.assertEquals(json.loads(response.body)["response"], [HOSTS[0]])
+        self.assertTrue(response.headers['Warning'].startswith('110'))
+
+    @timeout(5)
+    @patch('dbod.api.hostaliases.client.get')
+    def test_get_failure(self, mock_get):
+        """test when the aliases cannot be read"""
+        mock_get.return_value = mock_response(ok=False, status_code=502)
+        self.assertEquals(self.fetch("/api/v1/host/aliases/host01").code, 502)
+        # The aliases are not requested again until the retry delay passes
+        self.assertEquals(self.fetch("/api/v1/host/aliases/host01").code, 502)
+        self.assertEquals(mock_get.call_count, 1)
+
+    @timeout(5)
+    @patch('dbod.api.hostaliases.get_option', return_value=0)
+    @patch('dbod.api.hostaliases.client.get')
+    def test_get_not_cached(self, mock_get, mock_option):
+        """test the requests to the view when the cache is disabled"""
+        mock_get.return_value = mock_response(data=[HOSTS[1]])
+        response = self.fetch("/api/v1/host/aliases/host01")
+        self.assertEquals(json.loads(response.body)["response"], [HOSTS[1]])
+        self.assertTrue(mock_get.call_args[0][0].endswith('?host=eq.host01'))
+        self.fetch("/api/v1/host/aliases")
+        self.assertTrue(mock_get.call_args[0][0].endswith('?order=host.asc'))
+        self.assertIsNone(host_aliases.hosts)
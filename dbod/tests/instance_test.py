@@ -13,7 +13,10 @@ import json
 import urllib
 import logging
 import base64
+import requests
 
+from mock import patch, MagicMock
+from tornado import gen
 from tornado.testing import AsyncHTTPTestCase
 from tornado.testing import get_unused_port
 from timeout_decorator import timeout
@@ -29,6 +32,91 @@ class InstanceTest(AsyncHTTPTestCase):
     def get_app(self):
         return tornado.web.Application(handlers, debug=True)
 
+    @timeout(5)
+    def test_get_instances(self):
+        """Get a batch of instances in one request"""
+        response = self.fetch("/api/v1/instance?names=dbod01,dbod02&names=invalid")
+        self.assertEquals(response.code, 200)
+        data = json.loads(response.body)["response"]
+        self.assertEquals(sorted(data.keys()), ["dbod01", "dbod02"])
+        self.assertEquals(data["dbod02"]["db_type"], "PG")
+
+    @patch('dbod.api.instance.Instance.BATCH_SIZE', 2)
+    @patch('dbod.api.instance.client.get')
+    def test_get_instances_in_groups(self, mock_get):
+        """Get a batch of instances requested to PostgREST in groups"""
+        def get(url, **kwargs):
+            names = url.split('db_name=in.')[1].split(',')
+            data = [{"db_name": name} for name in names if name != 'invalid']
+            return gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                              ok=True,
+                                              status_code=200,
+                                              json=lambda: data))
+        mock_get.side_effect = get
+
+        response = self.fetch("/api/v1/instance?names=dbod01,dbod02,dbod03,invalid,dbod01")
+        self.assertEquals(response.code, 200)
+        self.assertEquals(mock_get.call_count, 2)
+        data = json.loads(response.body)["response"]
+        self.assertEquals(sorted(data.keys()), ["dbod01", "dbod02", "dbod03"])
+
+    def test_get_instances_no_names(self):
+        """Get a batch of instances without names"""
+        response = self.fetch("/api/v1/instance?names=,")
+        self.assertEquals(response.code, 400)
+        response = self.fetch("/api/v1/instance/", method='DELETE', headers={'Authorization': self.authentication})
+        self.assertEquals(response.code, 405)
+
+    @timeout(5)
+    def test_list_instances(self):
+        """List the instances page by page"""
+        response = self.fetch("/api/v1/instance?class=TEST&limit=2")
+        self.assertEquals(response.code, 200)
+        data = json.loads(response.body)
+        self.assertEquals([instance["db_name"] for instance in data["response"]], ["dbod01", "dbod03"])
+        self.assertEquals(data["next"], "dbod03")
+
+        response = self.fetch("/api/v1/instance?class=TEST&limit=2&cursor=" + data["next"])
+        self.assertEquals(response.code, 200)
+        data = json.loads(response.body)
+        self.assertEquals([instance["db_name"] for instance in data["response"]], ["dbod05"])
+        self.assertEquals(data["next"], None)
+
+    @patch('dbod.api.instance.Instance.FLUSH_SIZE', 100)
+    @patch('dbod.api.instance.client.get')
+    def test_list_instances_by_host(self, mock_get):
+        """List the instances of a host"""
+        rows = [{"db_name": "dbod01", "host": "host1"},
+                {"db_name": "dbod02", "host": "host10"},
+                {"db_name": "dbod03", "host": "host2,host1"}]
+        def get(url, header_callback=None, streaming_callback=None, **kwargs):
+            header_callback('HTTP/1.1 206 Partial Content\r\n')
+            streaming_callback(json.dumps(rows))
+            return gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                              ok=True,
+                                              status_code=206,
+                                              text=''))
+        mock_get.side_effect = get
+
+        response = self.fetch("/api/v1/instance?host=host1&db_type=MYSQL&limit=3&cursor=dbod00")
+        self.assertEquals(response.code, 200)
+        data = json.loads(response.body)
+        self.assertEquals(data["response"], [rows[0], rows[2]])
+        self.assertEquals(data["next"], "dbod03")
+        url = mock_get.call_args[0][0]
+        self.assertIn("order=db_name.asc", url)
+        self.assertIn("db_name=gt.dbod00", url)
+        self.assertIn("db_type=eq.MYSQL", url)
+        self.assertIn("host=like.*host1*", url)
+        self.assertEquals(mock_get.call_args[1]["headers"]["Range"], "0-2")
+
+    def test_list_instances_invalid_limit(self):
+        """List the instances with an invalid limit"""
+        response = self.fetch("/api/v1/instance?limit=0")
+        self.assertEquals(response.code, 400)
+        response = self.fetch("/api/v1/instance?limit=all")
+        self.assertEquals(response.code, 400)
+
     @timeout(5)
     def test_create_instance(self):
         """Creation of a new instance in a correct way"""
@@ -178,6 +266,60 @@ class InstanceTest(AsyncHTTPTestCase):
         response = self.fetch("/api/v1/instance/create", method='POST', headers={'Authorization': self.authentication}, body=instance)
         self.assertEquals(response.code, 400)
         
+    @patch('dbod.api.metadata.views.url', None)
+    @patch('dbod.api.instance.client.post')
+    def test_create_instance_single_request(self, mock_post):
+        """Creation of an instance, its volumes and attributes with one request to PostgREST"""
+        mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                            ok=True,
+                                                            status_code=200,
+                                                            text='[{"create_instance": 42}]',
+                                                            json=lambda: [{"create_instance": 42}]))
+        instance = """{
+        "username": "testuser", "class": "TEST", "db_type": "MYSQL", "hosts": ["testhost1", "testhost2"], "db_name": "testdb", 
+        "volumes": [{"group": "ownergroup", "file_mode": "0755", "server": "NAS-server", "mount_options": "rw",
+            "owner": "TSM", "mounting_path": "/MNT/data1"}],
+        "attributes": {"port": "5505"}}"""
+        
+        response = self.fetch("/api/v1/instance/create", method='POST', headers={'Authorization': self.authentication}, body=instance)
+        self.assertEquals(response.code, 201)
+        self.assertEquals(mock_post.call_count, 1)
+        body = mock_post.call_args[1]['json']
+        self.assertEquals(body['instance']['host'], 'testhost1,testhost2')
+        self.assertNotIn('volumes', body['instance'])
+        self.assertEquals(len(body['volumes']), 1)
+        self.assertEquals(body['attributes'], {"port": "5505"})
+
+    @patch('dbod.api.metadata.views.url', None)
+    @patch('dbod.api.instance.client.post')
+    def test_edit_instance_single_request(self, mock_post):
+        """Edition of an instance, its volumes and attributes with one request to PostgREST"""
+        mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                            ok=True,
+                                                            status_code=200,
+                                                            json=lambda: [{"update_instance": 42}]))
+        instance = """{"hosts": ["host01", "host02"], "volumes": [], "attributes": {"port": "5505"}}"""
+
+        response = self.fetch("/api/v1/instance/dbod01", method='PUT', headers={'Authorization': self.authentication}, body=instance)
+        self.assertEquals(response.code, 204)
+        self.assertEquals(mock_post.call_count, 1)
+        body = mock_post.call_args[1]['json']
+        self.assertEquals(body, {"inst_name": "dbod01",
+                                 "instance": {"host": "host01,host02"},
+                                 "volumes": [],
+                                 "attributes": {"port": "5505"}})
+
+    @patch('dbod.api.instance.client.post')
+    def test_edit_instance_not_existing_single_request(self, mock_post):
+        """Edition of an instance which does not exist"""
+        mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                            ok=True,
+                                                            status_code=200,
+                                                            json=lambda: [{"update_instance": None}]))
+
+        response = self.fetch("/api/v1/instance/nonexisting", method='PUT', headers={'Authorization': self.authentication}, body='{"username": "newuser"}')
+        self.assertEquals(response.code, 404)
+
     @timeout(5)
     def test_edit_instance_username(self):
         """Edit the username correctly"""
@@ -8,19 +8,34 @@
 # granted to it by virtue of its status as Intergovernmental Organization
 # or submit itself to any jurisdiction.
 
+import unittest
 import tornado.web
 import json
+import os
+import requests
+import shutil
+import stat
+import tempfile
 
-from tornado.testing import AsyncHTTPTestCase
+from mock import patch
+from mock import MagicMock
+from tornado import gen
+from tornado.testing import AsyncHTTPTestCase, AsyncTestCase, gen_test
 from tornado.testing import get_unused_port
 from timeout_decorator import timeout
 
 from dbod.api.api import *
+from dbod.api.cache import metadata_cache
+from dbod.api.metadata import Snapshot, MaterializedViews
 
 class MetadataTest(AsyncHTTPTestCase):
     def get_app(self):
         return tornado.web.Application(handlers)
 
+    def setUp(self):
+        super(MetadataTest, self).setUp()
+        metadata_cache.invalidate()
+
     @timeout(5)
     def test_single_instance_by_name(self):
         response = self.fetch("/api/v1/instance/dbod01/metadata")
@@ -68,4 +83,120 @@ class MetadataTest(AsyncHTTPTestCase):
     def test_invalid_class(self):
         response = self.fetch("/api/v1/invalid/invalid/metadata")
         self.assertEquals(response.code, 400)
-    
+
+    @timeout(5)
+    @patch('dbod.api.metadata.client.get')
+    def test_cached_instance(self, mock_get):
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=True,
+                                                           status_code=200,
+                                                           json=lambda: [{"db_name": "dbod42"}]))
+        for i in range(3):
+            response = self.fetch("/api/v1/instance/dbod42/metadata")
+            self.assertEquals(response.code, 200)
+            data = json.loads(response.body)["response"]
+            self.assertEquals(data[0]["db_name"], "dbod42")
+        self.assertEquals(mock_get.call_count, 1)
+
+    @timeout(5)
+    @patch('dbod.api.metadata.client.get')
+    def test_unreachable_served_from_snapshot(self, mock_get):
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=False,
+                                                           status_code=502,
+                                                           text=''))
+        with patch('dbod.api.metadata.snapshot') as mock_snapshot:
+            mock_snapshot.lookup.return_value = [{"db_name": "dbod42", "hosts": ["host42"]}]
+            response = self.fetch("/api/v1/host/host42/metadata")
+            self.assertEquals(response.code, 200)
+            self.assertTrue(response.headers['Warning'].startswith('110'))
+            data = json.loads(response.body)["response"]
+            self.assertEquals(data[0]["db_name"], "dbod42")
+            mock_snapshot.lookup.assert_called_with('host', 'host42')
+
+            mock_snapshot.lookup.return_value = []
+            response = self.fetch("/api/v1/instance/dbod24/metadata")
+            self.assertEquals(response.code, 502)
+
+class SnapshotTest(unittest.TestCase):
+    """Class to test the on-disk metadata snapshot"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        metadata_cache.invalidate()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        metadata_cache.invalidate()
+
+    def test_dump_and_load(self):
+        path = os.path.join(self.directory, 'cache', 'metadata.json')
+        data = [{"db_name": "dbod01", "hosts": ["host01"]},
+                {"db_name": "dbod02", "hosts": ["host01", "host02"]}]
+        Snapshot(path).dump(data)
+        # The snapshot is a valid JSON document
+        with open(path) as snapshot_file:
+            self.assertEquals(json.load(snapshot_file), data)
+
+        snapshot = Snapshot(path)
+        snapshot.load()
+        self.assertEquals(snapshot.lookup('instance', 'dbod02'), [data[1]])
+        self.assertEquals(len(snapshot.lookup('host', 'host01')), 2)
+        self.assertEquals(snapshot.lookup('host', 'host03'), [])
+        # The metadata cache is not filled with the possibly outdated snapshot
+        self.assertIsNone(metadata_cache.get(('host', 'host02')))
+        self.assertEquals(os.listdir(os.path.dirname(path)), ['metadata.json'])
+
+    def test_dump_permissions(self):
+        path = os.path.join(self.directory, 'metadata.json')
+        umask = os.umask(022)
+        try:
+            Snapshot(path).dump([])
+            self.assertEquals(stat.S_IMODE(os.stat(path).st_mode), 0644)
+            # The permissions of the previous snapshot are kept
+            os.chmod(path, 0640)
+            Snapshot(path).dump([])
+            self.assertEquals(stat.S_IMODE(os.stat(path).st_mode), 0640)
+        finally:
+            os.umask(umask)
+
+    def test_load_not_existing(self):
+        snapshot = Snapshot(os.path.join(self.directory, 'metadata.json'))
+        snapshot.load()
+        self.assertEquals(snapshot.lookup('instance', 'dbod01'), [])
+
+class MaterializedViewsTest(AsyncTestCase):
+    """Class to test the refresh of the materialized views"""
+
+    def setUp(self):
+        super(MaterializedViewsTest, self).setUp()
+        metadata_cache.invalidate()
+        metadata_cache.set(('instance', 'dbod42'), [{"db_name": "dbod42"}])
+
+    def refreshed(self, value):
+        return gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                          ok=True,
+                                          status_code=200,
+                                          json=lambda: [{"refresh_metadata": value}]))
+
+    @patch('dbod.api.metadata.client.post')
+    @gen_test
+    def test_refresh(self, mock_post):
+        mock_post.return_value = self.refreshed(True)
+        yield MaterializedViews('http://localhost/rpc/refresh_metadata', 300).refresh()
+        self.assertEquals(mock_post.call_args[1]['json'], {'max_age': 300})
+        self.assertEquals(metadata_cache.get(('instance', 'dbod42')), None)
+
+    @patch('dbod.api.metadata.client.post')
+    @gen_test
+    def test_refresh_up_to_date(self, mock_post):
+        mock_post.return_value = self.refreshed(False)
+        yield MaterializedViews('http://localhost/rpc/refresh_metadata', 300).refresh()
+        self.assertEquals(mock_post.call_count, 1)
+        self.assertEquals(metadata_cache.get(('instance', 'dbod42')), [{"db_name": "dbod42"}])
+
+    @patch('dbod.api.metadata.client.post')
+    @gen_test
+    def test_refresh_not_configured(self, mock_post):
+        yield MaterializedViews(None, 300).refresh()
+        self.assertEquals(mock_post.call_count, 0)
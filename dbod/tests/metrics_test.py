@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015, CERN
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file "COPYING".
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import unittest
+import tornado.web
+
+from mock import patch
+from tornado.testing import AsyncHTTPTestCase
+
+from dbod.api import client, metrics
+from dbod.api.api import handlers
+
+class MetricsTest(AsyncHTTPTestCase):
+    """Class to test the metrics endpoint"""
+
+    def get_app(self):
+        return tornado.web.Application(handlers + [(r"/echo", EchoHandler)],
+                log_function=metrics.log_request)
+
+    def setUp(self):
+        super(MetricsTest, self).setUp()
+        for metric in (metrics.requests_total, metrics.request_duration,
+                metrics.upstream_requests_total, metrics.upstream_request_duration):
+            metric.values.clear()
+
+    def tearDown(self):
+        client.close()
+        super(MetricsTest, self).tearDown()
+
+    def test_request_metrics(self):
+        self.fetch("/")
+        self.fetch("/")
+        self.fetch("/api/v1/metadata/invalid/name")
+        response = self.fetch("/metrics")
+        self.assertEquals(response.code, 200)
+        self.assertTrue(response.headers['Content-Type'].startswith('text/plain'))
+        lines = response.body.splitlines()
+        self.assertIn('dbod_api_requests_total{handler="DocHandler",method="GET",code="200"} 2', lines)
+        self.assertIn('dbod_api_requests_total{handler="Metadata",method="GET",code="400"} 1', lines)
+        self.assertIn('dbod_api_request_duration_seconds_count{handler="DocHandler",method="GET"} 2', lines)
+        self.assertIn('dbod_api_request_duration_seconds_bucket{handler="DocHandler",method="GET",le="+Inf"} 2', lines)
+        self.assertIn('# TYPE dbod_api_cache_hits_total counter', lines)
+
+    def test_upstream_metrics(self):
+        url = self.get_url('/echo')
+        with patch.dict(metrics._url_options, {client.POSTGREST: [(url, 'echo_url')]}):
+            client.post(url + '?id=eq.1', json={}).add_done_callback(self.stop)
+            self.wait()
+        lines = metrics.render().splitlines()
+        self.assertIn('dbod_api_upstream_requests_total{upstream="postgrest",url="echo_url",code="200"} 1', lines)
+        self.assertIn('dbod_api_upstream_request_duration_seconds_count{upstream="postgrest",url="echo_url"} 1', lines)
+
+class EchoHandler(tornado.web.RequestHandler):
+    def post(self):
+        self.write(self.request.body)
+
+class HistogramTest(unittest.TestCase):
+    """Class to test the metric types"""
+
+    def test_histogram(self):
+        histogram = metrics.Histogram('duration_seconds', 'Duration', ('handler',))
+        histogram.observe(('Test',), 0.2)
+        histogram.observe(('Test',), 20)
+        lines = histogram.render()
+        self.assertIn('duration_seconds_bucket{handler="Test",le="0.1"} 0', lines)
+        self.assertIn('duration_seconds_bucket{handler="Test",le="0.25"} 1', lines)
+        self.assertIn('duration_seconds_bucket{handler="Test",le="+Inf"} 2', lines)
+        self.assertIn('duration_seconds_count{handler="Test"} 2', lines)
+        self.assertIn('duration_seconds_sum{handler="Test"} 20.2', lines)
+
+    def test_gauge(self):
+        gauge = metrics.Gauge('pool_size', 'Pool size', ('state',))
+        gauge.set(('free',), 3)
+        gauge.set(('free',), 2)
+        lines = gauge.render()
+        self.assertIn('# TYPE pool_size gauge', lines)
+        self.assertIn('pool_size{state="free"} 2', lines)
+
+    def test_labels_escaped(self):
+        counter = metrics.Counter('errors_total', 'Errors', ('message',))
+        counter.inc(('a "quoted"\nmessage',))
+        self.assertIn('errors_total{message="a \\"quoted\\"\\nmessage"} 1', counter.render())
+
+    @patch('dbod.api.process._task_id', 1)
+    def test_worker_label(self):
+        counter = metrics.Counter('errors_total', 'Errors', ('code',))
+        counter.inc(('500',))
+        counter.inc()
+        lines = counter.render()
+        self.assertIn('errors_total{worker="1",code="500"} 1', lines)
+        self.assertIn('errors_total{worker="1"} 1', lines)
+
+    def test_url_option(self):
+        self.assertEquals(metrics.url_option('postgrest', 'http://localhost:3000/host_aliases?host=eq.h'), 'host_aliases_url')
+        self.assertEquals(metrics.url_option('postgrest', 'http://localhost:3000/host?name=eq.h'), 'host_url')
+        self.assertEquals(metrics.url_option('rundeck', 'https://rundeck/api/14/job/42/run?format=json'), 'api_run_job')
+        self.assertEquals(metrics.url_option('postgrest', 'http://elsewhere/'), 'other')
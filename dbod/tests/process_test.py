@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015, CERN
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file "LICENSE".
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import os
+import signal
+import subprocess
+import sys
+import unittest
+
+from timeout_decorator import timeout
+
+# The workers are forked in a new interpreter, as no IOLoop can exist before
+WORKERS = """
+import os, sys, time
+from dbod.api.process import fork_processes
+task = fork_processes(2)
+sys.stdout.write('%s\\n' % task)
+sys.stdout.flush()
+if sys.argv[1] == 'wait':
+    time.sleep(60)
+elif sys.argv[1] == 'fail' and not os.path.exists(sys.argv[2] + str(task)):
+    open(sys.argv[2] + str(task), 'w').close()
+    sys.exit(1)
+"""
+
+class ProcessTest(unittest.TestCase):
+    """Class to test the worker processes"""
+
+    def start(self, mode, *args):
+        return subprocess.Popen([sys.executable, '-c', WORKERS, mode] + list(args),
+                stdout=subprocess.PIPE)
+
+    @timeout(10)
+    def test_workers_exit(self):
+        workers = self.start('exit')
+        output, _ = workers.communicate()
+        self.assertEquals(workers.returncode, 0)
+        self.assertEquals(sorted(output.split()), ['0', '1'])
+
+    @timeout(10)
+    def test_workers_restarted(self):
+        flag = '/tmp/dbod-process-test-%s-' % os.getpid()
+        try:
+            workers = self.start('fail', flag)
+            output, _ = workers.communicate()
+            self.assertEquals(workers.returncode, 0)
+            # Every worker has failed once and has been restarted
+            self.assertEquals(sorted(output.split()), ['0', '0', '1', '1'])
+        finally:
+            for task in ('0', '1'):
+                if os.path.exists(flag + task):
+                    os.unlink(flag + task)
+
+    @timeout(10)
+    def test_stop_signal_forwarded(self):
+        workers = self.start('wait')
+        started = [workers.stdout.readline(), workers.stdout.readline()]
+        self.assertEquals(sorted(started), ['0\n', '1\n'])
+        workers.send_signal(signal.SIGTERM)
+        # The workers are stopped and not restarted
+        self.assertEquals(workers.stdout.read(), '')
+        self.assertEquals(workers.wait(), 0)
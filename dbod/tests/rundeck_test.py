@@ -9,16 +9,19 @@ import unittest
 import logging
 
 import base64
+import time
 import tornado.web
 import requests
 
 from sys import stdout
 from mock import patch
 from mock import MagicMock
-from tornado.testing import AsyncHTTPTestCase
+from tornado import gen
+from tornado.testing import AsyncHTTPTestCase, gen_test
 from timeout_decorator import timeout
 
 from dbod.api.api import handlers
+from dbod.api.rundeck import resources
 from dbod.config import config
 logging.basicConfig(stream=stdout, level=logging.DEBUG)
 
@@ -32,39 +35,112 @@ class RundeckTest(AsyncHTTPTestCase, unittest.TestCase):
     def get_app(self):
         return tornado.web.Application(handlers)
 
-    @patch('dbod.api.rundeck.requests.get')
+    def setUp(self):
+        super(RundeckTest, self).setUp()
+        resources.reset()
+
+    def stream(self, text, status_code=200, chunk_size=50):
+        """Returns a replacement of client.get streaming *text* in chunks"""
+        def get(url, header_callback=None, streaming_callback=None, **kwargs):
+            header_callback('HTTP/1.1 %s Status\r\n' % status_code)
+            for i in range(0, len(text), chunk_size):
+                streaming_callback(text[i:i + chunk_size])
+            return gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                              ok=status_code < 400,
+                                              status_code=status_code,
+                                              text=''))
+        return get
+
+    @patch('dbod.api.rundeck.client.get')
     def test_get_success(self, mock_get):
         """test when get method is successful"""
         print "test_get_success"
-        status_code_test = 200
-        response_text = '[{"db_name":"dbod42","hostname":"dbod42.cern.ch","port":"5500","username":"dbod","db_type":"MYSQL","category":"TEST","tags":"MYSQL,TEST"}, \
-        {"db_name":"dbod24","hostname":"dbod24.cern.ch","port":"6603","username":"dbod","db_type":"PG","category":"PROD","tags":"PG,PROD"}]'
+        response_text = '[{"db_name":"dbod24","hostname":"dbod24.cern.ch","port":"6603","username":"dbod","db_type":"PG","category":"PROD","tags":"PG,PROD"}, \
+        {"db_name":"dbod42","hostname":"dbod42.cern.ch","port":"5500","username":"dbod","db_type":"MYSQL","category":"TEST","tags":"MYSQL,TEST"}]'
 
-        mock_get.return_value = MagicMock(spec=requests.models.Response,
-                                          ok=True,
-                                          status_code=status_code_test,
-                                          text=response_text)
+        mock_get.side_effect = self.stream(response_text)
 
         response = self.fetch("/api/v1/rundeck/resources.xml")
         
         self.assertEquals(response.code, 200)
+        self.assertIn('order=db_name.asc', mock_get.call_args[0][0])
+        self.assertTrue(response.body.startswith('<?xml version="1.0" encoding="UTF-8"?><project><node name="dbod24"'))
+        self.assertTrue(response.body.endswith('tags="MYSQL,TEST"/></project>'))
+
+    @patch('dbod.api.rundeck.client.get')
+    def test_get_duplicated_instances(self, mock_get):
+        """test that consecutive rows of the same instance give a single node"""
+        response_text = '[{"db_name":"dbod42","port":"5500"},{"db_name":"dbod42","port":"5501"},{"db_name":"dbod43","port":"5502"}]'
+        mock_get.side_effect = self.stream(response_text, chunk_size=7)
+
+        response = self.fetch("/api/v1/rundeck/resources.xml")
+        self.assertEquals(response.code, 200)
+        self.assertEquals(response.body.count('<node '), 2)
+        self.assertIn('name="dbod42" description="" hostname="None" username="None" type="None" subcategory="None" port="5501"', response.body)
 
-    @patch('dbod.api.rundeck.requests.get')
+    @patch('dbod.api.rundeck.client.get')
     def test_get_nosuccess(self, mock_get):
         """test when get method is not successful """
         print "test_get_nosuccess"
         status_code_test_error = 502
 
-        mock_get.return_value = MagicMock(spec=requests.models.Response,
-                                          ok=False,
-                                          status_code=status_code_test_error)
+        mock_get.side_effect = self.stream('{"message":"error"}', status_code_test_error)
 
         response = self.fetch("/api/v1/rundeck/resources.xml")
         self.assertEquals(response.code, 404)
+
+    @patch('dbod.api.rundeck.client.get')
+    def test_get_truncated(self, mock_get):
+        """test when the upstream response is not complete"""
+        mock_get.side_effect = self.stream('[{"db_name":"dbod42","port":"5500"},{"db_na')
+
+        response = self.fetch("/api/v1/rundeck/resources.xml")
+        self.assertEquals(response.code, 502)
     
+    @patch('dbod.api.rundeck.client.get')
+    def test_get_not_modified(self, mock_get):
+        """test that the cached document is served with its ETag"""
+        mock_get.side_effect = self.stream('[{"db_name":"dbod42","port":"5500"}]')
+
+        response = self.fetch("/api/v1/rundeck/resources.xml")
+        self.assertEquals(response.code, 200)
+        etag = response.headers['Etag']
+        response = self.fetch("/api/v1/rundeck/resources.xml", headers={'If-None-Match': etag})
+        self.assertEquals(response.code, 304)
+        self.assertEquals(response.body, '')
+        self.assertEquals(mock_get.call_count, 1)
+
+    @patch('dbod.api.rundeck.client.get')
+    def test_get_regenerated(self, mock_get):
+        """test that a new ETag is served after the document is regenerated"""
+        mock_get.side_effect = self.stream('[{"db_name":"dbod42","port":"5500"}]')
+        etag = self.fetch("/api/v1/rundeck/resources.xml").headers['Etag']
+
+        mock_get.side_effect = self.stream('[{"db_name":"dbod42","port":"5501"}]')
+        self.io_loop.run_sync(resources.refresh)
+        response = self.fetch("/api/v1/rundeck/resources.xml", headers={'If-None-Match': etag})
+        self.assertEquals(response.code, 200)
+        self.assertNotEquals(response.headers['Etag'], etag)
+        self.assertIn('port="5501"', response.body)
+
+    @patch('dbod.api.rundeck.resources.interval', 0)
+    @patch('dbod.api.rundeck.RundeckResources.FLUSH_SIZE', 100)
+    @patch('dbod.api.rundeck.client.get')
+    def test_get_not_cached(self, mock_get):
+        """test the document streamed to the client when the cache is disabled"""
+        response_text = '[' + ','.join('{"db_name":"dbod%s","port":"5500"}' % i for i in range(100, 200)) + ']'
+        mock_get.side_effect = self.stream(response_text)
+
+        response = self.fetch("/api/v1/rundeck/resources.xml")
+        self.assertEquals(response.code, 200)
+        self.assertEquals(response.body.count('<node '), 100)
+        self.assertTrue(response.body.endswith('</project>'))
+        self.assertEquals(response.headers.get('Transfer-Encoding'), 'chunked')
+        self.assertIsNone(resources.xml)
+
     @timeout(10)
-    @patch('dbod.api.rundeck.requests.get')
-    @patch('dbod.api.rundeck.requests.post')
+    @patch('dbod.api.rundeck.client.get')
+    @patch('dbod.api.rundeck.client.post')
     def test_post_job_success(self, mock_post, mock_get):
         """test an execution of a registered job of an existing instance"""
         print "test_post_existing_instance"
@@ -73,18 +149,18 @@ class RundeckTest(AsyncHTTPTestCase, unittest.TestCase):
         response_output_success = '{"execCompleted": true, "execState": "succeeded", "log": "[snapscript_24,snapscript_42]"}'
         response_run = '{"id":42}'
 
-        mock_get.side_effect = [MagicMock(spec=requests.models.Response,
-                                           ok=True,
-                                           status_code=status_code_test,
-                                           text=response_output_running),
-                                MagicMock(spec=requests.models.Response,
-                                           ok=True,
-                                           status_code=status_code_test,
-                                           text=response_output_success)]
-        mock_post.return_value = MagicMock(spec=requests.models.Response,
-                                           ok=True,
-                                           status_code=status_code_test,
-                                           text=response_run)
+        mock_get.side_effect = [gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                            ok=True,
+                                                            status_code=status_code_test,
+                                                            text=response_output_running)),
+                                gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                            ok=True,
+                                                            status_code=status_code_test,
+                                                            text=response_output_success))]
+        mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                            ok=True,
+                                                            status_code=status_code_test,
+                                                            text=response_run))
 
         response = self.fetch("/api/v1/rundeck/job/get-snapshots/instance42",
                              method="POST",
@@ -92,8 +168,44 @@ class RundeckTest(AsyncHTTPTestCase, unittest.TestCase):
                              body='')
         self.assertEquals(response.code, 200)
         
-    @patch('dbod.api.rundeck.requests.get')
-    @patch('dbod.api.rundeck.requests.post')
+    @gen_test(timeout=10)
+    def test_post_jobs_concurrently(self):
+        """test that waiting for a job does not block other job executions"""
+        print "test_post_jobs_concurrently"
+        status_code_test = 200
+        response_output_running = '{"execCompleted": false, "execState": "running"}'
+        response_output_success = '{"execCompleted": true, "execState": "succeeded", "log": "[snapscript_24,snapscript_42]"}'
+        response_run = '{"id":42}'
+        # Each job is polled 3 times before completing
+        outputs = [response_output_running] * 6 + [response_output_success] * 2
+
+        with patch('dbod.api.rundeck.client.get') as mock_get, \
+                patch('dbod.api.rundeck.client.post') as mock_post:
+            mock_get.side_effect = [gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                                ok=True,
+                                                                status_code=status_code_test,
+                                                                text=output))
+                                    for output in outputs]
+            mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                                ok=True,
+                                                                status_code=status_code_test,
+                                                                text=response_run))
+            start = time.time()
+            responses = yield [self.http_client.fetch(
+                                   self.get_url("/api/v1/rundeck/job/get-snapshots/instance42"),
+                                   method="POST",
+                                   headers={'Authorization': self.authentication},
+                                   body='')
+                               for i in range(2)]
+            elapsed = time.time() - start
+
+        for response in responses:
+            self.assertEquals(response.code, 200)
+        # Waiting sequentially would take at least 2 * 3 * 0.5 seconds
+        self.assertTrue(elapsed < 2.5)
+
+    @patch('dbod.api.rundeck.client.get')
+    @patch('dbod.api.rundeck.client.post')
     def test_post_job_nosuccess(self, mock_post, mock_get):
         """test when the job execution is not successful"""
         print "test_post_job_nosuccess"
@@ -101,14 +213,14 @@ class RundeckTest(AsyncHTTPTestCase, unittest.TestCase):
         response_run = '{"id":42}'
         response_output = '{"execCompleted": true, "execState": "failed", "log": "[snapscript_24,snapscript_42]"}'
 
-        mock_get.return_value = MagicMock(spec=requests.models.Response,
-                                           ok=True,
-                                           status_code=status_code_test,
-                                           text=response_output)
-        mock_post.return_value = MagicMock(spec=requests.models.Response,
-                                          ok=True,
-                                          status_code=status_code_test,
-                                          text=response_run)
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                            ok=True,
+                                                            status_code=status_code_test,
+                                                            text=response_output))
+        mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=True,
+                                                           status_code=status_code_test,
+                                                           text=response_run))
         
         response = self.fetch("/api/v1/rundeck/job/get-snapshots/instance42",
                                method="POST",
@@ -116,8 +228,8 @@ class RundeckTest(AsyncHTTPTestCase, unittest.TestCase):
                                body='')
         self.assertEquals(response.code, 502)
     
-    @patch('dbod.api.rundeck.requests.get')
-    @patch('dbod.api.rundeck.requests.post')
+    @patch('dbod.api.rundeck.client.get')
+    @patch('dbod.api.rundeck.client.post')
     def test_post_jobstatus_error(self, mock_post, mock_get):
         """test when the the get request of the job from rundeck status is not successful"""
         print "test_post_jobstatus_error"
@@ -126,14 +238,14 @@ class RundeckTest(AsyncHTTPTestCase, unittest.TestCase):
         response_run = '{"id":42}'
         response_output = '{"execCompleted": true, "execState": "succeeded", "log": "[snapscript_24,snapscript_42]"}'
 
-        mock_get.return_value = MagicMock(spec=requests.models.Response,
-                                          ok=False,
-                                          status_code=status_code_test_error,
-                                          text=response_output)
-        mock_post.return_value = MagicMock(spec=requests.models.Response,
-                                           ok=True,
-                                           status_code=status_code_test,
-                                           text=response_run)
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           ok=False,
+                                                           status_code=status_code_test_error,
+                                                           text=response_output))
+        mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                            ok=True,
+                                                            status_code=status_code_test,
+                                                            text=response_run))
         
         response = self.fetch("/api/v1/rundeck/job/get-snapshots/instance42",
                                method="POST",
@@ -141,8 +253,8 @@ class RundeckTest(AsyncHTTPTestCase, unittest.TestCase):
                                body='')
         self.assertEquals(response.code, status_code_test_error)
 
-    @patch('dbod.api.rundeck.requests.get')
-    @patch('dbod.api.rundeck.requests.post')
+    @patch('dbod.api.rundeck.client.get')
+    @patch('dbod.api.rundeck.client.post')
     def test_post_jobrun_error(self, mock_post, mock_get):
         """test when the the post request of the job to rundeck is not successful"""
         print "test_post_jobrun_error"
@@ -150,12 +262,12 @@ class RundeckTest(AsyncHTTPTestCase, unittest.TestCase):
         status_code_test_error = 400
         response_run = '{"id":42}'
 
-        mock_get.return_value = MagicMock(spec=requests.models.Response,
-                                          status_code=status_code_test)
-        mock_post.return_value = MagicMock(spec=requests.models.Response,
-                                           ok=False,
-                                           status_code=status_code_test_error,
-                                           text=response_run)
+        mock_get.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                           status_code=status_code_test))
+        mock_post.return_value = gen.maybe_future(MagicMock(spec=requests.models.Response,
+                                                            ok=False,
+                                                            status_code=status_code_test_error,
+                                                            text=response_run))
         
         response = self.fetch("/api/v1/rundeck/job/get-snapshots/instance42",
                                method="POST",
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015, CERN
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file "COPYING".
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import json
+import tornado.web
+
+from mock import patch
+from tornado import gen
+from tornado.testing import AsyncHTTPTestCase
+
+from dbod.api import client, metrics, tracing
+
+class TracedHandler(tornado.web.RequestHandler):
+    @gen.coroutine
+    def get(self):
+        url = self.request.protocol + '://' + self.request.host + '/echo'
+        yield client.post(url, json={})
+        yield [client.post(url + '?id=eq.1', json={}), client.post(url + '?id=eq.2', json={})]
+        self.write('traced')
+
+class EchoHandler(tornado.web.RequestHandler):
+    def post(self):
+        self.write(self.request.body)
+
+class ActiveHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write(str(self.settings['tracer'].active))
+
+class TracingTest(AsyncHTTPTestCase):
+    """Class to test the tracing of the upstream requests"""
+
+    def get_app(self):
+        application = tornado.web.Application([
+            (r"/traced", TracedHandler),
+            (r"/echo", EchoHandler),
+            (r"/active", ActiveHandler),
+            ], log_function=metrics.log_request)
+        application.settings['tracer'] = tracing.Tracer(application)
+        return application.settings['tracer']
+
+    def setUp(self):
+        super(TracingTest, self).setUp()
+        self.url_options = patch.dict(metrics._url_options,
+                {client.POSTGREST: [(self.get_url('/echo'), 'echo_url')]})
+        self.url_options.start()
+
+    def tearDown(self):
+        self.url_options.stop()
+        client.close()
+        super(TracingTest, self).tearDown()
+
+    def test_server_timing(self):
+        response = self.fetch("/traced")
+        self.assertEquals(response.code, 200)
+        spans = response.headers['Server-Timing'].split(', ')
+        self.assertEquals(len(spans), 3)
+        for span in spans:
+            self.assertTrue(span.startswith('echo_url;desc="POST 200";dur='))
+        # Requests without upstream calls have no header
+        self.assertNotIn('Server-Timing', self.fetch("/echo", method='POST', body='').headers)
+        self.assertIsNone(tracing.current())
+
+    @patch('dbod.api.tracing.logging')
+    def test_slow_request_logged(self, mock_logging):
+        with patch('dbod.api.tracing.get_option', return_value=0.000001):
+            self.fetch("/traced")
+        trace = json.loads(mock_logging.warning.call_args[0][1])
+        self.assertEquals(trace['request'], 'GET /traced')
+        self.assertEquals(trace['handler'], 'TracedHandler')
+        self.assertEquals(len(trace['spans']), 3)
+        self.assertEquals(trace['spans'][0]['url'], 'echo_url')
+        self.assertEquals(trace['spans'][0]['status'], 200)
+
+    @patch('dbod.api.tracing.logging')
+    def test_fast_request_not_logged(self, mock_logging):
+        self.fetch("/traced")
+        self.assertFalse(mock_logging.warning.called)
+
+    def test_active_requests(self):
+        self.assertEquals(self.fetch("/active").body, '1')
+        self.assertEquals(self._app.active, 0)
+        self.assertEquals(self.fetch("/missing").code, 404)
+        self.assertEquals(self._app.active, 0)
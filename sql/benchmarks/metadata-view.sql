@@ -0,0 +1,96 @@
+-- Benchmark of the api.metadata view, comparing the definition previous to
+-- the 0.82 update (PL/pgSQL functions called for every row) with the current
+-- one (lateral joins and aggregates) and with its materialized version
+-- (api.materialized_metadata, with the indexes of the 0.83 and 0.84 updates).
+--
+-- A dataset of :instances instances, with their attributes and volumes, is
+-- generated in a transaction which is rolled back at the end. The instances
+-- are inserted into public.dod_instances, relying on the defaults of its id
+-- and db_size columns, so the script only runs against a database created
+-- with dbod/tests/db_test.sql, where it is a plain table. It stops before
+-- changing anything if it is not (e.g. the view over the Oracle foreign
+-- table used in production):
+--
+--   psql -d dbod -f sql/benchmarks/metadata-view.sql
+
+\set instances 20000
+\set ON_ERROR_STOP on
+\timing on
+
+BEGIN;
+
+DO $$
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = 'public.dod_instances'::regclass) <> 'r' THEN
+    RAISE EXCEPTION 'public.dod_instances is not a table, run the benchmark against the test database';
+  END IF;
+END
+$$;
+
+INSERT INTO public.dod_instances (username, db_name, category, creation_date, db_type, version, host)
+SELECT 'user' || n,
+       'bench' || n,
+       CASE WHEN n % 2 = 0 THEN 'TEST' ELSE 'PROD' END,
+       now(),
+       CASE WHEN n % 3 = 0 THEN 'PG' ELSE 'MYSQL' END,
+       '5.6.' || n % 20,
+       'benchhost' || n % 500 || CASE WHEN n % 10 = 0 THEN ',benchhost' || (n + 1) % 500 ELSE '' END
+FROM generate_series(1, :instances) n;
+
+INSERT INTO public.attribute (instance_id, name, value)
+SELECT i.id, a.name, a.value
+FROM public.dod_instances i,
+     (VALUES ('port', '5500'), ('buffer_pool_size', '1G'), ('max_connections', '100'),
+             ('slow_query_log', 'on'), ('innodb_file_per_table', 'on')) a(name, value)
+WHERE i.db_name LIKE 'bench%';
+
+INSERT INTO public.volume (instance_id, file_mode, owner, "group", server, mount_options, mounting_path)
+SELECT i.id, '0755', 'TSM', 'ownergroup', 'NAS-server', 'rw,bg,hard', '/MNT/' || v
+FROM public.dod_instances i, (VALUES ('data'), ('bin'), ('logs')) volumes(v)
+WHERE i.db_name LIKE 'bench%';
+
+ANALYZE public.dod_instances;
+ANALYZE public.attribute;
+ANALYZE public.volume;
+
+REFRESH MATERIALIZED VIEW public.metadata_mv;
+ANALYZE public.metadata_mv;
+
+-- Definition of the view previous to the 0.82 update
+CREATE VIEW api.metadata_before AS
+SELECT 
+    id, 
+    username, 
+    db_name, 
+    category "class", 
+    db_type, 
+    version, 
+    string_to_array(dod_instances.host::text, ','::text) AS hosts, 
+    api.get_attributes(id) attributes,
+    public.get_attribute('port', id) port, 
+    get_volumes volumes, 
+    d.*
+FROM public.dod_instances, public.get_volumes(id), public.get_directories(db_name, db_type, version, public.get_attribute('port', id)) d;
+
+\echo '==> Whole view, before'
+EXPLAIN ANALYZE SELECT * FROM api.metadata_before;
+\echo '==> Whole view, after'
+EXPLAIN ANALYZE SELECT * FROM api.metadata;
+\echo '==> Whole view, materialized'
+EXPLAIN ANALYZE SELECT * FROM api.materialized_metadata;
+
+\echo '==> Instances of a host, before'
+EXPLAIN ANALYZE SELECT * FROM api.metadata_before WHERE hosts @> '{benchhost42}';
+\echo '==> Instances of a host, after'
+EXPLAIN ANALYZE SELECT * FROM api.metadata WHERE hosts @> '{benchhost42}';
+\echo '==> Instances of a host, materialized'
+EXPLAIN ANALYZE SELECT * FROM api.materialized_metadata WHERE hosts @> '{benchhost42}';
+
+\echo '==> Single instance, before'
+EXPLAIN ANALYZE SELECT * FROM api.metadata_before WHERE db_name = 'bench4242';
+\echo '==> Single instance, after'
+EXPLAIN ANALYZE SELECT * FROM api.metadata WHERE db_name = 'bench4242';
+\echo '==> Single instance, materialized'
+EXPLAIN ANALYZE SELECT * FROM api.materialized_metadata WHERE db_name = 'bench4242';
+
+ROLLBACK;
@@ -0,0 +1,24 @@
+-- Update to add the function used to create an instance, with its volumes
+-- and attributes, in a single transaction.
+-- Create instance function
+-- Inserts an instance along with its volumes and attributes in a single
+-- transaction and returns the id of the new instance. The instance fields
+-- are the columns of the api.instance view.
+CREATE OR REPLACE FUNCTION api.create_instance(instance JSON, volumes JSON DEFAULT '[]', attributes JSON DEFAULT '{}')
+RETURNS INTEGER AS $$
+DECLARE
+  inst_id INTEGER;
+  columns TEXT;
+BEGIN
+  SELECT string_agg(quote_ident(k.name), ',') FROM json_object_keys(instance) AS k(name) INTO columns;
+  EXECUTE format('INSERT INTO api.instance (%s) SELECT %s FROM json_populate_record(NULL::api.instance, $1) RETURNING id', columns, columns)
+    USING instance INTO inst_id;
+  INSERT INTO public.volume (instance_id, file_mode, owner, "group", server, mount_options, mounting_path)
+    SELECT inst_id, v.file_mode, v.owner, v."group", v.server, v.mount_options, v.mounting_path
+    FROM json_populate_recordset(NULL::public.volume, volumes) v;
+  INSERT INTO public.attribute (instance_id, name, value)
+    SELECT inst_id, a.key, a.value
+    FROM json_each_text(attributes) a;
+  RETURN inst_id;
+END
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,57 @@
+-- Update to add the function used to set attributes of many instances in a
+-- single transaction. It requires PostgreSQL 9.5 (ON CONFLICT).
+-- Set attributes function
+-- Sets a list of attributes of any number of instances in a single
+-- transaction. Every attribute is an object with "instance", "name" and
+-- "value" keys: it is created if it does not exist and updated otherwise.
+-- If the same attribute is given more than once, the last value is set.
+-- Returns the list of attributes with the status of each one: 201 if it has
+-- been created, 200 if it has been updated (or it already had the value),
+-- 400 if the name or the value are missing or too long and 404 if the
+-- instance does not exist. The invalid attributes do not abort the rest.
+CREATE OR REPLACE FUNCTION api.set_attributes(attributes JSON)
+RETURNS JSON AS $$
+DECLARE
+  result JSON;
+BEGIN
+  -- The instances are read through a foreign table, which can not be locked
+  -- with FOR UPDATE, so the concurrent changes of their attributes are
+  -- serialized with advisory locks on their ids, taken in order
+  PERFORM pg_advisory_xact_lock(hashtext('public.dod_instances'), I.id)
+    FROM (SELECT DISTINCT I.id FROM public.dod_instances I
+          WHERE I.db_name IN (SELECT e->>'instance' FROM json_array_elements(attributes) e)
+          ORDER BY I.id) I;
+
+  WITH items AS (
+    SELECT e.position, e.item->>'instance' instance, e.item->>'name' name, e.item->>'value' value, I.id instance_id,
+           -- Sizes of the name and value columns of public.attribute
+           coalesce(length(e.item->>'name') <= 32 AND length(e.item->>'value') <= 250, FALSE) valid
+    FROM json_array_elements(attributes) WITH ORDINALITY AS e(item, position)
+    LEFT JOIN public.dod_instances I ON I.db_name = e.item->>'instance'
+  ),
+  last_items AS (
+    SELECT DISTINCT ON (instance_id, name) *,
+           NOT EXISTS (SELECT 1 FROM public.attribute A WHERE A.instance_id = items.instance_id AND A.name = items.name) AS created
+    FROM items
+    WHERE instance_id IS NOT NULL AND valid
+    ORDER BY instance_id, name, position DESC
+  ),
+  upserted AS (
+    INSERT INTO public.attribute AS A (instance_id, name, value)
+      SELECT L.instance_id, L.name, L.value
+      FROM last_items L
+      ON CONFLICT (instance_id, name) DO UPDATE
+      SET value = EXCLUDED.value
+      WHERE A.value IS DISTINCT FROM EXCLUDED.value
+  )
+  SELECT json_agg(json_build_object('instance', items.instance, 'name', items.name, 'value', items.value,
+                    'status', CASE WHEN NOT items.valid THEN 400
+                                   WHEN items.instance_id IS NULL THEN 404
+                                   WHEN L.created THEN 201
+                                   ELSE 200 END)
+                  ORDER BY items.position)
+    FROM items LEFT JOIN last_items L ON L.instance_id = items.instance_id AND L.name = items.name
+    INTO result;
+  RETURN result;
+END
+$$ LANGUAGE plpgsql;
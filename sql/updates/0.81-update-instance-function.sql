@@ -0,0 +1,78 @@
+-- Update to add the function used to update an instance, with its volumes
+-- and attributes, in a single transaction.
+-- Update instance function
+-- Applies the changes of an instance, its volumes and its attributes in a
+-- single transaction and returns the id of the instance, or NULL if it does
+-- not exist. Only the given arguments are changed:
+--   * instance: fields of the api.instance view to update
+--   * volumes: the new list of volumes, matched by mounting path
+--   * attributes: the new set of attributes, matched by name
+-- Only the rows which are different are written.
+CREATE OR REPLACE FUNCTION api.update_instance(inst_name VARCHAR, instance JSON DEFAULT NULL, volumes JSON DEFAULT NULL, attributes JSON DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+  inst_id INTEGER;
+  old_values TEXT;
+  new_values TEXT;
+  assignments TEXT;
+BEGIN
+  SELECT id INTO inst_id FROM public.dod_instances WHERE db_name = inst_name;
+  IF inst_id IS NULL THEN
+    RETURN NULL;
+  END IF;
+  -- The instances are read through a foreign table, which can not be locked
+  -- with FOR UPDATE, so the concurrent changes of an instance are serialized
+  -- with an advisory lock on its id. It may have been renamed or deleted
+  -- while waiting for it.
+  PERFORM pg_advisory_xact_lock(hashtext('public.dod_instances'), inst_id);
+  IF NOT EXISTS (SELECT 1 FROM public.dod_instances WHERE id = inst_id AND db_name = inst_name) THEN
+    RETURN NULL;
+  END IF;
+
+  IF volumes IS NOT NULL THEN
+    DELETE FROM public.volume V
+      WHERE V.instance_id = inst_id
+      AND NOT EXISTS (SELECT 1 FROM json_populate_recordset(NULL::public.volume, volumes) n
+                      WHERE n.mounting_path = V.mounting_path);
+    UPDATE public.volume V
+      SET file_mode = n.file_mode, owner = n.owner, "group" = n."group", server = n.server, mount_options = n.mount_options
+      FROM json_populate_recordset(NULL::public.volume, volumes) n
+      WHERE V.instance_id = inst_id AND V.mounting_path = n.mounting_path
+      AND (V.file_mode, V.owner, V."group", V.server, V.mount_options) IS DISTINCT FROM
+          (n.file_mode, n.owner, n."group", n.server, n.mount_options);
+    INSERT INTO public.volume (instance_id, file_mode, owner, "group", server, mount_options, mounting_path)
+      SELECT inst_id, n.file_mode, n.owner, n."group", n.server, n.mount_options, n.mounting_path
+      FROM json_populate_recordset(NULL::public.volume, volumes) n
+      WHERE NOT EXISTS (SELECT 1 FROM public.volume V
+                        WHERE V.instance_id = inst_id AND V.mounting_path = n.mounting_path);
+  END IF;
+
+  IF attributes IS NOT NULL THEN
+    DELETE FROM public.attribute A
+      WHERE A.instance_id = inst_id
+      AND NOT EXISTS (SELECT 1 FROM json_each_text(attributes) n WHERE n.key = A.name);
+    UPDATE public.attribute A
+      SET value = n.value
+      FROM json_each_text(attributes) n
+      WHERE A.instance_id = inst_id AND A.name = n.key AND A.value IS DISTINCT FROM n.value;
+    INSERT INTO public.attribute (instance_id, name, value)
+      SELECT inst_id, n.key, n.value
+      FROM json_each_text(attributes) n
+      WHERE NOT EXISTS (SELECT 1 FROM public.attribute A WHERE A.instance_id = inst_id AND A.name = n.key);
+  END IF;
+
+  IF instance IS NOT NULL THEN
+    SELECT string_agg(format('%I = r.%I', k.name, k.name), ','),
+           string_agg(format('I.%I', k.name), ','),
+           string_agg(format('r.%I', k.name), ',')
+      FROM json_object_keys(instance) AS k(name) INTO assignments, old_values, new_values;
+    IF assignments IS NOT NULL THEN
+      EXECUTE format('UPDATE api.instance I SET %s FROM json_populate_record(NULL::api.instance, $1) r WHERE I.id = $2 AND ROW(%s) IS DISTINCT FROM ROW(%s)',
+                     assignments, old_values, new_values)
+        USING instance, inst_id;
+    END IF;
+  END IF;
+
+  RETURN inst_id;
+END
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,57 @@
+-- Update to replace the function calls done for every row of the metadata view
+-- (get_attributes, get_attribute, get_volumes and get_directories) by joins,
+-- so the planner can execute the whole view as a single set-based query.
+-- The directories are computed inline as in public.get_directories and, as
+-- before, instances of other types are not part of the view.
+--
+-- The attributes are looked up through the index of the
+-- UNIQUE (instance_id, name) constraint of public.attribute. The volumes
+-- lacked an index on instance_id, which is added here.
+CREATE INDEX volume_instance_id_idx ON public.volume (instance_id);
+
+-- Metadata View
+CREATE OR REPLACE VIEW api.metadata AS
+SELECT 
+    i.id, 
+    i.username, 
+    i.db_name, 
+    i.category "class", 
+    i.db_type, 
+    i.version, 
+    string_to_array(i.host::text, ','::text) AS hosts, 
+    a.attributes,
+    a.port, 
+    v.volumes, 
+    d.*
+FROM public.dod_instances i
+CROSS JOIN LATERAL (
+    SELECT json_object_agg(name, value) attributes,
+           (max(value) FILTER (WHERE name = 'port'))::VARCHAR port
+    FROM public.attribute
+    WHERE instance_id = i.id) a
+CROSS JOIN LATERAL (
+    SELECT COALESCE(array_agg(row_to_json(volume) ORDER BY volume.id), '{}') volumes
+    FROM public.volume
+    WHERE instance_id = i.id) v
+CROSS JOIN LATERAL (
+    SELECT
+      (CASE WHEN i.db_type = 'MYSQL' THEN '/usr/local/mysql/mysql-' || i.version
+            WHEN i.db_type = 'PG' THEN '/usr/local/pgsql/pgsql-' || i.version
+            WHEN i.db_type = 'InfluxDB' THEN '/usr/local/influxdb/influxdb-' || i.version
+            ELSE '/ORA/dbs01/oracle/product/rdbms' END)::VARCHAR basedir,
+      (CASE WHEN i.db_type = 'MYSQL' THEN '/usr/local/mysql/mysql-' || i.version || '/bin'
+            WHEN i.db_type = 'PG' THEN '/usr/local/pgsql/pgsql-' || i.version || '/bin'
+            WHEN i.db_type = 'InfluxDB' THEN '/usr/local/influxdb/influxdb-' || i.version || '/bin'
+            ELSE '/ORA/dbs01/oracle/product/rdbms' END)::VARCHAR bindir,
+      (CASE WHEN i.db_type = 'MYSQL' THEN '/ORA/dbs03/' || upper(i.db_name) || '/mysql'
+            WHEN i.db_type = 'PG' THEN '/ORA/dbs03/' || upper(i.db_name) || '/data'
+            ELSE '/ORA/dbs03/' || upper(i.db_name) END)::VARCHAR datadir,
+      (CASE WHEN i.db_type = 'MYSQL' THEN '/ORA/dbs02/' || upper(i.db_name) || '/mysql'
+            WHEN i.db_type = 'PG' THEN '/ORA/dbs02/' || upper(i.db_name) || '/pg_xlog'
+            ELSE '/ORA/dbs02/' || upper(i.db_name) END)::VARCHAR logdir,
+      (CASE WHEN i.db_type = 'MYSQL' THEN '/var/lib/mysql/mysql.sock.' || lower(i.db_name) || '.' || a.port
+            WHEN i.db_type IN ('PG', 'InfluxDB') THEN '/var/lib/pgsql/'
+            ELSE '/ORA/dbs01/oracle/product/rdbms/network/admin' END)::VARCHAR socket
+    -- Like public.get_directories, there are no directories (nor metadata)
+    -- for other types of instances
+    WHERE i.db_type IN ('MYSQL', 'PG', 'InfluxDB', 'ORACLE', 'ORA')) d;
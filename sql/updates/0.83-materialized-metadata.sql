@@ -0,0 +1,97 @@
+-- Update to serve the metadata and rundeck_instances views from materialized
+-- views, so the API reads do not go through the Oracle foreign tables.
+--
+-- The changes done to the local tables are recorded by statement triggers,
+-- which only take a new version number from a sequence. The materialized views are then
+-- refreshed concurrently (without blocking their readers) by the
+-- refresh_metadata function, called periodically by the API. As the changes
+-- done directly in Oracle can not be detected, the views are also refreshed
+-- if they are older than the given maximum age.
+
+-- Materialized views
+CREATE MATERIALIZED VIEW public.metadata_mv AS
+SELECT * FROM api.metadata;
+CREATE UNIQUE INDEX metadata_mv_id_idx ON public.metadata_mv (id);
+CREATE INDEX metadata_mv_db_name_idx ON public.metadata_mv (db_name);
+
+-- The production schema allows more than one functional alias per instance,
+-- so a single row (with the first alias) is kept for every instance, as
+-- required by the unique index of the concurrent refresh
+CREATE MATERIALIZED VIEW public.rundeck_instances_mv AS
+SELECT DISTINCT ON (db_name) * FROM api.rundeck_instances
+ORDER BY db_name, hostname;
+CREATE UNIQUE INDEX rundeck_instances_mv_db_name_idx ON public.rundeck_instances_mv (db_name);
+
+-- Views used by PostgREST, which does not expose materialized views
+CREATE OR REPLACE VIEW api.materialized_metadata AS
+SELECT * FROM public.metadata_mv;
+
+CREATE OR REPLACE VIEW api.materialized_rundeck_instances AS
+SELECT * FROM public.rundeck_instances_mv;
+
+-- Version of the data of the materialized views
+-- Every change takes a new value of the metadata_version sequence, which
+-- does not lock any row, and refreshed_version is the value included in the
+-- last refresh. The transactions changing the tables hold a shared advisory
+-- lock until they finish, so refresh_metadata can wait for them before
+-- reading the sequence.
+CREATE SEQUENCE public.metadata_version;
+CREATE TABLE public.metadata_refresh (
+    refreshed_version bigint NOT NULL,
+    refreshed timestamp with time zone NOT NULL
+);
+INSERT INTO public.metadata_refresh (refreshed_version, refreshed)
+VALUES (0, now());
+
+-- Metadata changed trigger function
+CREATE OR REPLACE FUNCTION public.metadata_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_advisory_xact_lock_shared(hashtext('public.metadata_version'));
+  PERFORM nextval('public.metadata_version');
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER metadata_changed AFTER INSERT OR UPDATE OR DELETE
+ON fdw.dod_instances FOR EACH STATEMENT EXECUTE PROCEDURE public.metadata_changed();
+CREATE TRIGGER metadata_changed AFTER INSERT OR UPDATE OR DELETE
+ON public.attribute FOR EACH STATEMENT EXECUTE PROCEDURE public.metadata_changed();
+CREATE TRIGGER metadata_changed AFTER INSERT OR UPDATE OR DELETE
+ON public.volume FOR EACH STATEMENT EXECUTE PROCEDURE public.metadata_changed();
+CREATE TRIGGER metadata_changed AFTER INSERT OR UPDATE OR DELETE
+ON public.functional_aliases FOR EACH STATEMENT EXECUTE PROCEDURE public.metadata_changed();
+
+-- Refresh metadata function
+-- Refreshes the materialized views if the tables have changed since the last
+-- refresh or if it is older than max_age seconds (0 forces the refresh).
+-- Returns true if the views have been refreshed, and false if they were up
+-- to date. Concurrent calls wait for the running refresh, which usually
+-- leaves the views up to date for them.
+CREATE OR REPLACE FUNCTION api.refresh_metadata(max_age INTEGER)
+RETURNS BOOLEAN AS $$
+DECLARE
+  current_version BIGINT;
+  outdated BOOLEAN;
+BEGIN
+  PERFORM pg_advisory_xact_lock(hashtext('api.refresh_metadata'));
+  -- The values of the sequence taken by the transactions still changing the
+  -- tables would be recorded as refreshed without their changes, so they
+  -- are waited for. The lock is released at once, not to block the writers
+  -- during the refresh.
+  PERFORM pg_advisory_lock(hashtext('public.metadata_version'));
+  SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM public.metadata_version
+  INTO current_version;
+  PERFORM pg_advisory_unlock(hashtext('public.metadata_version'));
+  SELECT current_version > refreshed_version OR refreshed <= now() - max_age * interval '1 second'
+  FROM public.metadata_refresh INTO outdated;
+  IF NOT outdated THEN
+    RETURN FALSE;
+  END IF;
+  -- The changes committed before this point are included in the refresh
+  REFRESH MATERIALIZED VIEW CONCURRENTLY public.metadata_mv;
+  REFRESH MATERIALIZED VIEW CONCURRENTLY public.rundeck_instances_mv;
+  UPDATE public.metadata_refresh SET refreshed_version = current_version, refreshed = now();
+  RETURN TRUE;
+END
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,4 @@
+-- Update to index the hosts of the materialized metadata view, so the
+-- metadata of the instances of a host (hosts @> '{name}', as requested by
+-- the API) is found through the index instead of scanning the whole view.
+CREATE INDEX metadata_mv_hosts_idx ON public.metadata_mv USING gin (hosts);
@@ -0,0 +1,36 @@
+-- Update to add the function used to assign a dns_name of the pool of
+-- functional aliases in a single statement. It requires PostgreSQL 9.5
+-- (SKIP LOCKED).
+
+-- Free dns_names of the pool, in the order they are assigned
+CREATE INDEX functional_aliases_free_idx ON public.functional_aliases (dns_name)
+  WHERE db_name IS NULL AND alias IS NULL;
+
+-- Claim functional alias function
+-- Assigns the first free dns_name of the pool to an instance and its alias
+-- and returns it, or NULL if the instance already has an alias or there is
+-- none available. The free dns_names being claimed by concurrent calls are
+-- skipped instead of waited for, so the calls do not serialize on the same
+-- row. Only the concurrent calls for the same instance wait for each other,
+-- as there is no unique constraint on db_name.
+CREATE OR REPLACE FUNCTION api.claim_functional_alias(db_name VARCHAR, alias VARCHAR)
+RETURNS VARCHAR AS $$
+DECLARE
+  claimed VARCHAR;
+BEGIN
+  PERFORM pg_advisory_xact_lock(hashtext('public.functional_aliases'), hashtext(claim_functional_alias.db_name));
+  IF EXISTS (SELECT 1 FROM public.functional_aliases F WHERE F.db_name = claim_functional_alias.db_name) THEN
+    RETURN NULL;
+  END IF;
+  UPDATE public.functional_aliases F
+    SET db_name = claim_functional_alias.db_name, alias = claim_functional_alias.alias
+    WHERE F.dns_name = (
+      SELECT P.dns_name FROM public.functional_aliases P
+        WHERE P.db_name IS NULL AND P.alias IS NULL
+        ORDER BY P.dns_name
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED)
+    RETURNING F.dns_name INTO claimed;
+  RETURN claimed;
+END
+$$ LANGUAGE plpgsql;
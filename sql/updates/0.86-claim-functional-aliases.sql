@@ -0,0 +1,69 @@
+-- Update to add the function used to assign the dns_names of the pool of
+-- functional aliases to many instances in a single transaction. It requires
+-- PostgreSQL 9.5 (SKIP LOCKED).
+
+-- Claim functional aliases function
+-- Assigns a free dns_name of the pool to every object of a list with
+-- "db_name" and "alias" keys, in the order they are given. Returns the list
+-- with the dns_name and the status of each one: 201 if it has been assigned,
+-- 400 if the db_name or the alias are missing or longer than their columns,
+-- 409 if the instance already has an alias (or it is repeated in the list)
+-- and 503 if there are no free dns_names left. The invalid items do not abort
+-- the rest. The free dns_names being claimed by concurrent calls are
+-- skipped, and the concurrent calls for the same instances wait for each
+-- other, like in claim_functional_alias.
+CREATE OR REPLACE FUNCTION api.claim_functional_aliases(aliases JSON)
+RETURNS JSON AS $$
+DECLARE
+  result JSON;
+BEGIN
+  PERFORM pg_advisory_xact_lock(hashtext('public.functional_aliases'), hashtext(db_name))
+    FROM (SELECT DISTINCT e.item->>'db_name' db_name
+          FROM json_array_elements(aliases) AS e(item)
+          WHERE e.item->>'db_name' IS NOT NULL
+          ORDER BY 1) names;
+  WITH items AS (
+    SELECT e.position, e.item->>'db_name' db_name, e.item->>'alias' alias,
+           coalesce(length(e.item->>'db_name') <= 8 AND length(e.item->>'alias') <= 256, FALSE) valid
+    FROM json_array_elements(aliases) WITH ORDINALITY AS e(item, position)
+  ),
+  valid AS (
+    SELECT row_number() OVER (ORDER BY position) n, *
+    FROM (
+      SELECT DISTINCT ON (I.db_name) I.position, I.db_name, I.alias
+      FROM items I
+      WHERE I.valid
+        AND NOT EXISTS (SELECT 1 FROM public.functional_aliases F WHERE F.db_name = I.db_name)
+      ORDER BY I.db_name, I.position
+    ) first_items
+  ),
+  free AS (
+    SELECT row_number() OVER (ORDER BY dns_name) n, dns_name
+    FROM (
+      SELECT P.dns_name FROM public.functional_aliases P
+        WHERE P.db_name IS NULL AND P.alias IS NULL
+        ORDER BY P.dns_name
+        LIMIT (SELECT count(*) FROM valid)
+        FOR UPDATE SKIP LOCKED
+    ) free_rows
+  ),
+  claimed AS (
+    UPDATE public.functional_aliases F
+      SET db_name = V.db_name, alias = V.alias
+      FROM valid V JOIN free ON free.n = V.n
+      WHERE F.dns_name = free.dns_name
+      RETURNING V.position, F.dns_name
+  )
+  SELECT json_agg(json_build_object('db_name', I.db_name, 'alias', I.alias, 'dns_name', C.dns_name,
+                    'status', CASE WHEN C.dns_name IS NOT NULL THEN 201
+                                   WHEN NOT I.valid THEN 400
+                                   WHEN V.position IS NULL THEN 409
+                                   ELSE 503 END)
+                  ORDER BY I.position)
+    FROM items I
+    LEFT JOIN valid V ON V.position = I.position
+    LEFT JOIN claimed C ON C.position = I.position
+    INTO result;
+  RETURN result;
+END
+$$ LANGUAGE plpgsql;
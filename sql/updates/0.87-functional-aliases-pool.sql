@@ -0,0 +1,45 @@
+-- Update to add the view with the number of free and used dns_names of the
+-- pool of functional aliases.
+
+-- Number of dns_names of the pool
+-- It only changes when dns_names are added to or removed from the pool, not
+-- when they are claimed or released, so keeping it in a single row does not
+-- serialize the claims.
+CREATE TABLE public.functional_aliases_total (
+    total bigint NOT NULL
+);
+INSERT INTO public.functional_aliases_total (total)
+SELECT count(*) FROM public.functional_aliases;
+
+-- Functional aliases total trigger function
+CREATE OR REPLACE FUNCTION public.functional_aliases_counted()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    UPDATE public.functional_aliases_total SET total = total + 1;
+  ELSIF TG_OP = 'DELETE' THEN
+    UPDATE public.functional_aliases_total SET total = total - 1;
+  ELSE
+    UPDATE public.functional_aliases_total SET total = 0;
+  END IF;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER functional_aliases_counted AFTER INSERT OR DELETE
+ON public.functional_aliases FOR EACH ROW EXECUTE PROCEDURE public.functional_aliases_counted();
+CREATE TRIGGER functional_aliases_truncated AFTER TRUNCATE
+ON public.functional_aliases FOR EACH STATEMENT EXECUTE PROCEDURE public.functional_aliases_counted();
+
+-- Functional aliases pool view
+-- The free dns_names are counted with an index-only scan of their partial
+-- index, which gets smaller as the pool runs out, and the total is read from
+-- functional_aliases_total instead of scanning the table. OFFSET 0 keeps the
+-- count from being computed twice.
+CREATE OR REPLACE VIEW api.functional_aliases_pool AS
+SELECT free, total - free used, total
+FROM (
+  SELECT (SELECT count(*) FROM public.functional_aliases WHERE db_name IS NULL AND alias IS NULL) free,
+         (SELECT total FROM public.functional_aliases_total) total
+  OFFSET 0
+) counts;
@@ -0,0 +1,4 @@
+-- Update to index the aliases of the functional aliases, which are looked up
+-- to find their instance (the dns_names are already indexed by the primary
+-- key).
+CREATE INDEX functional_aliases_alias_idx ON public.functional_aliases (alias);